@@ -0,0 +1,107 @@
+"""Sending a contact list from a background thread.
+
+For callers without an event loop of their own, such as the Tk desktop
+app. The thread runs an asyncio loop with the same pooled, rate-limited
+delivery path as web campaigns: a few authenticated sessions (warm ones
+from a SessionCache when available) shared by the whole list. Results
+are posted to a queue.Queue that the caller drains at its own pace, so
+nothing touches the caller's thread.
+
+    sender = BackgroundSender(contact_list, provider, sender_email, password,
+                              subject_template, body_template, attachments)
+    sender.start()
+    ... sender.events.get_nowait() -> ("result", DeliveryResult) | ("done", error) ...
+    sender.cancel()
+"""
+import asyncio
+import queue
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from backend.attachments import EncodedAttachment
+from backend.contact_store import ContactList
+from backend.messages import MessageBuilder, message_scheduler
+from backend.providers import Provider
+from backend.smtp_pool import DeliveryResult, SessionCache, SMTPConnectionPool
+from backend.templating import Template
+
+RESULT = 'result'
+DONE = 'done'
+
+
+class BackgroundSender(threading.Thread):
+    def __init__(
+        self,
+        contact_list: ContactList,
+        provider: Provider,
+        sender_email: str,
+        sender_password: str,
+        subject_template: Template,
+        body_template: Template,
+        attachments: List[EncodedAttachment],
+        sessions: Optional[SessionCache] = None,
+        pool_size: Optional[int] = None
+    ):
+        super().__init__(name="background-sender", daemon=True)
+        self.contact_list = contact_list
+        self.provider = provider
+        self.sender_email = sender_email
+        self.sender_password = sender_password
+        self.builder = MessageBuilder(sender_email, subject_template, body_template, attachments)
+        self.sessions = sessions
+        # A one-message send shouldn't open a full pool
+        self.pool_size = max(1, min(pool_size or provider.pool_size, contact_list.total))
+        self.events: "queue.Queue[Tuple]" = queue.Queue()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """Stop after the messages already being sent."""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def run(self):
+        error = None
+        try:
+            asyncio.run(self._send())
+        except Exception as e:
+            error = str(e)
+        self.events.put((DONE, error))
+
+    def _items(self) -> Iterator[Tuple[int, Dict]]:
+        for row, contact in self.contact_list.iter_rows(lambda row: True):
+            email = contact.get('email')
+            if isinstance(email, str) and email.strip():
+                yield row, contact
+            else:
+                self.events.put((RESULT, DeliveryResult(email=str(email or ''), ok=False, error="Missing email address", tag=row)))
+
+    async def _send(self):
+        pool = SMTPConnectionPool(
+            self.provider.pool_config(self.pool_size),
+            self.sender_email,
+            self.sender_password,
+            sessions=self.sessions
+        )
+        await pool.start()
+        try:
+            scheduler = message_scheduler(
+                self._items(),
+                self.builder,
+                stop=self._cancelled.is_set,
+                provider_rate=self.provider.rate,
+                blocking=True
+            )
+
+            async def checkpoint():
+                return not self._cancelled.is_set()
+
+            await pool.send_all(
+                scheduler,
+                on_result=lambda result: self.events.put((RESULT, result)),
+                checkpoint=checkpoint
+            )
+        finally:
+            await pool.close()
@@ -0,0 +1,146 @@
+"""Header-to-field mapping for uploaded contact files.
+
+A file's header is resolved once to the canonical contact fields (name,
+email, designation, linkedin) and the result is applied to every row as
+a plain column projection.
+
+Resolution rules, in order:
+1. Explicit overrides ({"Header": "field"}) always win.
+2. Exact synonym matches on the normalized header ("LinkedIn ID",
+   "linkedin_id" and "LinkedIn-ID" all normalize to "linkedin id").
+   When several columns match the same field, the earlier synonym wins,
+   then the leftmost column.
+3. Keyword matches ("Work Email" contains "email") for fields that are
+   still unassigned. Only fields whose keyword is unambiguous have
+   keywords; "Company Name" never becomes `name`.
+4. Every other column keeps its original header as the key, suffixed
+   with " (2)", " (3)"... if that key is already taken.
+"""
+import re
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence
+
+CANONICAL_FIELDS = ('name', 'email', 'designation', 'linkedin')
+
+DEFAULT_SYNONYMS = {
+    'name': ['name', 'full name', 'fullname', 'contact name'],
+    'email': ['email', 'e mail', 'email address', 'email id', 'mail'],
+    'designation': ['designation', 'title', 'job title', 'position', 'role'],
+    'linkedin': ['linkedin', 'linkedin id', 'linkedin url', 'linkedin profile', 'linkedin profile url'],
+}
+
+DEFAULT_KEYWORDS = {
+    'email': ['email', 'e mail'],
+    'linkedin': ['linkedin'],
+}
+
+_SEPARATORS_RE = re.compile(r"[\s_\-.:/]+")
+
+
+def normalize_header(header) -> str:
+    return _SEPARATORS_RE.sub(' ', str(header)).strip().lower()
+
+
+class ColumnMapping:
+    """The resolved mapping for one header."""
+
+    def __init__(self, header: Sequence, keys: Sequence[Optional[str]]):
+        self.header = list(header)
+        self.keys = list(keys)
+        self._pairs = [(index, key) for index, key in enumerate(keys) if key is not None]
+        self._canonical = [key for key in self.keys if key in CANONICAL_FIELDS]
+
+    def as_dict(self) -> Dict[str, str]:
+        return {
+            str(source): key
+            for source, key in zip(self.header, self.keys)
+            if key is not None
+        }
+
+    def _clean(self, row: Dict) -> Dict:
+        for key in self._canonical:
+            value = row.get(key)
+            if value.__class__ is str:
+                row[key] = value.strip()
+        return row
+
+    def project(self, values: Sequence) -> Dict:
+        """Map a positional row (CSV/Excel) to a contact dict."""
+        size = len(values)
+        return self._clean({key: values[index] for index, key in self._pairs if index < size})
+
+    def project_dict(self, row: Mapping) -> Dict:
+        """Map a row keyed by the original header (JSON) to a contact dict."""
+        header = self.header
+        return self._clean({key: row[header[index]] for index, key in self._pairs if header[index] in row})
+
+
+class ColumnMapper:
+    def __init__(
+        self,
+        synonyms: Optional[Mapping[str, Iterable[str]]] = None,
+        keywords: Optional[Mapping[str, Iterable[str]]] = None
+    ):
+        synonyms = synonyms if synonyms is not None else DEFAULT_SYNONYMS
+        keywords = keywords if keywords is not None else DEFAULT_KEYWORDS
+        # normalized synonym -> (field, rank); lower rank wins
+        self._exact: Dict[str, tuple] = {}
+        for field, names in synonyms.items():
+            for rank, name in enumerate(names):
+                self._exact.setdefault(normalize_header(name), (field, rank))
+        self._keywords = [
+            (field, normalize_header(word))
+            for field, words in keywords.items()
+            for word in words
+        ]
+
+    def resolve(self, header: Sequence, overrides: Optional[Mapping[str, str]] = None) -> ColumnMapping:
+        overrides = overrides or {}
+        keys: List[Optional[str]] = [None] * len(header)
+        assigned: Dict[str, int] = {}
+
+        # 1. explicit overrides
+        for index, column in enumerate(header):
+            if column is not None and str(column) in overrides:
+                field = overrides[str(column)]
+                if field and field not in assigned:
+                    keys[index] = field
+                    assigned[field] = index
+
+        normalized = [normalize_header(column) if column is not None else None for column in header]
+
+        # 2. exact synonyms, best rank then leftmost
+        candidates = sorted(
+            (self._exact[norm][1], index, self._exact[norm][0])
+            for index, norm in enumerate(normalized)
+            if norm in self._exact and keys[index] is None
+        )
+        for _, index, field in candidates:
+            if field not in assigned and keys[index] is None:
+                keys[index] = field
+                assigned[field] = index
+
+        # 3. keywords for fields still unassigned, leftmost first
+        for index, norm in enumerate(normalized):
+            if norm is None or keys[index] is not None:
+                continue
+            padded = f" {norm} "
+            for field, word in self._keywords:
+                if field not in assigned and f" {word} " in padded:
+                    keys[index] = field
+                    assigned[field] = index
+                    break
+
+        # 4. everything else keeps its header, de-duplicated
+        used = set(assigned)
+        for index, column in enumerate(header):
+            if keys[index] is not None or column is None:
+                continue
+            key = str(column)
+            suffix = 2
+            while key in used:
+                key = f"{column} ({suffix})"
+                suffix += 1
+            keys[index] = key
+            used.add(key)
+
+        return ColumnMapping(header, keys)
@@ -0,0 +1,141 @@
+"""Response compression negotiated from Accept-Encoding.
+
+Contact pages, exports and failure reports are highly repetitive JSON
+that compresses 5-10x. Brotli is preferred when the client accepts it
+and the brotli package is installed, gzip otherwise.
+
+Unlike Starlette's GZipMiddleware this leaves Server-Sent Events alone
+(buffering inside the compressor would hold back progress updates) and
+flushes the compressor after every chunk of a streamed response, so an
+NDJSON export still arrives batch by batch. Large single-shot bodies are
+compressed in a worker thread to keep the event loop responsive.
+"""
+import gzip
+import zlib
+from typing import Optional
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this go out as they are
+MINIMUM_SIZE = 1024
+# Single-shot bodies at least this big are compressed off the event loop
+THREAD_SIZE = 256 * 1024
+GZIP_LEVEL = 6
+# Brotli's higher qualities are far slower for little gain on JSON
+BROTLI_QUALITY = 4
+
+_SKIPPED_TYPES = ('text/event-stream', 'image/', 'application/zip', 'application/gzip')
+
+
+def _accepted(accept_encoding: str) -> Optional[str]:
+    accepted = set()
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        q = params.strip()
+        if q.startswith('q=') and q[2:].strip() in ('0', '0.0', '0.00', '0.000'):
+            continue
+        accepted.add(coding.strip().lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+class _Compressor:
+    def __init__(self, coding: str):
+        self.coding = coding
+        if coding == 'br':
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data: bytes) -> bytes:
+        # Flushed so the client can decode everything sent so far
+        if self.coding == 'br':
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.coding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+def compress(coding: str, data: bytes) -> bytes:
+    if coding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        coding = _accepted(Headers(scope=scope).get('accept-encoding', ''))
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+            if message['type'] == 'http.response.start':
+                # Held back until the first body chunk shows whether to compress
+                start = message
+                return
+            if message['type'] != 'http.response.body' or passthrough:
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if compressor is None:
+                headers = MutableHeaders(raw=start['headers'])
+                content_type = headers.get('content-type', '')
+                if (
+                    'content-encoding' in headers
+                    or content_type.startswith(_SKIPPED_TYPES)
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                headers['Content-Encoding'] = coding
+                headers.add_vary_header('Accept-Encoding')
+                start['headers'] = headers.raw
+                if not more_body:
+                    # The whole body at once: compress it in one go
+                    if len(body) >= THREAD_SIZE:
+                        body = await anyio.to_thread.run_sync(compress, coding, body)
+                    else:
+                        body = compress(coding, body)
+                    headers['Content-Length'] = str(len(body))
+                    await send(start)
+                    await send({'type': 'http.response.body', 'body': body})
+                    return
+                del headers['Content-Length']
+                compressor = _Compressor(coding)
+                await send(start)
+
+            data = compressor.chunk(body) if body else b''
+            if not more_body:
+                data += compressor.finish()
+            await send({'type': 'http.response.body', 'body': data, 'more_body': more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,278 @@
+"""Persistent storage for uploaded contact lists.
+
+Lists are stored in SQLite keyed by list id, one JSON row per contact,
+so the browser only ever receives a handle plus the page it is looking
+at, and campaigns can reuse a list without re-uploading or re-parsing it.
+
+Pages are read by row number, which costs the same wherever the page is
+in the list. Searches and column filters match case-insensitive
+substrings; their match counts are cached since lists never change.
+"""
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from backend.serialization import dumps_str, loads
+
+# Rows per INSERT batch and per page when iterating a list for sending
+BATCH_SIZE = 1000
+# Search/filter match counts kept per store
+COUNT_CACHE_SIZE = 256
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contact_lists (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    columns TEXT NOT NULL DEFAULT '[]',
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS contacts (
+    list_id TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (list_id, row)
+) WITHOUT ROWID;
+"""
+
+
+class ContactSearchError(ValueError):
+    pass
+
+
+def _like(value: str) -> str:
+    escaped = str(value).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def _raw_match(value: str) -> bool:
+    # Whether `value` appears verbatim in the stored JSON text when it is in
+    # a field, so a cheap LIKE over the text can rule rows out first
+    return value.isascii() and value.isprintable() and '"' not in value and '\\' not in value
+
+
+class ContactList:
+    def __init__(self, store: "ContactListStore", list_id: str, filename: str,
+                 total: int = 0, columns: Optional[List[str]] = None, created_at: Optional[float] = None):
+        self.store = store
+        self.id = list_id
+        self.filename = filename
+        self.total = total
+        self.columns = columns or []
+        self.created_at = created_at or time.time()
+
+    def page(self, offset: int = 0, limit: int = 100) -> List[Dict]:
+        rows = self.store.connection().execute(
+            "SELECT data FROM contacts WHERE list_id = ? AND row >= ? ORDER BY row LIMIT ?",
+            (self.id, offset, limit)
+        ).fetchall()
+        return [loads(data) for data, in rows]
+
+    def _search_clause(self, query: Optional[str], filters: Optional[Mapping[str, str]]) -> Tuple[str, List]:
+        clauses = ["list_id = ?"]
+        params: List = [self.id]
+        if query:
+            if _raw_match(query):
+                clauses.append("data LIKE ? ESCAPE '\\'")
+                params.append(_like(query))
+            clauses.append("EXISTS (SELECT 1 FROM json_each(data) WHERE value LIKE ? ESCAPE '\\')")
+            params.append(_like(query))
+        for column, value in (filters or {}).items():
+            if column not in self.columns:
+                raise ContactSearchError(f"Unknown column: {column}")
+            if value in (None, ''):
+                continue
+            value = str(value)
+            if _raw_match(value):
+                clauses.append("data LIKE ? ESCAPE '\\'")
+                params.append(_like(value))
+            path = '$."' + column.replace('"', '\\"') + '"'
+            clauses.append("json_extract(data, ?) LIKE ? ESCAPE '\\'")
+            params += [path, _like(value)]
+        return ' AND '.join(clauses), params
+
+    def search(self, offset: int = 0, limit: int = 100, query: Optional[str] = None,
+               filters: Optional[Mapping[str, str]] = None) -> List[Tuple[int, Dict]]:
+        """(row, contact) for the matches at positions offset..offset+limit.
+
+        Without a query or filters this is a page by row number; otherwise
+        SQLite scans for the matches, so deep offsets cost more.
+        """
+        where, params = self._search_clause(query, filters)
+        if len(params) == 1:
+            sql = f"SELECT row, data FROM contacts WHERE {where} AND row >= ? ORDER BY row LIMIT ?"
+            params += [offset, limit]
+        else:
+            sql = f"SELECT row, data FROM contacts WHERE {where} ORDER BY row LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        rows = self.store.connection().execute(sql, params).fetchall()
+        return [(row, loads(data)) for row, data in rows]
+
+    def iter_search(self, query: Optional[str] = None,
+                    filters: Optional[Mapping[str, str]] = None) -> Iterator[Tuple[int, str]]:
+        """(row, stored JSON text) for every match, for exports that pass the
+        text through rather than decoding it."""
+        where, params = self._search_clause(query, filters)
+        offset = 0
+        while True:
+            # Looked up per page: streaming responses run each step on any threadpool thread
+            rows = self.store.connection().execute(
+                f"SELECT row, data FROM contacts WHERE {where} AND row >= ? ORDER BY row LIMIT ?",
+                params + [offset, BATCH_SIZE]
+            ).fetchall()
+            yield from rows
+            if len(rows) < BATCH_SIZE:
+                return
+            offset = rows[-1][0] + 1
+
+    def count(self, query: Optional[str] = None, filters: Optional[Mapping[str, str]] = None) -> int:
+        """Number of contacts matching a search; `total` when there is none."""
+        where, params = self._search_clause(query, filters)
+        if len(params) == 1:
+            return self.total
+        key = (self.id, where, tuple(params))
+        cached = self.store.cached_count(key)
+        if cached is None:
+            cached, = self.store.connection().execute(f"SELECT COUNT(*) FROM contacts WHERE {where}", params).fetchone()
+            self.store.cache_count(key, cached)
+        return cached
+
+    def __iter__(self) -> Iterator[Dict]:
+        # Keyset pagination: no cursor is held open between pages
+        offset = 0
+        while True:
+            rows = self.page(offset, BATCH_SIZE)
+            yield from rows
+            if len(rows) < BATCH_SIZE:
+                return
+            offset += BATCH_SIZE
+
+    def iter_rows(self, include: Callable[[int], bool]) -> Iterator[Tuple[int, Dict]]:
+        """Yield (row, contact) for included rows, decoding only those."""
+        offset = 0
+        while True:
+            # Looked up per page: the scheduler may read pages on different threads
+            rows = self.store.connection().execute(
+                "SELECT row, data FROM contacts WHERE list_id = ? AND row >= ? ORDER BY row LIMIT ?",
+                (self.id, offset, BATCH_SIZE)
+            ).fetchall()
+            for row, data in rows:
+                if include(row):
+                    yield row, loads(data)
+            if len(rows) < BATCH_SIZE:
+                return
+            offset = rows[-1][0] + 1
+
+    def row(self, row: int) -> Dict:
+        contacts = self.page(row, 1)
+        if not contacts or row < 0:
+            raise IndexError(row)
+        return contacts[0]
+
+    def head(self, limit: int) -> List[Dict]:
+        return self.page(0, limit)
+
+    def summary(self) -> Dict:
+        return {
+            'list_id': self.id,
+            'filename': self.filename,
+            'total': self.total,
+            'columns': self.columns,
+            'created_at': self.created_at
+        }
+
+
+class ContactListStore:
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._counts: "OrderedDict[Tuple, int]" = OrderedDict()
+        self._counts_lock = threading.Lock()
+        conn = self.connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+
+    def connection(self) -> sqlite3.Connection:
+        # One connection per thread; uploads are parsed in the threadpool
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def cached_count(self, key: Tuple) -> Optional[int]:
+        with self._counts_lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self._counts.move_to_end(key)
+            return count
+
+    def cache_count(self, key: Tuple, count: int):
+        with self._counts_lock:
+            self._counts[key] = count
+            while len(self._counts) > COUNT_CACHE_SIZE:
+                self._counts.popitem(last=False)
+
+    def create(self, filename: str, contacts: Iterable[Dict]) -> ContactList:
+        """Insert contacts in batches as they are parsed and return the handle."""
+        contact_list = ContactList(self, uuid.uuid4().hex, filename)
+        columns: Dict[str, None] = {}
+        conn = self.connection()
+        batch = []
+        with conn:
+            conn.execute(
+                "INSERT INTO contact_lists (id, filename, created_at) VALUES (?, ?, ?)",
+                (contact_list.id, filename, contact_list.created_at)
+            )
+            for row, contact in enumerate(contacts):
+                batch.append((contact_list.id, row, dumps_str(contact)))
+                for key in contact:
+                    if key not in columns:
+                        columns[key] = None
+                if len(batch) >= BATCH_SIZE:
+                    conn.executemany("INSERT INTO contacts VALUES (?, ?, ?)", batch)
+                    batch = []
+                contact_list.total = row + 1
+            if batch:
+                conn.executemany("INSERT INTO contacts VALUES (?, ?, ?)", batch)
+            contact_list.columns = list(columns)
+            conn.execute(
+                "UPDATE contact_lists SET total = ?, columns = ? WHERE id = ?",
+                (contact_list.total, dumps_str(contact_list.columns), contact_list.id)
+            )
+        return contact_list
+
+    def _from_row(self, row) -> ContactList:
+        list_id, filename, total, columns, created_at = row
+        return ContactList(self, list_id, filename, total, loads(columns), created_at)
+
+    def get(self, list_id: str) -> Optional[ContactList]:
+        row = self.connection().execute(
+            "SELECT id, filename, total, columns, created_at FROM contact_lists WHERE id = ?",
+            (list_id,)
+        ).fetchone()
+        return self._from_row(row) if row else None
+
+    def all(self) -> List[ContactList]:
+        rows = self.connection().execute(
+            "SELECT id, filename, total, columns, created_at FROM contact_lists ORDER BY created_at DESC"
+        ).fetchall()
+        return [self._from_row(row) for row in rows]
+
+    def delete(self, list_id: str) -> bool:
+        conn = self.connection()
+        with conn:
+            conn.execute("DELETE FROM contacts WHERE list_id = ?", (list_id,))
+            deleted = conn.execute("DELETE FROM contact_lists WHERE id = ?", (list_id,)).rowcount
+        with self._counts_lock:
+            for key in [key for key in self._counts if key[0] == list_id]:
+                del self._counts[key]
+        return bool(deleted)
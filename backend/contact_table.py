@@ -0,0 +1,219 @@
+"""Compact in-memory contact lists.
+
+A contact decoded into a dict costs several hundred bytes: the dict
+itself plus a separate str object for every value. ContactTable stores
+a list column by column instead, which is 5-10x smaller:
+
+- a column with few distinct values (titles, companies, countries) is
+  dictionary-encoded: each distinct string is kept once and every row
+  holds a 2-byte code;
+- once a column has more than DICTIONARY_LIMIT distinct values (emails,
+  names, URLs) it is packed: the UTF-8 bytes of all its values in one
+  buffer, plus one offset per row.
+
+Values that aren't strings (numbers and nulls from JSON uploads, missing
+keys) are rare and kept in a per-column side table.
+
+Rows are read through ContactRow, a read-only Mapping view over the
+table that decodes a value only when it is asked for, so the sender
+loop walks the table without materializing any dicts. Templates,
+validation and message building all accept it in place of a dict.
+"""
+import sys
+from array import array
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+# Distinct values a column may have before it switches to packed storage
+DICTIONARY_LIMIT = 4096
+
+_MISSING = object()
+# Dictionary code of a cell whose value is in the side table
+_SPECIAL = 0xFFFF
+_MAX_OFFSET_32 = 0xFFFFFFFF
+
+
+class _Column:
+    __slots__ = ('first_row', 'length', 'codes', 'values', 'lookup', 'data', 'offsets', 'special')
+
+    def __init__(self, first_row: int):
+        # Rows before the column first appeared don't have it
+        self.first_row = first_row
+        self.length = 0
+        self.codes = array('H')
+        self.values: List[str] = []
+        self.lookup: Dict[str, int] = {}
+        self.data = None
+        self.offsets = None
+        # index -> value for cells that aren't strings
+        self.special: Dict[int, Any] = {}
+
+    def _pack(self):
+        encoded = [value.encode('utf-8', 'surrogatepass') for value in self.values]
+        data = bytearray()
+        offsets = array('I', [0])
+        for code in self.codes:
+            if code != _SPECIAL:
+                data += encoded[code]
+            offsets.append(len(data))
+        self.data, self.offsets = data, offsets
+        self.codes = self.values = self.lookup = None
+
+    def append(self, value: Any):
+        if not isinstance(value, str):
+            self.special[self.length] = value
+            if self.data is None:
+                self.codes.append(_SPECIAL)
+            else:
+                self.offsets.append(len(self.data))
+            self.length += 1
+            return
+        if self.data is None:
+            code = self.lookup.get(value)
+            if code is None:
+                if len(self.values) < DICTIONARY_LIMIT:
+                    code = self.lookup[value] = len(self.values)
+                    self.values.append(value)
+                else:
+                    self._pack()
+            if code is not None:
+                self.codes.append(code)
+                self.length += 1
+                return
+        self.data += value.encode('utf-8', 'surrogatepass')
+        if self.offsets.typecode == 'I' and len(self.data) > _MAX_OFFSET_32:
+            self.offsets = array('Q', self.offsets)
+        self.offsets.append(len(self.data))
+        self.length += 1
+
+    def get(self, row: int) -> Any:
+        index = row - self.first_row
+        if 0 <= index < self.length:
+            data = self.data
+            if data is None:
+                code = self.codes[index]
+                return self.values[code] if code != _SPECIAL else self.special[index]
+            offsets = self.offsets
+            start = offsets[index]
+            end = offsets[index + 1]
+            if start != end:
+                return data[start:end].decode('utf-8', 'surrogatepass')
+            return self.special.get(index, '')
+        return _MISSING
+
+    def nbytes(self) -> int:
+        if self.data is None:
+            size = self.codes.itemsize * len(self.codes) + sum(sys.getsizeof(value) for value in self.values)
+        else:
+            size = len(self.data) + self.offsets.itemsize * len(self.offsets)
+        return size + sum(sys.getsizeof(value) for value in self.special.values())
+
+
+class ContactRow(Mapping):
+    """A read-only dict-like view of one row of a ContactTable."""
+
+    __slots__ = ('_columns', '_row')
+
+    def __init__(self, table: "ContactTable", row: int):
+        self._columns = table._columns
+        self._row = row
+
+    def __getitem__(self, key: str) -> Any:
+        column = self._columns.get(key)
+        value = column.get(self._row) if column is not None else _MISSING
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        column = self._columns.get(key)
+        if column is None:
+            return default
+        value = column.get(self._row)
+        return default if value is _MISSING else value
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __iter__(self) -> Iterator[str]:
+        row = self._row
+        for name, column in self._columns.items():
+            if column.get(row) is not _MISSING:
+                yield name
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        row = self._row
+        contact = {}
+        for name, column in self._columns.items():
+            value = column.get(row)
+            if value is not _MISSING:
+                contact[name] = value
+        return contact
+
+    def __repr__(self):
+        return f"ContactRow({self.to_dict()!r})"
+
+
+class ContactTable:
+    """Contacts stored column by column; see the module docstring.
+
+    Offers the reading side of ContactList (`total`, `columns`, iteration,
+    `iter_rows`, `row`), so either can feed validation and the sender.
+    """
+
+    def __init__(self):
+        self._columns: Dict[str, _Column] = {}
+        self.total = 0
+
+    @classmethod
+    def from_contacts(cls, contacts: Iterable[Mapping]) -> "ContactTable":
+        table = cls()
+        table.extend(contacts)
+        return table
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self._columns)
+
+    def append(self, contact: Mapping):
+        row = self.total
+        columns = self._columns
+        for name, value in contact.items():
+            column = columns.get(name)
+            if column is None:
+                column = columns[sys.intern(name)] = _Column(row)
+            if column.first_row + column.length != row:
+                # Earlier contacts lacked this column; fill the gap
+                while column.first_row + column.length < row:
+                    column.append(_MISSING)
+            column.append(value)
+        self.total = row + 1
+
+    def extend(self, contacts: Iterable[Mapping]):
+        for contact in contacts:
+            self.append(contact)
+
+    def row(self, row: int) -> ContactRow:
+        if not 0 <= row < self.total:
+            raise IndexError(row)
+        return ContactRow(self, row)
+
+    def __len__(self) -> int:
+        return self.total
+
+    def __iter__(self) -> Iterator[ContactRow]:
+        for row in range(self.total):
+            yield ContactRow(self, row)
+
+    def iter_rows(self, include: Callable[[int], bool]) -> Iterator[Tuple[int, ContactRow]]:
+        """Yield (row, contact view) for included rows."""
+        for row in range(self.total):
+            if include(row):
+                yield row, ContactRow(self, row)
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the stored values."""
+        return sum(column.nbytes() for column in self._columns.values())
@@ -0,0 +1,316 @@
+"""Sharing relay capacity between concurrent campaigns.
+
+Every provider's send rate is a single quota for the whole process.
+RelayCapacity owns one token bucket per provider, and each running
+campaign draws from it through a Share. Several campaigns on the same
+relay together never exceed the quota, and one campaign alone gets all
+of it.
+
+When campaigns compete, tokens go out by strict priority first, so
+transactional mail is never queued behind bulk. Within a priority they
+are shared by weight, using start-time fair queuing. Each request is
+tagged with the share's virtual time, which advances by count / weight
+per grant, and the lowest tag is served first. A campaign with weight 2
+gets twice the rate of one with weight 1, however many connections
+either of them has waiting.
+
+Campaigns can also start at a later time and be confined to a daily
+send window (SendWindow). The job manager and CampaignJob.checkpoint
+enforce those, see backend.jobs.
+"""
+import asyncio
+import datetime
+import heapq
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, FrozenSet, List, Mapping, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from backend.throttle import TokenBucket
+
+TRANSACTIONAL = 0
+NORMAL = 1
+BULK = 2
+PRIORITIES = {'transactional': TRANSACTIONAL, 'normal': NORMAL, 'bulk': BULK}
+PRIORITY_NAMES = {value: name for name, value in PRIORITIES.items()}
+
+# Longest single wait, so cancellation is noticed promptly
+MAX_WAIT = 1.0
+# Tokens a relay's bucket may save up. With only one, timer jitter in
+# the dispatcher loses about a tenth of the rate; two absorb it
+CAPACITY_BURST = 2.0
+
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
+
+class ScheduleError(ValueError):
+    pass
+
+
+def parse_priority(value) -> int:
+    if value is None:
+        return NORMAL
+    try:
+        return PRIORITIES[str(value).lower()]
+    except KeyError:
+        raise ScheduleError(f"Unknown priority: {value} (expected {', '.join(PRIORITIES)})") from None
+
+
+def parse_weight(value) -> float:
+    if value is None:
+        return 1.0
+    try:
+        weight = float(value)
+    except (TypeError, ValueError):
+        raise ScheduleError(f"Invalid weight: {value}") from None
+    if not weight > 0:
+        raise ScheduleError("weight must be positive")
+    return weight
+
+
+def parse_start_at(value) -> Optional[float]:
+    """Unix time from a timestamp or an ISO 8601 string (UTC unless it has an offset)."""
+    if value in (None, ''):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        moment = datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        raise ScheduleError(f"Invalid start_at: {value}") from None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment.timestamp()
+
+
+def _parse_time(value) -> datetime.time:
+    try:
+        return datetime.time.fromisoformat(str(value))
+    except ValueError:
+        raise ScheduleError(f"Invalid send window time: {value}") from None
+
+
+@dataclass
+class SendWindow:
+    """Daily hours during which a campaign may send, in a given time zone.
+
+    An `end` before `start` spans midnight. `days` limits the window to
+    some weekdays (0 = Monday), counted on the day the window opens.
+    """
+    start: datetime.time
+    end: datetime.time
+    timezone: str = 'UTC'
+    days: FrozenSet[int] = field(default_factory=lambda: frozenset(range(7)))
+
+    @classmethod
+    def from_config(cls, config: Optional[Mapping]) -> Optional["SendWindow"]:
+        """{"start": "09:00", "end": "17:00", "timezone": "Europe/Berlin", "days": ["mon", ...]}"""
+        if not config:
+            return None
+        if not isinstance(config, Mapping) or 'start' not in config or 'end' not in config:
+            raise ScheduleError("send_window needs start and end times")
+        days = config.get('days')
+        if days is None:
+            day_numbers = frozenset(range(7))
+        else:
+            try:
+                day_numbers = frozenset(
+                    WEEKDAYS.index(day[:3].lower()) if isinstance(day, str) else int(day) % 7
+                    for day in days
+                )
+            except (ValueError, TypeError):
+                raise ScheduleError(f"Invalid send window days: {days}") from None
+            if not day_numbers:
+                raise ScheduleError("send_window days can't be empty")
+        window = cls(_parse_time(config['start']), _parse_time(config['end']), config.get('timezone', 'UTC'), day_numbers)
+        if window.start == window.end:
+            raise ScheduleError("send_window start and end must differ")
+        try:
+            window.zone
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ScheduleError(f"Unknown time zone: {window.timezone}") from None
+        return window
+
+    @property
+    def zone(self) -> ZoneInfo:
+        return ZoneInfo(self.timezone)
+
+    def _intervals(self, now: float):
+        # Windows opening from yesterday (overnight ones) to a week ahead
+        zone = self.zone
+        today = datetime.datetime.fromtimestamp(now, zone).date()
+        for offset in range(-1, 8):
+            day = today + datetime.timedelta(days=offset)
+            if day.weekday() not in self.days:
+                continue
+            opens = datetime.datetime.combine(day, self.start, zone)
+            closes = datetime.datetime.combine(day, self.end, zone)
+            if closes <= opens:
+                closes += datetime.timedelta(days=1)
+            yield opens.timestamp(), closes.timestamp()
+
+    def state(self, now: float) -> Tuple[bool, float]:
+        """(open now, Unix time of the next change)."""
+        next_open = None
+        for opens, closes in self._intervals(now):
+            if opens <= now < closes:
+                return True, closes
+            if opens > now and (next_open is None or opens < next_open):
+                next_open = opens
+        return False, next_open
+
+    def summary(self) -> Dict:
+        return {
+            'start': self.start.isoformat('minutes'),
+            'end': self.end.isoformat('minutes'),
+            'timezone': self.timezone,
+            'days': [WEEKDAYS[day] for day in sorted(self.days)]
+        }
+
+
+class Share:
+    """One campaign's claim on a provider's capacity."""
+
+    def __init__(self, capacity: "ProviderCapacity", name: str, weight: float, priority: int):
+        self.capacity = capacity
+        self.name = name
+        self.weight = weight
+        self.priority = priority
+        # Virtual time at which this share's last request finishes
+        self.finish = 0.0
+        self.granted = 0
+        self.waiting = 0
+
+    async def acquire(self, count: int = 1, stop: Optional[Callable[[], bool]] = None) -> bool:
+        """Wait for `count` sends' worth of capacity; False if `stop` fired first."""
+        return await self.capacity.acquire(self, count, stop)
+
+    def close(self):
+        self.capacity.shares.pop(self.name, None)
+
+    def summary(self) -> Dict:
+        return {
+            'campaign': self.name,
+            'priority': PRIORITY_NAMES.get(self.priority, self.priority),
+            'weight': self.weight,
+            'granted': self.granted,
+            'waiting': self.waiting
+        }
+
+
+class ProviderCapacity:
+    def __init__(self, rate: Optional[float], burst: float = CAPACITY_BURST):
+        self.bucket = TokenBucket(rate, burst)
+        self.shares: Dict[str, Share] = {}
+        self.virtual_time = 0.0
+        # (priority, tag, seq, count, share, future)
+        self._waiters: List[tuple] = []
+        self._sequence = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    @property
+    def rate(self) -> Optional[float]:
+        return self.bucket.rate
+
+    def _ready(self, count: int, now: float) -> float:
+        # A multi-recipient message may take the bucket into debt, which
+        # later grants wait out, so the average rate still holds
+        bucket = self.bucket
+        if not bucket.rate:
+            return 0.0
+        bucket._refill(now)
+        needed = min(count, bucket.burst)
+        return 0.0 if bucket.tokens >= needed else (needed - bucket.tokens) / bucket.rate
+
+    def _grant(self, share: Share, count: int, tag: float, now: float):
+        if self.bucket.rate:
+            self.bucket._refill(now)
+            self.bucket.tokens -= count
+        self.virtual_time = max(self.virtual_time, tag)
+        share.granted += count
+
+    async def acquire(self, share: Share, count: int, stop: Optional[Callable[[], bool]]) -> bool:
+        tag = max(self.virtual_time, share.finish)
+        share.finish = tag + count / share.weight
+        now = time.monotonic()
+        if not self._waiters and self._ready(count, now) <= 0:
+            self._grant(share, count, tag, now)
+            return True
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (share.priority, tag, next(self._sequence), count, share, future))
+        share.waiting += 1
+        self._wake()
+        try:
+            while True:
+                done, _ = await asyncio.wait([future], timeout=MAX_WAIT)
+                if done:
+                    return True
+                if stop is not None and stop():
+                    future.cancel()
+                    return False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        finally:
+            share.waiting -= 1
+
+    def _wake(self):
+        loop = asyncio.get_running_loop()
+        if self._dispatcher is None or self._dispatcher.done() or self._dispatcher.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._dispatcher = loop.create_task(self._dispatch())
+        else:
+            self._wakeup.set()
+
+    async def _dispatch(self):
+        """Grant waiting requests in (priority, tag) order as tokens allow."""
+        waiters = self._waiters
+        while waiters:
+            priority, tag, _, count, share, future = waiters[0]
+            if future.done():
+                heapq.heappop(waiters)
+                continue
+            now = time.monotonic()
+            delay = self._ready(count, now)
+            if delay > 0:
+                # A new, more urgent request may arrive meanwhile
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), min(delay, MAX_WAIT))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(waiters)
+            self._grant(share, count, tag, now)
+            future.set_result(True)
+
+    def summary(self) -> Dict:
+        return {
+            'rate': self.rate,
+            'waiting': sum(1 for waiter in self._waiters if not waiter[-1].done()),
+            'campaigns': [share.summary() for share in self.shares.values()]
+        }
+
+
+class RelayCapacity:
+    """Per-provider capacities for this process."""
+
+    def __init__(self):
+        self.providers: Dict[str, ProviderCapacity] = {}
+
+    def share(self, provider: str, rate: Optional[float], name: str,
+              weight: float = 1.0, priority: int = NORMAL) -> Share:
+        capacity = self.providers.get(provider)
+        if capacity is None:
+            capacity = self.providers[provider] = ProviderCapacity(rate)
+        else:
+            # Pick up a changed provider configuration
+            capacity.bucket.rate = rate
+        share = capacity.shares[name] = Share(capacity, name, weight, priority)
+        return share
+
+    def summary(self) -> Dict:
+        return {name: capacity.summary() for name, capacity in self.providers.items()}
@@ -0,0 +1,133 @@
+"""Streaming contact file parsers.
+
+Each reader takes a binary file object and yields rows lazily, so memory
+stays bounded regardless of the size of the upload. The header is mapped
+to contact fields once per file (see backend.columns) and every row is
+then a plain projection.
+"""
+import csv
+import io
+from typing import BinaryIO, Dict, Iterator, Mapping, Optional, Sequence, Tuple
+
+from backend.columns import ColumnMapper, ColumnMapping
+
+SUPPORTED_EXTENSIONS = ('.json', '.csv', '.xlsx', '.xls')
+
+default_mapper = ColumnMapper()
+
+
+class IngestError(ValueError):
+    pass
+
+
+def read_csv(fileobj: BinaryIO, encoding: str = 'utf-8-sig') -> Tuple[Sequence, Iterator[Sequence]]:
+    # TextIOWrapper decodes the upload in buffered chunks, line by line
+    text = io.TextIOWrapper(fileobj, encoding=encoding, newline='')
+    reader = csv.reader(text)
+    header = next(reader, [])
+
+    def rows():
+        try:
+            for row in reader:
+                if row:
+                    yield row
+        finally:
+            # Don't let the wrapper close the caller's file
+            text.detach()
+
+    return header, rows()
+
+
+def read_xlsx(fileobj: BinaryIO) -> Tuple[Sequence, Iterator[Sequence]]:
+    """Iterate an .xlsx sheet in openpyxl read-only mode."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    sheet_rows = workbook.active.iter_rows(values_only=True)
+    header = next(sheet_rows, None) or ()
+
+    def rows():
+        try:
+            for values in sheet_rows:
+                if any(value is not None for value in values):
+                    yield values
+        finally:
+            workbook.close()
+
+    return header, rows()
+
+
+def read_xls(fileobj: BinaryIO) -> Tuple[Sequence, Iterator[Sequence]]:
+    # Legacy .xls has no streaming reader; fall back to pandas (xlrd)
+    import pandas as pd
+
+    df = pd.read_excel(fileobj)
+    # Blank cells become None instead of NaN, for the whole frame at once
+    df = df.astype(object).where(df.notna(), None)
+    return list(df.columns), df.itertuples(index=False, name=None)
+
+
+def iter_json_rows(fileobj: BinaryIO) -> Iterator[Dict]:
+    """Yield items of a top-level JSON array; a single object is one contact."""
+    import ijson
+
+    head = fileobj.read(1)
+    while head and head.isspace():
+        head = fileobj.read(1)
+    fileobj.seek(fileobj.tell() - len(head))
+
+    prefix = 'item' if head == b'[' else ''
+    try:
+        for item in ijson.items(fileobj, prefix, use_float=True):
+            if not isinstance(item, dict):
+                raise IngestError("Each contact must be a JSON object")
+            yield item
+    except ijson.JSONError as e:
+        raise IngestError(f"Invalid JSON file: {e}")
+
+
+def map_json_rows(rows: Iterator[Dict], mapper: ColumnMapper, overrides: Optional[Mapping[str, str]]) -> Iterator[Dict]:
+    # JSON objects carry their own keys; resolve each distinct key set once
+    mappings: Dict[tuple, ColumnMapping] = {}
+    for row in rows:
+        keys = tuple(row)
+        mapping = mappings.get(keys)
+        if mapping is None:
+            mapping = mappings[keys] = mapper.resolve(keys, overrides)
+        yield mapping.project_dict(row)
+
+
+class ParsedUpload:
+    """Contacts from an upload plus the header mapping that produced them."""
+
+    def __init__(self, contacts: Iterator[Dict], mapping: Optional[ColumnMapping]):
+        self.contacts = contacts
+        self.mapping = mapping
+
+    def __iter__(self):
+        return self.contacts
+
+
+def parse_upload(
+    filename: str,
+    fileobj: BinaryIO,
+    overrides: Optional[Mapping[str, str]] = None,
+    mapper: Optional[ColumnMapper] = None
+) -> ParsedUpload:
+    """Open an uploaded file and return its contacts as a lazy stream."""
+    mapper = mapper or default_mapper
+    lower = filename.lower()
+    if lower.endswith('.json'):
+        return ParsedUpload(map_json_rows(iter_json_rows(fileobj), mapper, overrides), None)
+    elif lower.endswith('.csv'):
+        header, rows = read_csv(fileobj)
+    elif lower.endswith('.xlsx'):
+        header, rows = read_xlsx(fileobj)
+    elif lower.endswith('.xls'):
+        header, rows = read_xls(fileobj)
+    else:
+        raise IngestError("Unsupported file format. Please upload a JSON, CSV, or Excel file.")
+
+    mapping = mapper.resolve(header, overrides)
+    project = mapping.project
+    return ParsedUpload((project(row) for row in rows), mapping)
@@ -0,0 +1,388 @@
+"""Background campaign jobs.
+
+A submitted campaign becomes a CampaignJob that is queued and picked up by
+one of the JobManager workers. The HTTP request returns the job id right
+away and clients poll the job for progress or subscribe to its event
+stream.
+
+Queued jobs start in priority order (see backend.fairshare), and
+transactional ones start straight away without waiting for a worker.
+A job with a start time is only queued once that time comes. Jobs that
+can't send yet (paused while queued, or outside their send window) are
+parked off the workers and queued again once they can; a running job
+whose window closes waits in checkpoint().
+"""
+import asyncio
+import itertools
+import time
+import uuid
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from backend.fairshare import NORMAL, PRIORITY_NAMES, TRANSACTIONAL, SendWindow
+
+QUEUED = "queued"
+RUNNING = "running"
+PAUSED = "paused"
+COMPLETED = "completed"
+CANCELLED = "cancelled"
+FAILED = "failed"
+
+FINISHED_STATES = {COMPLETED, CANCELLED, FAILED}
+
+# Results are pushed to subscribers in batches of this many messages
+EVENT_BATCH_SIZE = 50
+# Only the most recent failures are kept on the job; the full list is streamed
+MAX_FAILED_DETAILS = 1000
+# Events buffered per subscriber before a slow client starts missing batches
+SUBSCRIBER_QUEUE_SIZE = 256
+# Longest a job parked outside its send window waits before checking again
+WINDOW_RECHECK_INTERVAL = 3600.0
+
+
+class JobError(Exception):
+    pass
+
+
+class CampaignJob:
+    def __init__(
+        self,
+        total: int,
+        runner: Callable[["CampaignJob"], Awaitable[None]],
+        abort_failure_rate: Optional[float] = None,
+        job_id: Optional[str] = None,
+        priority: int = NORMAL,
+        start_at: Optional[float] = None,
+        window: Optional[SendWindow] = None
+    ):
+        # A resumed campaign keeps its original id
+        self.id = job_id or uuid.uuid4().hex
+        self.total = total
+        self.runner = runner
+        self.status = QUEUED
+        self.sent = 0
+        self.failed = 0
+        self.failed_details = deque(maxlen=MAX_FAILED_DETAILS)
+        # Recipients dropped by pre-send validation
+        self.rejected = 0
+        self.validation: Optional[Dict] = None
+        # Recipients waiting for a retry after a temporary failure
+        self.deferred = 0
+        # Results carried over from an earlier run of the same campaign
+        self._restored = 0
+        # Delivery scheduler, once sending starts (see backend.throttle)
+        self.scheduler = None
+        # cProfile report, for campaigns sent with profiling on
+        self.profile: Optional[str] = None
+        self.error: Optional[str] = None
+        # Cancel the job when a full batch fails at more than this ratio
+        self.abort_failure_rate = abort_failure_rate
+        self.priority = priority
+        # Unix time before which the job isn't started
+        self.start_at = start_at
+        self.window = window
+        # While sending: Unix time the window closes, or reopens while closed
+        self._window_open_until = 0.0
+        self.window_opens_at: Optional[float] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # Time spent paused is excluded from throughput
+        self._paused_at: Optional[float] = None
+        self._paused_total = 0.0
+        self._resume = asyncio.Event()
+        self._resume.set()
+        self._cancelled = asyncio.Event()
+        # Set by the job manager while the job is parked until resume()
+        self._on_resume: Optional[Callable[["CampaignJob"], None]] = None
+        self._subscribers: List[asyncio.Queue] = []
+        self._batch_done = 0
+        self._batch_failures: List[Dict] = []
+        self._batch_started = time.time()
+
+    @property
+    def pending(self) -> int:
+        return max(self.total - self.sent - self.failed - self.rejected, 0)
+
+    def record(self, ok: bool, email: str = None, error: str = None):
+        if ok:
+            self.sent += 1
+        else:
+            self.failed += 1
+            detail = {'email': email, 'error': error}
+            self.failed_details.append(detail)
+            self._batch_failures.append(detail)
+        self._batch_done += 1
+        if self._batch_done >= EVENT_BATCH_SIZE:
+            self.flush()
+
+    def restore(self, sent: int, failed: int, failed_details: List[Dict]):
+        """Seed the counters with results logged by an earlier run."""
+        self.sent = sent
+        self.failed = failed
+        self.failed_details.extend(failed_details)
+        self._restored = sent + failed
+
+    def record_validation(self, summary: Dict):
+        self.rejected = summary['rejected']
+        self.validation = summary
+        self.publish('validation', {**self.progress(), 'validation': summary})
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        if queue in self._subscribers:
+            self._subscribers.remove(queue)
+
+    def publish(self, event: str, data: Dict):
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                pass
+
+    def flush(self):
+        """Publish the results recorded since the previous batch."""
+        now = time.time()
+        elapsed = now - self._batch_started
+        done, failures = self._batch_done, self._batch_failures
+        self._batch_done, self._batch_failures, self._batch_started = 0, [], now
+        if not done:
+            return
+
+        self.publish('batch', {
+            **self.progress(),
+            'batch_size': done,
+            'batch_failed': len(failures),
+            'batch_rate': round(done / elapsed, 2) if elapsed > 0 else None,
+            'failures': failures
+        })
+
+        if (self.abort_failure_rate is not None
+                and done >= EVENT_BATCH_SIZE
+                and len(failures) / done > self.abort_failure_rate
+                and self.status not in FINISHED_STATES):
+            self.error = (
+                f"Aborted: {len(failures)} of the last {done} messages failed"
+            )
+            self.cancel()
+
+    async def events(self, heartbeat: float = 2.0) -> AsyncIterator[Tuple[str, Dict]]:
+        """Yield (event, data) pairs until the job finishes.
+
+        A progress snapshot is sent on subscribe and whenever no batch
+        arrives within `heartbeat` seconds.
+        """
+        queue = self.subscribe()
+        try:
+            yield 'progress', self.progress()
+            while True:
+                if self.status in FINISHED_STATES and queue.empty():
+                    yield 'done', self.progress()
+                    return
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    event, data = 'progress', self.progress()
+                yield event, data
+                if event == 'done':
+                    return
+        finally:
+            self.unsubscribe(queue)
+
+    def active_seconds(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at or time.time()
+        paused = self._paused_total
+        if self._paused_at is not None:
+            paused += end - self._paused_at
+        return max(end - self.started_at - paused, 0.0)
+
+    def progress(self) -> Dict:
+        elapsed = self.active_seconds()
+        done = self.sent + self.failed - self._restored
+        throughput = done / elapsed if elapsed > 0 else 0.0
+        eta = self.pending / throughput if throughput > 0 and self.status not in FINISHED_STATES else None
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'total': self.total,
+            'sent': self.sent,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'deferred': self.deferred,
+            'pending': self.pending,
+            'throughput': round(throughput, 2),
+            'eta_seconds': round(eta, 1) if eta is not None else None,
+            'throttled': self.scheduler.stats()['throttled'] if self.scheduler else {},
+            'priority': PRIORITY_NAMES.get(self.priority, self.priority),
+            'scheduled_for': self.start_at if self.status == QUEUED and self.start_at else None,
+            'window_opens_at': self.window_opens_at,
+            'error': self.error
+        }
+
+    def result(self) -> Dict:
+        return {
+            'success': self.sent,
+            'failed': self.failed,
+            'total': self.total,
+            'failed_details': list(self.failed_details),
+            'failed_details_truncated': self.failed > len(self.failed_details),
+            'validation': self.validation
+        }
+
+    def in_window(self) -> bool:
+        """Whether the send window (if any) is open now."""
+        if self.window is None:
+            return True
+        now = time.time()
+        if now < self._window_open_until:
+            return True
+        is_open, change = self.window.state(now)
+        if is_open:
+            self._window_open_until = change
+            self.window_opens_at = None
+        elif self.window_opens_at != change:
+            self.window_opens_at = change
+            self.publish('status', self.progress())
+        return is_open
+
+    async def checkpoint(self) -> bool:
+        """Wait while paused or outside the send window; return False once
+        the job is cancelled."""
+        while True:
+            await self._resume.wait()
+            if self.status == CANCELLED:
+                return False
+            if self.in_window():
+                return True
+            wait = (self.window_opens_at or 0) - time.time()
+            try:
+                # Woken early only by cancel
+                await asyncio.wait_for(self._cancelled.wait(), max(min(wait, 60.0), 0.1))
+            except asyncio.TimeoutError:
+                pass
+
+    def pause(self):
+        if self.status not in (QUEUED, RUNNING):
+            raise JobError(f"Cannot pause a {self.status} job")
+        self.status = PAUSED
+        self._paused_at = time.time()
+        self._resume.clear()
+        self.publish('status', self.progress())
+
+    def resume(self):
+        if self.status != PAUSED:
+            raise JobError(f"Cannot resume a {self.status} job")
+        self._paused_total += time.time() - self._paused_at
+        self._paused_at = None
+        self.status = RUNNING if self.started_at else QUEUED
+        self._resume.set()
+        self.publish('status', self.progress())
+        if self._on_resume is not None:
+            on_resume, self._on_resume = self._on_resume, None
+            on_resume(self)
+
+    def cancel(self):
+        if self.status in FINISHED_STATES:
+            raise JobError(f"Cannot cancel a {self.status} job")
+        self.status = CANCELLED
+        self.finished_at = time.time()
+        # Wake a paused or waiting job so its runner can stop
+        self._resume.set()
+        self._cancelled.set()
+        self.publish('status', self.progress())
+
+
+class JobManager:
+    """Priority queue of campaign jobs consumed by a fixed number of workers."""
+
+    def __init__(self, workers: int = 2):
+        self.workers = workers
+        self.jobs: Dict[str, CampaignJob] = {}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks: List[asyncio.Task] = []
+        # Transactional jobs running outside the workers
+        self._direct: Set[asyncio.Task] = set()
+        self._sequence = itertools.count()
+
+    def _ensure_workers(self):
+        # Started lazily so the queue binds to the running event loop
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+            self._tasks = [
+                asyncio.create_task(self._worker())
+                for _ in range(self.workers)
+            ]
+
+    def submit(self, job: CampaignJob) -> CampaignJob:
+        self._ensure_workers()
+        self.jobs[job.id] = job
+        delay = job.start_at - time.time() if job.start_at else 0
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._enqueue, job)
+        else:
+            self._enqueue(job)
+        return job
+
+    def _enqueue(self, job: CampaignJob):
+        if not self._ready(job):
+            return
+        if job.priority == TRANSACTIONAL:
+            task = asyncio.create_task(self._run(job))
+            self._direct.add(task)
+            task.add_done_callback(self._direct.discard)
+        else:
+            self._queue.put_nowait((job.priority, next(self._sequence), job))
+
+    def _ready(self, job: CampaignJob) -> bool:
+        """Whether the job can take a worker now; if not, park it off the
+        workers until it can."""
+        if job.status == CANCELLED:
+            return False
+        if job.status == PAUSED:
+            job._on_resume = self._enqueue
+            return False
+        if not job.in_window():
+            opens_at = job.window_opens_at or time.time() + WINDOW_RECHECK_INTERVAL
+            delay = min(max(opens_at - time.time(), 0.0), WINDOW_RECHECK_INTERVAL)
+            asyncio.get_running_loop().call_later(delay, self._enqueue, job)
+            return False
+        return True
+
+    def get(self, job_id: str) -> Optional[CampaignJob]:
+        return self.jobs.get(job_id)
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: CampaignJob):
+        # A job may be paused, cancelled or out of its window by the time
+        # a worker picks it up
+        if not self._ready(job):
+            return
+        job.status = RUNNING
+        job.started_at = time.time()
+        job._paused_total = 0.0
+        job.publish('status', job.progress())
+        try:
+            await job.runner(job)
+            if job.status != CANCELLED:
+                job.status = COMPLETED
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+        finally:
+            if job.finished_at is None:
+                job.finished_at = time.time()
+            job.flush()
+            job.publish('done', job.progress())
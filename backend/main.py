@@ -1,22 +1,39 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional, Dict
+import asyncio
+import functools
 import json
-import pandas as pd
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email.mime.application import MIMEApplication
-from email import encoders
+import math
+import time
+import uuid
 import os
 from pathlib import Path
-from io import BytesIO
-import csv
+
+from backend.attachments import EncodedAttachment
+from backend.compression import CompressionMiddleware
+from backend.fairshare import RelayCapacity, ScheduleError, SendWindow, parse_priority, parse_start_at, parse_weight
+from backend.contact_store import ContactList, ContactListStore, ContactSearchError
+from backend.contact_table import ContactTable
+from backend.ingest import IngestError, parse_upload
+from backend.jobs import (
+    CANCELLED, COMPLETED, FAILED, FINISHED_STATES, MAX_FAILED_DETAILS, PAUSED, QUEUED, RUNNING,
+    CampaignJob, JobError, JobManager
+)
+from backend.messages import MessageBuilder, message_scheduler
+from backend.metrics import REGISTRY, SMTP_SESSIONS_IDLE, UPLOAD_PARSE_SECONDS, UPLOAD_ROWS, CampaignProfiler, Gauge
+from backend.outbox import PERM_FAIL, SENT, TEMP_FAIL, CampaignLog, Outbox
+from backend.providers import ProviderError, load_providers
+from backend.responses import JSONResponse, ndjson_response
+from backend.serialization import dumps, dumps_str, loads
+from backend.smtp_pool import DeliveryError, SessionCache, SMTPConnectionPool
+from backend.spool import SPOOL_FORMATS, SpoolBackend, SpoolConfig, SpoolError
+from backend.templating import compile_template, render as render_template
+from backend.validation import ContactValidator, MXChecker
 
 app = FastAPI()
 
@@ -28,17 +45,109 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# gzip (or brotli) for clients that accept it, see backend/compression.py
+app.add_middleware(CompressionMiddleware)
 
 # Get the absolute path to the frontend directory
 FRONTEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "frontend"))
 
 # Mount static files
 app.mount("/static", StaticFiles(directory=os.path.join(FRONTEND_DIR, "static")), name="static")
-templates = Jinja2Templates(directory=os.path.join(FRONTEND_DIR, "templates"))
+
+@functools.lru_cache(maxsize=None)
+def page_templates():
+    # Only the index page renders a template, so jinja2 loads on its first request
+    from fastapi.templating import Jinja2Templates
+    return Jinja2Templates(directory=os.path.join(FRONTEND_DIR, "templates"))
+
+# SMTP relays (Hostinger by default), see backend/providers.py
+providers = load_providers()
+# Authenticated sessions stay warm between campaigns for this many seconds
+smtp_sessions = SessionCache(idle_timeout=float(os.environ.get("SMTP_SESSION_IDLE_TIMEOUT", "60")))
+SMTP_SESSIONS_IDLE.set_function(smtp_sessions.idle_count)
+# Each provider's rate is shared by all running campaigns, by priority and weight
+relay_capacity = RelayCapacity()
+# Worker processes per campaign, each with its own SMTP pool (1 = send in-process)
+MAX_SEND_PROCESSES = int(os.environ.get("MAX_SEND_PROCESSES", str(os.cpu_count() or 1)))
+SEND_PROCESSES = min(int(os.environ.get("SEND_PROCESSES", "1")), MAX_SEND_PROCESSES)
+
+# Uploaded contact lists live server-side and are referenced by id
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data"))
+contact_store = ContactListStore(os.environ.get("CONTACT_DB", os.path.join(DATA_DIR, "contacts.db")))
+UPLOAD_PREVIEW_ROWS = 100
+MAX_PAGE_SIZE = 1000
+# Campaigns sent in-process load lists up to this size into a compact
+# ContactTable once, instead of re-reading SQLite for validation, sending
+# and every retry round (about 100 bytes per contact)
+CONTACT_TABLE_MAX_ROWS = int(os.environ.get("CONTACT_TABLE_MAX_ROWS", "2000000"))
+
+# Per recipient domain and relay-wide send rates (messages/sec, unset = unlimited)
+DOMAIN_RATE = float(os.environ["DOMAIN_RATE"]) if os.environ.get("DOMAIN_RATE") else None
+DOMAIN_BURST = float(os.environ.get("DOMAIN_BURST", "5"))
+
+# MX lookups are cached across campaigns
+mx_checker = MXChecker(ttl=float(os.environ.get("MX_CACHE_TTL", "3600")))
+
+# Every campaign's delivery states are logged so it can be resumed after a crash
+outbox = Outbox(os.environ.get("OUTBOX_DB", os.path.join(DATA_DIR, "outbox.db")))
+# Temporary (4xx) failures are retried with exponential backoff
+RETRY_MAX_ATTEMPTS = int(os.environ.get("RETRY_MAX_ATTEMPTS", "4"))
+RETRY_BASE_DELAY = float(os.environ.get("RETRY_BASE_DELAY", "30"))
+RETRY_POLL_INTERVAL = 1.0
+
+# Recipients with identical rendered content are sent as one transaction
+# with up to this many RCPT TO (1 = one message per recipient)
+MAX_RECIPIENTS_PER_MESSAGE = int(os.environ.get("MAX_RECIPIENTS_PER_MESSAGE", "1"))
+
+# Campaigns are sent in the background by a small pool of workers
+job_manager = JobManager(workers=int(os.environ.get("CAMPAIGN_WORKERS", "2")))
+
+# cProfile dumps of campaigns sent with "profile": true
+PROFILE_DIR = os.path.join(DATA_DIR, "profiles")
+
+# Campaigns sent with "delivery": "maildir" or "eml" are written under
+# here, one directory per campaign, instead of going out over SMTP
+SPOOL_DIR = os.environ.get("SPOOL_DIR", os.path.join(DATA_DIR, "spool"))
+
+def spool_config(config_data: Dict, campaign_id: str) -> Optional[SpoolConfig]:
+    """The campaign's spool settings, or None when it is sent over SMTP."""
+    delivery = config_data.get('delivery', 'smtp')
+    if delivery == 'smtp':
+        return None
+    if delivery not in SPOOL_FORMATS:
+        raise SpoolError(f"Unknown delivery mode: {delivery}")
+    return SpoolConfig(
+        os.path.join(SPOOL_DIR, campaign_id),
+        format=delivery,
+        compress=bool(config_data.get('spool_compress', False)),
+        fsync=bool(config_data.get('spool_fsync', True))
+    )
+
+def _active_jobs():
+    return [job for job in job_manager.jobs.values() if job.status in (RUNNING, PAUSED)]
+
+Gauge('mailer_campaigns_queued', 'Campaigns waiting for a worker.').set_function(
+    lambda: sum(job.status == QUEUED for job in job_manager.jobs.values())
+)
+Gauge('mailer_campaigns_active', 'Campaigns running or paused.').set_function(lambda: len(_active_jobs()))
+Gauge('mailer_delivery_queue_depth', 'Recipients read ahead and waiting in campaign schedulers.').set_function(
+    lambda: sum(job.scheduler.stats()['queued'] for job in _active_jobs() if job.scheduler)
+)
+Gauge('mailer_retry_queue_depth', 'Recipients waiting to be retried after a temporary failure.').set_function(
+    lambda: sum(job.deferred for job in _active_jobs())
+)
+
+@app.on_event("shutdown")
+def close_smtp_sessions():
+    smtp_sessions.close_all()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    return page_templates().TemplateResponse("index.html", {"request": request})
 
 class EmailConfig(BaseModel):
     sender_email: str
@@ -52,240 +161,644 @@ class Contact(BaseModel):
     Email: str
     LinkedIn_ID: Optional[str] = None
 
+def ingest_upload(filename: str, fileobj, overrides: Optional[Dict[str, str]]):
+    # Parse the upload as a stream and spool contacts to the list store
+    file_format = Path(filename).suffix.lstrip('.').lower() or 'unknown'
+    with UPLOAD_PARSE_SECONDS.time(file_format):
+        parsed = parse_upload(filename, fileobj, overrides)
+        contact_list = contact_store.create(filename, parsed)
+    UPLOAD_ROWS.labels(file_format).inc(contact_list.total)
+    return contact_list, parsed.mapping
+
 @app.post("/api/upload-contacts")
-async def upload_contacts(file: UploadFile = File(...)):
+async def upload_contacts(file: UploadFile = File(...), column_map: Optional[str] = Form(None)):
     try:
-        content = await file.read()
-        
-        if file.filename.endswith('.json'):
-            # Parse JSON file
-            contacts_data = json.loads(content.decode())
-            # Ensure it's a list
-            if not isinstance(contacts_data, list):
-                contacts_data = [contacts_data]
-            
-            # Standardize field names
-            standardized_contacts = []
-            for contact in contacts_data:
-                standardized_contact = {}
-                for key, value in contact.items():
-                    # Convert keys to lowercase for comparison
-                    key_lower = key.lower()
-                    if 'name' in key_lower:
-                        standardized_contact['name'] = value
-                    elif 'email' in key_lower:
-                        standardized_contact['email'] = value
-                    elif 'designation' in key_lower:
-                        standardized_contact['designation'] = value
-                    elif 'linkedin' in key_lower:
-                        standardized_contact['linkedin'] = value
-                    else:
-                        standardized_contact[key] = value
-                standardized_contacts.append(standardized_contact)
-            
-            return standardized_contacts
-            
-        elif file.filename.endswith('.csv'):
-            # Parse CSV file
-            csv_content = content.decode().splitlines()
-            csv_reader = csv.DictReader(csv_content)
-            contacts_data = list(csv_reader)
-            
-            # Standardize field names
-            standardized_contacts = []
-            for contact in contacts_data:
-                standardized_contact = {}
-                for key, value in contact.items():
-                    # Convert keys to lowercase for comparison
-                    key_lower = key.lower()
-                    if 'name' in key_lower:
-                        standardized_contact['name'] = value
-                    elif 'email' in key_lower:
-                        standardized_contact['email'] = value
-                    elif 'designation' in key_lower:
-                        standardized_contact['designation'] = value
-                    elif 'linkedin' in key_lower:
-                        standardized_contact['linkedin'] = value
-                    else:
-                        standardized_contact[key] = value
-                standardized_contacts.append(standardized_contact)
-            
-            return standardized_contacts
-            
-        elif file.filename.endswith(('.xlsx', '.xls')):
-            # Parse Excel file
-            df = pd.read_excel(BytesIO(content))
-            contacts_data = df.to_dict('records')
-            
-            # Standardize field names
-            standardized_contacts = []
-            for contact in contacts_data:
-                standardized_contact = {}
-                for key, value in contact.items():
-                    # Convert keys to lowercase for comparison
-                    if isinstance(key, str):  # Handle non-string column names
-                        key_lower = key.lower()
-                        if 'name' in key_lower:
-                            standardized_contact['name'] = value
-                        elif 'email' in key_lower:
-                            standardized_contact['email'] = value
-                        elif 'designation' in key_lower:
-                            standardized_contact['designation'] = value
-                        elif 'linkedin' in key_lower:
-                            standardized_contact['linkedin'] = value
-                        else:
-                            standardized_contact[key] = value
-                standardized_contacts.append(standardized_contact)
-            
-            return standardized_contacts
-        
-        else:
-            raise HTTPException(
-                status_code=400,
-                detail="Unsupported file format. Please upload a JSON, CSV, or Excel file."
-            )
+        # Optional explicit {"Header": "field"} overrides for the column mapping
+        overrides = loads(column_map) if column_map else None
+        contact_list, mapping = await run_in_threadpool(ingest_upload, file.filename, file.file, overrides)
+
+        return JSONResponse({
+            **contact_list.summary(),
+            'mapping': mapping.as_dict() if mapping else None,
+            'preview': contact_list.head(UPLOAD_PREVIEW_ROWS)
+        })
 
     except json.JSONDecodeError:
-        raise HTTPException(status_code=400, detail="Invalid JSON file")
+        raise HTTPException(status_code=400, detail="Invalid column_map JSON")
+    except IngestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="File is not valid UTF-8 text")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def get_contact_list_or_404(list_id: str):
+    contact_list = contact_store.get(list_id)
+    if contact_list is None:
+        raise HTTPException(status_code=404, detail="Contact list not found")
+    return contact_list
+
+@app.get("/api/contact-lists")
+async def list_contact_lists():
+    return [contact_list.summary() for contact_list in contact_store.all()]
+
+@app.get("/api/contact-lists/{list_id}")
+async def get_contact_list(list_id: str):
+    return get_contact_list_or_404(list_id).summary()
+
+def search_contacts(contact_list: ContactList, offset: int, limit: int, query: Optional[str], filters: Optional[Dict]):
+    rows = contact_list.search(offset, limit, query, filters)
+    return {
+        'list_id': contact_list.id,
+        'total': contact_list.total,
+        'matched': contact_list.count(query, filters),
+        'offset': offset,
+        'limit': limit,
+        'rows': [row for row, _ in rows],
+        'contacts': [contact for _, contact in rows]
+    }
+
+def parse_filters(filters: Optional[str]) -> Optional[Dict]:
+    try:
+        column_filters = loads(filters) if filters else None
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid filters JSON")
+    if column_filters is not None and not isinstance(column_filters, dict):
+        raise HTTPException(status_code=400, detail="filters must be a JSON object")
+    return column_filters
+
+@app.get("/api/contact-lists/{list_id}/contacts")
+async def get_contact_list_page(
+    list_id: str,
+    offset: int = 0,
+    limit: int = UPLOAD_PREVIEW_ROWS,
+    q: Optional[str] = None,
+    filters: Optional[str] = None
+):
+    """One page of a list, optionally narrowed by a search over every column
+    (`q`) and per-column substring filters (`filters`, JSON {"column": "text"}).
+
+    `matched` counts the contacts that satisfy the search, and `rows` gives
+    each returned contact's row number in the list.
+    """
+    contact_list = get_contact_list_or_404(list_id)
+    offset = max(offset, 0)
+    limit = min(max(limit, 1), MAX_PAGE_SIZE)
+    column_filters = parse_filters(filters)
+    try:
+        return JSONResponse(await run_in_threadpool(search_contacts, contact_list, offset, limit, q, column_filters))
+    except ContactSearchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def export_lines(contact_list: ContactList, format: str, query: Optional[str], filters: Optional[Dict]):
+    matches = contact_list.iter_search(query, filters)
+    if format == 'ndjson':
+        # The stored JSON text goes out as it is, without decoding
+        for row, data in matches:
+            yield b'{"row":%d,"contact":%s}' % (row, data.encode('utf-8'))
+    else:
+        columns = contact_list.columns
+        yield dumps(['row', *columns])
+        for row, data in matches:
+            contact = loads(data)
+            yield dumps([row, *(contact.get(column) for column in columns)])
+
+@app.get("/api/contact-lists/{list_id}/export")
+async def export_contact_list(
+    list_id: str,
+    format: str = 'ndjson',
+    q: Optional[str] = None,
+    filters: Optional[str] = None
+):
+    """Every contact matching the (optional) search, streamed as NDJSON.
+
+    `format=ndjson` sends one {"row", "contact"} object per line;
+    `format=columns` sends the column names as the first line and then one
+    [row, value, ...] array per contact, about half the size.
+    """
+    contact_list = get_contact_list_or_404(list_id)
+    if format not in ('ndjson', 'columns'):
+        raise HTTPException(status_code=400, detail="format must be ndjson or columns")
+    column_filters = parse_filters(filters)
+    try:
+        # Check the filters before the response starts
+        await run_in_threadpool(contact_list.count, q, column_filters)
+    except ContactSearchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ndjson_response(
+        export_lines(contact_list, format, q, column_filters),
+        filename=f"{list_id}.{format}.ndjson"
+    )
+
+@app.post("/api/contact-lists/{list_id}/validate")
+async def validate_contact_list(list_id: str, check_mx: bool = False):
+    contact_list = get_contact_list_or_404(list_id)
+    validator = ContactValidator(mx_checker if check_mx else None)
+    report = await run_in_threadpool(validator.scan, contact_list)
+    return report.summary()
+
+@app.delete("/api/contact-lists/{list_id}")
+async def delete_contact_list(list_id: str):
+    if not contact_store.delete(list_id):
+        raise HTTPException(status_code=404, detail="Contact list not found")
+    return {'deleted': list_id}
+
 @app.post("/api/preview-email")
 async def preview_email(
     subject_template: str = Form(...),
     body_template: str = Form(...),
-    name: str = Form(...),
-    designation: str = Form(...),
-    linkedin: str = Form(...)
+    name: str = Form(''),
+    designation: str = Form(''),
+    linkedin: str = Form(''),
+    contact: Optional[str] = Form(None)
 ):
     try:
-        # Create sample data
+        # Create sample data; a full sample contact (JSON) may add any
+        # columns, and its values win over the individual fields
+        contact_data = json.loads(contact) if contact else {}
+        if not isinstance(contact_data, dict):
+            raise HTTPException(status_code=400, detail="contact must be a JSON object")
         sample_data = {
-            'name': name,
-            'designation': designation,
-            'linkedin': linkedin
+            key: value
+            for key, value in (('name', name), ('designation', designation), ('linkedin', linkedin))
+            if value
         }
-
-        # Replace template variables
-        subject = subject_template
-        body = body_template
-
-        for key, value in sample_data.items():
-            placeholder = '{' + key + '}'
-            subject = subject.replace(placeholder, value)
-            body = body.replace(placeholder, value)
+        sample_data.update(contact_data)
 
         return {
-            'subject': subject,
-            'body': body
+            'subject': render_template(subject_template, sample_data),
+            'body': render_template(body_template, sample_data)
         }
 
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON data")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+class CampaignConfigError(ValueError):
+    pass
+
+def _config_number(key: str, value, cast=float, minimum: float = 0.0, maximum: Optional[float] = None,
+                   inclusive: bool = True):
+    # None when unset; numeric strings are accepted like the form fields they come from
+    if value is None:
+        return None
+    try:
+        if isinstance(value, bool):
+            raise ValueError(value)
+        number = float(value)
+        if not math.isfinite(number) or (cast is int and not number.is_integer()):
+            raise ValueError(value)
+    except (TypeError, ValueError):
+        kind = "a whole number" if cast is int else "a number"
+        raise CampaignConfigError(f"{key} must be {kind}, got {value!r}") from None
+    if number < minimum or (not inclusive and number == minimum) or (maximum is not None and number > maximum):
+        bound = f"{'at least' if inclusive else 'above'} {minimum:g}"
+        if maximum is not None:
+            bound += f" and at most {maximum:g}"
+        raise CampaignConfigError(f"{key} must be {bound}")
+    return cast(number)
+
+def campaign_options(config_data: Dict) -> Dict:
+    """The campaign's numeric settings, parsed; None for those left unset.
+
+    Raises CampaignConfigError, so bad values are rejected before a
+    campaign is stored rather than failing inside the job.
+    """
+    def number(key, cast=float, minimum=0.0, maximum=None, inclusive=True):
+        return _config_number(key, config_data.get(key), cast, minimum, maximum, inclusive)
+
+    options = {
+        'pool_size': number('pool_size', int, 1),
+        'max_recipients_per_message': number('max_recipients_per_message', int, 1),
+        'max_attempts': number('max_attempts', int, 1),
+        'retry_base_delay': number('retry_base_delay'),
+        'abort_failure_rate': number('abort_failure_rate', maximum=1.0),
+        'domain_rate': number('domain_rate', inclusive=False),
+        'domain_burst': number('domain_burst', inclusive=False),
+        'provider_rate': number('provider_rate', inclusive=False),
+        'domain_rates': None
+    }
+    domain_rates = config_data.get('domain_rates')
+    if domain_rates is not None:
+        if not isinstance(domain_rates, dict):
+            raise CampaignConfigError("domain_rates must be an object of domain: messages/sec")
+        options['domain_rates'] = {
+            str(domain): _config_number(f"domain_rates[{domain}]", rate, inclusive=False)
+            for domain, rate in domain_rates.items()
+            if rate is not None
+        }
+    return options
+
+async def run_campaign(job: CampaignJob, config_data: Dict, contact_list: ContactList, attachments: List[EncodedAttachment]):
+    provider = providers.resolve(config_data.get('provider'), config_data['sender_email'])
+    options = campaign_options(config_data)
+    # No more connections than there are recipients, so small sends reuse one warm session
+    pool_size = options['pool_size'] or provider.pool_size
+    pool_config = provider.pool_config(max(1, min(pool_size, contact_list.total)))
+    spool = spool_config(config_data, job.id)
+    log = CampaignLog(
+        outbox,
+        job.id,
+        max_attempts=options['max_attempts'] or RETRY_MAX_ATTEMPTS,
+        base_delay=RETRY_BASE_DELAY if options['retry_base_delay'] is None else options['retry_base_delay']
+    )
+
+    # Parse templates once for the whole campaign
+    builder = MessageBuilder(
+        config_data['sender_email'],
+        compile_template(config_data['subject_template'], contact_list.columns),
+        compile_template(config_data['body_template'], contact_list.columns),
+        attachments
+    )
+    # The relay's own rate is enforced by the shared capacity; a campaign
+    # can set a lower `provider_rate` of its own on top
+    max_group = options['max_recipients_per_message'] or MAX_RECIPIENTS_PER_MESSAGE
+    schedule_options = {
+        'domain_rate': options['domain_rate'] if 'domain_rate' in config_data else DOMAIN_RATE,
+        'domain_burst': options['domain_burst'] or DOMAIN_BURST,
+        'domain_rates': options['domain_rates'],
+        'provider_rate': options['provider_rate'],
+        'max_group': min(max_group, provider.max_recipients)
+    }
+    if spool:
+        # The relay's limits don't apply to files; only rates set on the campaign do
+        schedule_options['domain_rate'] = options['domain_rate']
+        schedule_options['max_group'] = max_group
+    weight = parse_weight(config_data.get('weight'))
+
+    # With several processes the workers read their own rows from the store
+    # Clamped too, for campaigns resumed with a config stored on a larger machine
+    processes = min(int(config_data.get('processes', SEND_PROCESSES)), MAX_SEND_PROCESSES)
+    contacts = contact_list
+    if processes <= 1 and contact_list.total <= CONTACT_TABLE_MAX_ROWS:
+        contacts = await run_in_threadpool(ContactTable.from_contacts, contact_list)
+
+    # Drop invalid and duplicate recipients before opening any connection
+    validator = ContactValidator(mx_checker if config_data.get('check_mx') else None)
+    report = await run_in_threadpool(validator.scan, contacts)
+    job.record_validation(report.summary())
+    rejected_rows = report.rejected_rows
+
+    # Skip everything an earlier run of this campaign already finished
+    done_rows = await run_in_threadpool(outbox.done_rows, job.id, contact_list.total)
+    counts = await run_in_threadpool(outbox.counts, job.id)
+    failures = await run_in_threadpool(outbox.failures, job.id, MAX_FAILED_DETAILS)
+    job.restore(counts[SENT], counts[PERM_FAIL], failures)
+
+    # Everything opened from here on is released in the finally below
+    if spool:
+        pool = SpoolBackend(spool)
+    else:
+        pool = SMTPConnectionPool(
+            pool_config,
+            config_data['sender_email'],
+            config_data.get('sender_password', ''),
+            sessions=smtp_sessions
+        )
+    share = None
+    await log.start()
+    try:
+        job.deferred = len(log.retries)
+        for row, (email, reason) in rejected_rows.items():
+            if not done_rows[row]:
+                log.reject(row, email, reason)
+
+        async def start_pool():
+            try:
+                await pool.start()
+            except DeliveryError as delivery_error:
+                kind = "Spool" if spool else "SMTP"
+                raise Exception(f"{kind} Error: {str(delivery_error)}")
+
+        # With several processes the workers open their own pools; this one is
+        # only needed for retry rounds
+        if processes <= 1:
+            await start_pool()
+
+        if not spool:
+            share = relay_capacity.share(provider.name, provider.rate, job.id, weight=weight, priority=job.priority)
+
+        def skip(row):
+            # Rows waiting for a retry are picked up by the retry rounds below
+            return done_rows[row] or row in rejected_rows or row in log.retries
+
+        def fetch_rows(rows):
+            return [(row, contacts.row(row)) for row in rows]
+
+        def schedule(items, blocking=False):
+            # Interleave recipient domains and pace each of them
+            scheduler = message_scheduler(
+                items, builder, stop=lambda: job.status == CANCELLED, capacity=share, blocking=blocking,
+                **schedule_options
+            )
+            if job.scheduler is not None:
+                # Retry rounds keep each domain's learned rate and backoff
+                scheduler.domains = job.scheduler.domains
+            job.scheduler = scheduler
+            return scheduler
+
+        async def send_in_shards():
+            # multiprocessing and the worker side are only loaded for sharded campaigns
+            from backend.shards import ShardSpec, plan_shards, send_sharded
+
+            by_domain = bool(schedule_options['domain_rate'] or schedule_options['domain_rates'])
+            assignment = bytes(await run_in_threadpool(plan_shards, contact_list, processes, skip, by_domain))
+            provider_rate = schedule_options['provider_rate']
+            shard_options = {**schedule_options, 'provider_rate': provider_rate / processes if provider_rate else None}
+            specs = [
+                ShardSpec(
+                    index=index,
+                    contact_db=contact_list.store.path,
+                    list_id=contact_list.id,
+                    assignment=assignment,
+                    pool_config=pool_config,
+                    username=config_data['sender_email'],
+                    password=config_data.get('sender_password', ''),
+                    sender_email=config_data['sender_email'],
+                    subject_template=config_data['subject_template'],
+                    body_template=config_data['body_template'],
+                    attachments=attachments,
+                    schedule_options=shard_options,
+                    spool=spool
+                )
+                for index in range(processes)
+            ]
+            await send_sharded(
+                specs,
+                on_result,
+                is_paused=lambda: job.status == PAUSED or not job.in_window(),
+                is_cancelled=lambda: job.status == CANCELLED,
+                capacity=share if share and share.capacity.rate else None
+            )
+            if log.retries and job.status != CANCELLED:
+                await start_pool()
+
+        def on_result(result):
+            state = log.record(result.tag, result.email, result.ok, result.temporary, result.code, result.error)
+            if state != TEMP_FAIL:
+                job.record(result.ok, result.email, result.error)
+            job.deferred = len(log.retries)
+
+        # Send emails
+        if processes > 1:
+            await send_in_shards()
+        else:
+            await pool.send_all(
+                # Rows of lists too large for a ContactTable are paged from the store
+                schedule(contacts.iter_rows(lambda row: not skip(row)), blocking=contacts is contact_list),
+                on_result=on_result,
+                checkpoint=job.checkpoint
+            )
+
+        # Retry temporary failures as their backoff expires
+        while log.retries and await job.checkpoint():
+            rows = log.due_retries()
+            if not rows:
+                wait = log.next_retry_at() - time.time()
+                await asyncio.sleep(min(max(wait, 0.0), RETRY_POLL_INTERVAL))
+                continue
+            items = await run_in_threadpool(fetch_rows, rows)
+            await pool.send_all(schedule(items), on_result=on_result, checkpoint=job.checkpoint)
+    finally:
+        if share:
+            share.close()
+        await pool.close()
+        await log.close()
+
+def campaign_runner(config_data: Dict, contact_list: ContactList, attachments: List[EncodedAttachment]):
+    # Mirror the job's outcome into the delivery log
+    async def runner(job):
+        await run_in_threadpool(outbox.set_status, job.id, RUNNING)
+        profiler = CampaignProfiler() if config_data.get('profile') else None
+        if profiler and not profiler.start():
+            job.profile = "Not profiled: another campaign was already being profiled"
+            profiler = None
+        try:
+            await run_campaign(job, config_data, contact_list, attachments)
+        except Exception:
+            await run_in_threadpool(outbox.set_status, job.id, FAILED)
+            raise
+        finally:
+            if profiler:
+                profiler.stop()
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                profiler.dump(os.path.join(PROFILE_DIR, f"{job.id}.prof"))
+                job.profile = profiler.report()
+        await run_in_threadpool(outbox.set_status, job.id, CANCELLED if job.status == CANCELLED else COMPLETED)
+    return runner
+
+def submit_campaign(job_id: Optional[str], config_data: Dict, contact_list: ContactList,
+                    attachments: List[EncodedAttachment]) -> CampaignJob:
+    return job_manager.submit(CampaignJob(
+        contact_list.total,
+        campaign_runner(config_data, contact_list, attachments),
+        abort_failure_rate=campaign_options(config_data)['abort_failure_rate'],
+        job_id=job_id,
+        priority=parse_priority(config_data.get('priority')),
+        start_at=parse_start_at(config_data.get('start_at')),
+        window=SendWindow.from_config(config_data.get('send_window'))
+    ))
+
+def validate_schedule(config_data: Dict):
+    """Raise ScheduleError for bad priority, weight, start_at or send_window settings."""
+    parse_priority(config_data.get('priority'))
+    parse_weight(config_data.get('weight'))
+    parse_start_at(config_data.get('start_at'))
+    SendWindow.from_config(config_data.get('send_window'))
+
+def validate_campaign_config(config_data) -> Optional[str]:
+    """What is wrong with a campaign config, if anything (checked before queueing)."""
+    if not isinstance(config_data, dict):
+        return "config must be a JSON object"
+    required = ['sender_email', 'subject_template', 'body_template']
+    if config_data.get('delivery', 'smtp') == 'smtp':
+        # May be empty for relays without authentication, but must be given
+        required.append('sender_password')
+    missing = [key for key in required if not isinstance(config_data.get(key), str)]
+    if missing:
+        return f"Missing or invalid config fields: {', '.join(missing)}"
+    if not config_data['sender_email'].strip():
+        return "sender_email can't be empty"
+    try:
+        processes = int(config_data.get('processes', SEND_PROCESSES))
+    except (TypeError, ValueError):
+        processes = 0
+    if not 1 <= processes <= MAX_SEND_PROCESSES:
+        return f"processes must be a whole number from 1 to {MAX_SEND_PROCESSES}"
+    try:
+        campaign_options(config_data)
+    except CampaignConfigError as e:
+        return str(e)
+    return None
+
+def parse_inline_contacts(contacts: str) -> List[Dict]:
+    data = loads(contacts)
+    if not isinstance(data, list) or not all(isinstance(contact, dict) for contact in data):
+        raise HTTPException(status_code=400, detail="contacts must be a JSON array of objects")
+    return data
+
 @app.post("/api/send-emails")
 async def send_emails(
     config: str = Form(...),
-    contacts: str = Form(...),
-    attachment: UploadFile = None
+    contacts: Optional[str] = Form(None),
+    list_id: Optional[str] = Form(None),
+    attachment: UploadFile = None,
+    attachments: List[UploadFile] = File(None)
 ):
     try:
         # Parse JSON data
-        config_data = json.loads(config)
-        contacts_data = json.loads(contacts)
-
-        # Initialize counters
-        total = len(contacts_data)
-        success = 0
-        failed = 0
-        failed_details = []
-
-        # Hostinger SMTP Settings
-        smtp_server = "smtp.hostinger.com"
-        smtp_port = 465
-        
+        config_data = loads(config)
+        problem = validate_campaign_config(config_data)
+        if problem:
+            raise HTTPException(status_code=400, detail=problem)
         try:
-            server = smtplib.SMTP_SSL(smtp_server, smtp_port)
-            server.login(config_data['sender_email'], config_data['sender_password'])
-
-            # Process attachment if provided
-            attachment_data = None
-            if attachment:
-                contents = await attachment.read()
-                attachment_data = {
-                    'filename': attachment.filename,
-                    'content': contents
-                }
-
-            # Send emails
-            for contact in contacts_data:
-                try:
-                    # Create message
-                    msg = MIMEMultipart()
-                    msg['From'] = config_data['sender_email']
-                    msg['To'] = contact['email']
-                    
-                    # Get email templates
-                    subject_template = config_data['subject_template']
-                    body_template = config_data['body_template']
-                    
-                    # Replace template variables with contact data
-                    subject = subject_template
-                    body = body_template
-                    
-                    # Replace variables in both subject and body
-                    replacements = {
-                        '{name}': contact.get('name', ''),
-                        '{email}': contact.get('email', ''),
-                        '{designation}': contact.get('designation', ''),
-                        '{linkedin}': contact.get('linkedin', '')
-                    }
-                    
-                    for placeholder, value in replacements.items():
-                        subject = subject.replace(placeholder, str(value))
-                        body = body.replace(placeholder, str(value))
-                    
-                    msg['Subject'] = subject
-                    msg.attach(MIMEText(body, 'plain'))
-
-                    # Add attachment if provided
-                    if attachment_data:
-                        part = MIMEBase('application', 'octet-stream')
-                        part.set_payload(attachment_data['content'])
-                        encoders.encode_base64(part)
-                        part.add_header(
-                            'Content-Disposition',
-                            f'attachment; filename="{attachment_data["filename"]}"'
-                        )
-                        msg.attach(part)
-
-                    # Send email
-                    server.send_message(msg)
-                    success += 1
-
-                except Exception as e:
-                    failed += 1
-                    failed_details.append({
-                        'email': contact['email'],
-                        'error': str(e)
-                    })
-
-            server.quit()
-
-        except Exception as smtp_error:
-            raise HTTPException(
-                status_code=500,
-                detail=f"SMTP Error: {str(smtp_error)}"
-            )
+            providers.resolve(config_data.get('provider'), config_data.get('sender_email', ''))
+            spool_config(config_data, '')
+            validate_schedule(config_data)
+        except (ProviderError, SpoolError, ScheduleError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-        return {
-            'success': success,
-            'failed': failed,
-            'total': total,
-            'failed_details': failed_details
-        }
+        # Contacts come from an uploaded list by id, or inline as JSON. Inline
+        # contacts are stored as a list too so the campaign can be resumed.
+        if list_id:
+            contact_list = get_contact_list_or_404(list_id)
+        elif contacts:
+            contact_list = await run_in_threadpool(contact_store.create, 'inline', parse_inline_contacts(contacts))
+        else:
+            raise HTTPException(status_code=400, detail="Either list_id or contacts is required")
+
+        # Encode attachments once, streaming them from the upload spool
+        uploads = ([attachment] if attachment else []) + (attachments or [])
+        encoded_attachments = [
+            await run_in_threadpool(EncodedAttachment.from_fileobj, upload.filename, upload.file, upload.content_type)
+            for upload in uploads
+        ]
 
+        # Log the campaign, queue it and return straight away
+        campaign_id = uuid.uuid4().hex
+        await run_in_threadpool(
+            outbox.create_campaign, campaign_id, contact_list.id, config_data, contact_list.total, encoded_attachments
+        )
+        job = submit_campaign(campaign_id, config_data, contact_list, encoded_attachments)
+        return job.progress()
+
+    except HTTPException:
+        raise
     except json.JSONDecodeError:
         raise HTTPException(status_code=400, detail="Invalid JSON data")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+def get_job_or_404(job_id: str) -> CampaignJob:
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/api/jobs/{job_id}")
+async def job_status(job_id: str):
+    return get_job_or_404(job_id).progress()
+
+@app.get("/api/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    job = get_job_or_404(job_id)
+    return JSONResponse({**job.progress(), **job.result()})
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    job = get_job_or_404(job_id)
+
+    # Server-Sent Events: one "event:"/"data:" pair per delivery batch
+    async def stream():
+        async for event, data in job.events():
+            yield f"event: {event}\ndata: {dumps_str(data)}\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/jobs/{job_id}/profile", response_class=PlainTextResponse)
+async def job_profile(job_id: str):
+    job = get_job_or_404(job_id)
+    if job.profile is None:
+        raise HTTPException(status_code=404, detail="Job was not profiled or is still running")
+    return job.profile
+
+@app.post("/api/jobs/{job_id}/{action}")
+async def job_action(job_id: str, action: str):
+    job = get_job_or_404(job_id)
+    if action not in ('pause', 'resume', 'cancel'):
+        raise HTTPException(status_code=404, detail=f"Unknown job action: {action}")
+    try:
+        getattr(job, action)()
+    except JobError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if action == 'cancel':
+        await run_in_threadpool(outbox.set_status, job.id, CANCELLED)
+    return job.progress()
+
+def get_campaign_or_404(campaign_id: str) -> Dict:
+    campaign = outbox.get_campaign(campaign_id)
+    if campaign is None:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return campaign
+
+@app.get("/api/providers")
+async def list_providers():
+    return {
+        'default': providers.default,
+        'providers': [provider.summary() for provider in providers.all()]
+    }
+
+@app.get("/api/capacity")
+async def capacity():
+    """How each provider's rate is currently shared between running campaigns."""
+    return relay_capacity.summary()
+
+@app.get("/api/campaigns")
+async def list_campaigns():
+    return outbox.list_campaigns()
+
+@app.get("/api/campaigns/{campaign_id}")
+async def get_campaign(campaign_id: str):
+    campaign = get_campaign_or_404(campaign_id)
+    return {**campaign, 'deliveries': outbox.counts(campaign_id)}
+
+def failure_lines(campaign_id: str):
+    for row, email, state, code, error in outbox.iter_failures(campaign_id):
+        yield dumps({'row': row, 'email': email, 'state': state, 'code': code, 'error': error})
+
+@app.get("/api/campaigns/{campaign_id}/failures")
+async def campaign_failures(campaign_id: str):
+    """Every permanently failed or rejected recipient, streamed as NDJSON.
+
+    Unlike `failed_details` in the job result this isn't capped, and it
+    covers earlier runs of a resumed campaign.
+    """
+    get_campaign_or_404(campaign_id)
+    return ndjson_response(failure_lines(campaign_id), filename=f"{campaign_id}.failures.ndjson")
+
+@app.post("/api/campaigns/{campaign_id}/resume")
+async def resume_campaign(campaign_id: str, sender_password: str = Form("")):
+    campaign = get_campaign_or_404(campaign_id)
+    job = job_manager.get(campaign_id)
+    if job is not None and job.status not in FINISHED_STATES:
+        raise HTTPException(status_code=409, detail=f"Campaign is already {job.status}")
+    if campaign['status'] == COMPLETED:
+        raise HTTPException(status_code=409, detail="Campaign has already completed")
+    contact_list = contact_store.get(campaign['list_id'])
+    if contact_list is None:
+        raise HTTPException(status_code=404, detail="The campaign's contact list no longer exists")
+
+    # The password is never stored, so it is supplied again on resume
+    config_data = {**campaign['config'], 'sender_password': sender_password}
+    attachments = await run_in_threadpool(outbox.load_attachments, campaign_id)
+    if not await run_in_threadpool(outbox.claim, campaign_id, QUEUED):
+        raise HTTPException(status_code=409, detail=f"Campaign is {campaign['status']} in another worker")
+    job = submit_campaign(campaign_id, config_data, contact_list, attachments)
+    return job.progress()
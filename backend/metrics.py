@@ -0,0 +1,310 @@
+"""Process-wide metrics in the Prometheus text format.
+
+A small dependency-free registry of counters, gauges and histograms,
+exposed by the app at /metrics. Everything is cheap enough to record on
+the hot path: one perf_counter pair and a locked dict update.
+
+Shard worker processes record into their own registry and ship
+`REGISTRY.drain()` deltas to the coordinator with their results, where
+they are merged, so counters and histograms cover every process. Gauges
+are per process and are not shipped.
+
+CampaignProfiler wraps cProfile for optional per-campaign profiling of
+the event loop thread, which is where templates are rendered and MIME
+messages built.
+"""
+import bisect
+import io
+import threading
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, "_Metric"] = {}
+
+    def register(self, metric: "_Metric"):
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+    def drain(self) -> Dict[str, Dict]:
+        """Return counter and histogram values recorded so far and reset them."""
+        return {
+            name: state
+            for name, metric in self._metrics.items()
+            if metric.kind != 'gauge' and (state := metric.drain())
+        }
+
+    def merge(self, deltas: Dict[str, Dict]):
+        for name, state in deltas.items():
+            metric = self._metrics.get(name)
+            if metric is not None:
+                metric.merge(state)
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Registry = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+        registry.register(self)
+
+    def labels(self, *values) -> "_Child":
+        key = tuple(str(value) for value in values)
+        return _Child(self, key)
+
+    def drain(self) -> Dict:
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+
+class _Child:
+    """A metric bound to one set of label values."""
+    __slots__ = ('metric', 'key')
+
+    def __init__(self, metric: _Metric, key: Tuple[str, ...]):
+        self.metric = metric
+        self.key = key
+
+    def inc(self, amount: float = 1):
+        self.metric._inc(self.key, amount)
+
+    def dec(self, amount: float = 1):
+        self.metric._inc(self.key, -amount)
+
+    def set(self, value: float):
+        self.metric._set(self.key, value)
+
+    def observe(self, value: float):
+        self.metric._observe(self.key, value)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _inc(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def inc(self, amount: float = 1):
+        self._inc((), amount)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+    def merge(self, state: Dict):
+        for key, value in state.items():
+            self._inc(tuple(key), value)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._function: Optional[Callable[[], float]] = None
+
+    def _inc(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _set(self, key, value):
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1):
+        self._inc((), amount)
+
+    def dec(self, amount: float = 1):
+        self._inc((), -amount)
+
+    def set(self, value: float):
+        self._set((), value)
+
+    def set_function(self, function: Callable[[], float]):
+        """Compute the (unlabelled) value at scrape time."""
+        self._function = function
+
+    def samples(self) -> List[str]:
+        if self._function is not None:
+            return [f"{self.name} {_format_value(self._function())}"]
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Registry = REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(buckets)
+
+    def _observe(self, key, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (the last one is +Inf), sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def observe(self, value: float):
+        self._observe((), value)
+
+    def time(self, *labelvalues) -> "_Timer":
+        return _Timer(self, tuple(str(value) for value in labelvalues))
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+    def merge(self, state: Dict):
+        with self._lock:
+            for key, (counts, total) in state.items():
+                key = tuple(key)
+                current = self._values.get(key)
+                if current is None:
+                    self._values[key] = [list(counts), total]
+                else:
+                    current[0] = [a + b for a, b in zip(current[0], counts)]
+                    current[1] += total
+
+
+class _Timer:
+    """Context manager observing the elapsed wall time."""
+    __slots__ = ('histogram', 'key', 'start')
+
+    def __init__(self, histogram: Histogram, key: Tuple[str, ...]):
+        self.histogram = histogram
+        self.key = key
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram._observe(self.key, perf_counter() - self.start)
+
+
+# Delivery pipeline metrics
+
+UPLOAD_PARSE_SECONDS = Histogram(
+    'mailer_upload_parse_seconds', 'Time to parse and store an uploaded contact file.', ['format'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+)
+UPLOAD_ROWS = Counter('mailer_upload_rows_total', 'Contacts parsed from uploads.', ['format'])
+TEMPLATE_RENDER_SECONDS = Histogram('mailer_template_render_seconds', 'Time to render subject and body for one message.')
+MIME_BUILD_SECONDS = Histogram('mailer_mime_build_seconds', 'Time to build and serialize one MIME message.')
+SMTP_SECONDS = Histogram(
+    'mailer_smtp_seconds', 'SMTP latency per stage (connect, login, send).', ['stage']
+)
+SMTP_POOL_WAIT_SECONDS = Histogram('mailer_smtp_pool_wait_seconds', 'Time spent waiting for an idle pooled connection.')
+SMTP_POOL_CONNECTIONS = Gauge('mailer_smtp_pool_connections', 'Open pooled SMTP connections in this process.')
+SMTP_POOL_IN_USE = Gauge('mailer_smtp_pool_in_use', 'Pooled SMTP connections currently sending in this process.')
+SMTP_SESSIONS = Counter('mailer_smtp_sessions_total', 'SMTP sessions handed out, by outcome (reused or opened).', ['outcome'])
+SMTP_SESSIONS_IDLE = Gauge('mailer_smtp_sessions_idle', 'Warm authenticated SMTP sessions kept for reuse in this process.')
+DELIVERIES = Counter('mailer_deliveries_total', 'Recipients attempted, by result and SMTP reply code.', ['result', 'code'])
+SPOOL_FSYNC_SECONDS = Histogram('mailer_spool_fsync_seconds', 'Time to make one batch of spooled messages durable.')
+
+
+# Held by the CampaignProfiler that is running. Enabling a second
+# cProfile.Profile silently takes over from the first one (before Python
+# 3.12), so it can't be relied on to refuse.
+_profiling = threading.Lock()
+
+
+class CampaignProfiler:
+    """cProfile over the event loop thread for the duration of a campaign.
+
+    Only one profiler can run per process at a time; `start()` returns
+    False if another campaign is already being profiled.
+    """
+
+    def __init__(self):
+        # Imported here; profiling is rare and pstats is slow to load
+        import cProfile
+        self._profile = cProfile.Profile()
+        self._running = False
+
+    def start(self) -> bool:
+        if not _profiling.acquire(blocking=False):
+            return False
+        try:
+            self._profile.enable()
+        except ValueError:
+            # Another profiler, e.g. one enabled outside the app
+            _profiling.release()
+            return False
+        self._running = True
+        return True
+
+    def stop(self):
+        if self._running:
+            self._profile.disable()
+            self._running = False
+            _profiling.release()
+
+    def dump(self, path: str):
+        self._profile.dump_stats(path)
+
+    def report(self, limit: int = 40) -> str:
+        import pstats
+        out = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=out)
+        stats.sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
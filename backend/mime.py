@@ -0,0 +1,137 @@
+"""Wire-format campaign messages without the email package per message.
+
+Building a MIMEMultipart for every recipient and running it through the
+email generator costs far more than rendering the templates. Within a
+campaign only To, Subject and the body change, so MessageSkeleton
+serializes everything else once (top-level headers, boundary, encoded
+attachment parts) and each message is a join of byte strings.
+
+The output has the structure email.mime produced for these messages:
+multipart/mixed, a text/plain part (7bit when it is ASCII with short
+lines, base64 UTF-8 otherwise), then the attachments. Non-ASCII subjects
+and display names are RFC 2047 encoded, and Date and Message-ID are set.
+"""
+import base64
+import re
+import time
+import uuid
+from email.header import Header
+from email.policy import compat32
+from email.utils import formataddr, formatdate, parseaddr
+from typing import List, Tuple
+
+from backend.attachments import EncodedAttachment
+
+# Messages go on the wire with CRLF line endings
+SMTP_POLICY = compat32.clone(linesep='\r\n')
+
+# RFC 5322 recommends folding header lines at 78 characters
+MAX_HEADER_LINE = 78
+# and forbids lines longer than 998 characters anywhere
+MAX_LINE = 998
+
+_NEWLINE_RE = re.compile(r'\r\n|\r|\n')
+_HEADER_BREAK_RE = re.compile(r'\s*[\r\n]+\s*')
+
+_ASCII_TEXT_HEADERS = (
+    b'Content-Type: text/plain; charset="us-ascii"\r\n'
+    b'MIME-Version: 1.0\r\n'
+    b'Content-Transfer-Encoding: 7bit\r\n\r\n'
+)
+_UTF8_TEXT_HEADERS = (
+    b'Content-Type: text/plain; charset="utf-8"\r\n'
+    b'MIME-Version: 1.0\r\n'
+    b'Content-Transfer-Encoding: base64\r\n\r\n'
+)
+
+
+def _single_line(value: str) -> str:
+    # Template data must not be able to start a new header
+    return _HEADER_BREAK_RE.sub(' ', value) if '\r' in value or '\n' in value else value
+
+
+def encode_header(name: str, value: str) -> bytes:
+    """A folded `Name: value` header line, RFC 2047 encoded if not ASCII."""
+    value = _single_line(value)
+    if value.isascii() and len(name) + len(value) + 2 <= MAX_HEADER_LINE:
+        return f'{name}: {value}\r\n'.encode('ascii')
+    charset = 'us-ascii' if value.isascii() else 'utf-8'
+    encoded = Header(value, charset, header_name=name).encode(linesep='\r\n')
+    return f'{name}: {encoded}\r\n'.encode('ascii')
+
+
+def encode_address(name: str, value: str) -> bytes:
+    """An address header, encoding only the display name when it isn't ASCII."""
+    value = _single_line(value)
+    if value.isascii():
+        return f'{name}: {value}\r\n'.encode('ascii')
+    display_name, address = parseaddr(value)
+    if not address:
+        return encode_header(name, value)
+    if address.isascii():
+        return f'{name}: {formataddr((display_name, address), charset="utf-8")}\r\n'.encode('ascii')
+    # Non-ASCII addresses (SMTPUTF8) can't be encoded and go out as UTF-8
+    if display_name:
+        address = f'{Header(display_name, "utf-8").encode()} <{address}>'
+    return f'{name}: {address}\r\n'.encode('utf-8')
+
+
+def _text_part(body: str) -> bytes:
+    if body.isascii():
+        text = _NEWLINE_RE.sub('\r\n', body)
+        if all(len(line) <= MAX_LINE for line in text.split('\r\n')):
+            return _ASCII_TEXT_HEADERS + text.encode('ascii')
+    encoded = base64.encodebytes(body.encode('utf-8')).replace(b'\n', b'\r\n')
+    return _UTF8_TEXT_HEADERS + encoded
+
+
+def _attachment_part(attachment: EncodedAttachment) -> bytes:
+    return attachment.mime_part().as_bytes(policy=SMTP_POLICY)
+
+
+class MessageSkeleton:
+    """The parts of a campaign's messages that don't change per recipient."""
+
+    def __init__(self, sender_email: str, attachments: List[EncodedAttachment]):
+        self.sender_email = sender_email
+        self.attachments = attachments
+        self.boundary = f'==============={uuid.uuid4().int % 10 ** 19:019d}=='
+        self._delimiter = f'--{self.boundary}'.encode('ascii')
+        self._head = (
+            f'Content-Type: multipart/mixed; boundary="{self.boundary}"\r\n'
+            'MIME-Version: 1.0\r\n'
+        ).encode('ascii') + encode_address('From', sender_email)
+        self._tail = b''.join(
+            b'\r\n' + self._delimiter + b'\r\n' + _attachment_part(attachment)
+            for attachment in attachments
+        ) + b'\r\n' + self._delimiter + b'--\r\n'
+        domain = parseaddr(sender_email)[1].rpartition('@')[2]
+        try:
+            self._message_id_domain = domain.encode('idna').decode('ascii') or 'localhost'
+        except UnicodeError:
+            self._message_id_domain = 'localhost'
+        self._date: Tuple[int, bytes] = (0, b'')
+
+    def _date_header(self) -> bytes:
+        # formatdate() is comparatively slow and only changes once a second
+        now = int(time.time())
+        if self._date[0] != now:
+            self._date = (now, f'Date: {formatdate(now, usegmt=True)}\r\n'.encode('ascii'))
+        return self._date[1]
+
+    def render(self, to: str, subject: str, body: str) -> bytes:
+        """The complete message, ready for sendmail()."""
+        if self.boundary in body:
+            # Vanishingly unlikely, but the body must not contain the delimiter
+            return MessageSkeleton(self.sender_email, self.attachments).render(to, subject, body)
+        return b''.join((
+            self._head,
+            encode_address('To', to),
+            encode_header('Subject', subject),
+            self._date_header(),
+            f'Message-ID: <{uuid.uuid4().hex}@{self._message_id_domain}>\r\n'.encode('ascii'),
+            b'\r\n',
+            self._delimiter, b'\r\n',
+            _text_part(body),
+            self._tail
+        ))
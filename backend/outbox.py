@@ -0,0 +1,356 @@
+"""Durable delivery log for campaigns.
+
+Every campaign and the state of each recipient row (sent, temp_fail,
+perm_fail, rejected) are recorded in SQLite, so a campaign interrupted by
+a crash or restart can be resumed without mailing anyone twice, and
+temporary failures are retried with exponential backoff.
+
+Rows without an entry are pending. State changes are buffered and
+written in batches by CampaignLog, so the log keeps up with thousands of
+messages per second; a crash can lose at most the last unflushed batch,
+whose recipients are then sent again on resume (at-least-once).
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+from backend.attachments import EncodedAttachment
+
+SENT = 'sent'
+TEMP_FAIL = 'temp_fail'
+PERM_FAIL = 'perm_fail'
+REJECTED = 'rejected'
+
+# States that are never sent again
+TERMINAL_STATES = (SENT, PERM_FAIL, REJECTED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS campaigns (
+    id TEXT PRIMARY KEY,
+    list_id TEXT NOT NULL,
+    config TEXT NOT NULL,
+    attachments TEXT NOT NULL DEFAULT '[]',
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    owner_pid INTEGER
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    campaign_id TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    email TEXT,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL,
+    code INTEGER,
+    error TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (campaign_id, row)
+) WITHOUT ROWID;
+"""
+
+UPSERT = """
+INSERT INTO deliveries (campaign_id, row, email, state, attempts, next_attempt_at, code, error, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (campaign_id, row) DO UPDATE SET
+    email = COALESCE(excluded.email, email),
+    state = excluded.state,
+    attempts = excluded.attempts,
+    next_attempt_at = excluded.next_attempt_at,
+    code = excluded.code,
+    error = excluded.error,
+    updated_at = excluded.updated_at
+"""
+
+# Campaign statuses that mean "was running when the process stopped"
+LIVE_STATUSES = ('queued', 'running', 'paused')
+
+CAMPAIGN_COLUMNS = "id, list_id, config, attachments, status, total, created_at, updated_at"
+
+
+def process_alive(pid: int) -> bool:
+    if os.name == 'nt':
+        # os.kill would terminate the process on Windows
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        code = ctypes.c_ulong()
+        try:
+            return bool(kernel32.GetExitCodeProcess(handle, ctypes.byref(code))) and code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Outbox:
+    def __init__(self, path: str):
+        self.path = path
+        self.directory = os.path.dirname(path) or '.'
+        os.makedirs(self.directory, exist_ok=True)
+        self._local = threading.local()
+        conn = self.connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        if 'owner_pid' not in {column[1] for column in conn.execute("PRAGMA table_info(campaigns)")}:
+            conn.execute("ALTER TABLE campaigns ADD COLUMN owner_pid INTEGER")
+        self._sweep_interrupted(conn)
+
+    def _sweep_interrupted(self, conn: sqlite3.Connection):
+        # Live campaigns whose process is gone were interrupted. Other
+        # workers sharing the database keep theirs; a row with our own pid
+        # is left from an earlier process that had the same pid.
+        with conn:
+            rows = conn.execute(
+                f"SELECT id, owner_pid FROM campaigns WHERE status IN ({','.join('?' * len(LIVE_STATUSES))})",
+                LIVE_STATUSES
+            ).fetchall()
+            orphaned = [
+                (campaign_id,) for campaign_id, pid in rows
+                if pid is None or pid == os.getpid() or not process_alive(pid)
+            ]
+            conn.executemany("UPDATE campaigns SET status = 'interrupted' WHERE id = ?", orphaned)
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _attachment_dir(self, campaign_id: str) -> str:
+        return os.path.join(self.directory, 'attachments', campaign_id)
+
+    def create_campaign(self, campaign_id: str, list_id: str, config: Dict, total: int,
+                        attachments: List[EncodedAttachment]):
+        # Credentials are never persisted; they are supplied again on resume
+        config = {key: value for key, value in config.items() if key != 'sender_password'}
+        meta = []
+        if attachments:
+            directory = self._attachment_dir(campaign_id)
+            os.makedirs(directory, exist_ok=True)
+            for index, attachment in enumerate(attachments):
+                with open(os.path.join(directory, f"{index}.b64"), 'w', encoding='ascii') as f:
+                    f.write(attachment.encoded)
+                meta.append({
+                    'filename': attachment.filename,
+                    'content_type': attachment.content_type,
+                    'size': attachment.size
+                })
+        now = time.time()
+        conn = self.connection()
+        with conn:
+            conn.execute(
+                f"INSERT INTO campaigns ({CAMPAIGN_COLUMNS}, owner_pid) VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?)",
+                (campaign_id, list_id, json.dumps(config), json.dumps(meta), total, now, now, os.getpid())
+            )
+
+    def load_attachments(self, campaign_id: str) -> List[EncodedAttachment]:
+        campaign = self.get_campaign(campaign_id)
+        attachments = []
+        for index, meta in enumerate(campaign['attachments'] if campaign else []):
+            with open(os.path.join(self._attachment_dir(campaign_id), f"{index}.b64"), encoding='ascii') as f:
+                attachments.append(EncodedAttachment(meta['filename'], f.read(), meta['size'], meta['content_type']))
+        return attachments
+
+    def set_status(self, campaign_id: str, status: str):
+        # The process that last changed the status owns the campaign
+        conn = self.connection()
+        with conn:
+            conn.execute(
+                "UPDATE campaigns SET status = ?, updated_at = ?, owner_pid = ? WHERE id = ?",
+                (status, time.time(), os.getpid(), campaign_id)
+            )
+
+    def claim(self, campaign_id: str, status: str) -> bool:
+        """set_status, unless another live process owns the campaign and is
+        still sending it. Checked and set in one write transaction so two
+        workers resuming the same campaign can't both win."""
+        conn = self.connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT status, owner_pid FROM campaigns WHERE id = ?", (campaign_id,)).fetchone()
+            if row is not None:
+                current, pid = row
+                if current in LIVE_STATUSES and pid not in (None, os.getpid()) and process_alive(pid):
+                    return False
+            conn.execute(
+                "UPDATE campaigns SET status = ?, updated_at = ?, owner_pid = ? WHERE id = ?",
+                (status, time.time(), os.getpid(), campaign_id)
+            )
+        return True
+
+    def counts(self, campaign_id: str) -> Dict[str, int]:
+        rows = self.connection().execute(
+            "SELECT state, COUNT(*) FROM deliveries WHERE campaign_id = ? GROUP BY state",
+            (campaign_id,)
+        ).fetchall()
+        counts = {SENT: 0, TEMP_FAIL: 0, PERM_FAIL: 0, REJECTED: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def _campaign_from_row(self, row) -> Dict:
+        campaign_id, list_id, config, attachments, status, total, created_at, updated_at = row
+        return {
+            'campaign_id': campaign_id,
+            'list_id': list_id,
+            'config': json.loads(config),
+            'attachments': json.loads(attachments),
+            'status': status,
+            'total': total,
+            'created_at': created_at,
+            'updated_at': updated_at
+        }
+
+    def get_campaign(self, campaign_id: str) -> Optional[Dict]:
+        row = self.connection().execute(
+            f"SELECT {CAMPAIGN_COLUMNS} FROM campaigns WHERE id = ?", (campaign_id,)
+        ).fetchone()
+        return self._campaign_from_row(row) if row else None
+
+    def list_campaigns(self) -> List[Dict]:
+        rows = self.connection().execute(
+            f"SELECT {CAMPAIGN_COLUMNS} FROM campaigns ORDER BY created_at DESC"
+        ).fetchall()
+        return [self._campaign_from_row(row) for row in rows]
+
+    def done_rows(self, campaign_id: str, total: int) -> bytearray:
+        """One byte per row, set for rows in a terminal state."""
+        done = bytearray(total)
+        cursor = self.connection().execute(
+            f"SELECT row FROM deliveries WHERE campaign_id = ? AND state IN ({','.join('?' * len(TERMINAL_STATES))})",
+            (campaign_id, *TERMINAL_STATES)
+        )
+        for row, in cursor:
+            if row < total:
+                done[row] = 1
+        return done
+
+    def failures(self, campaign_id: str, limit: int) -> List[Dict]:
+        """The most recent permanent failures, oldest first."""
+        rows = self.connection().execute(
+            "SELECT email, error FROM deliveries WHERE campaign_id = ? AND state = ? "
+            "ORDER BY updated_at DESC LIMIT ?",
+            (campaign_id, PERM_FAIL, limit)
+        ).fetchall()
+        return [{'email': email, 'error': error} for email, error in reversed(rows)]
+
+    def iter_failures(self, campaign_id: str, batch_size: int = 1000) -> Iterator[tuple]:
+        """(row, email, state, code, error) for every recipient that won't
+        be delivered (permanently failed or rejected), in row order."""
+        offset = 0
+        while True:
+            # Looked up per page: streaming responses run each step on any threadpool thread
+            rows = self.connection().execute(
+                "SELECT row, email, state, code, error FROM deliveries "
+                "WHERE campaign_id = ? AND state IN (?, ?) AND row >= ? ORDER BY row LIMIT ?",
+                (campaign_id, PERM_FAIL, REJECTED, offset, batch_size)
+            ).fetchall()
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            offset = rows[-1][0] + 1
+
+    def retry_rows(self, campaign_id: str) -> Dict[int, tuple]:
+        """row -> (attempts, next_attempt_at) for temporarily failed rows."""
+        cursor = self.connection().execute(
+            "SELECT row, attempts, next_attempt_at FROM deliveries WHERE campaign_id = ? AND state = ?",
+            (campaign_id, TEMP_FAIL)
+        )
+        return {row: (attempts, next_attempt_at or 0.0) for row, attempts, next_attempt_at in cursor}
+
+    def write(self, records: List[tuple]):
+        conn = self.connection()
+        with conn:
+            conn.executemany(UPSERT, records)
+
+
+class CampaignLog:
+    """Buffers one campaign's delivery states and tracks its retries."""
+
+    def __init__(self, outbox: Outbox, campaign_id: str, max_attempts: int = 4,
+                 base_delay: float = 30.0, max_delay: float = 3600.0,
+                 batch_size: int = 500, flush_interval: float = 0.5):
+        self.outbox = outbox
+        self.campaign_id = campaign_id
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # row -> (attempts, next_attempt_at) for rows waiting to be retried
+        self.retries: Dict[int, tuple] = {}
+        self._buffer: List[tuple] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._write_lock = asyncio.Lock()
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.retries = await loop.run_in_executor(None, self.outbox.retry_rows, self.campaign_id)
+        self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        records, self._buffer = self._buffer, []
+        async with self._write_lock:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.outbox.write, records)
+
+    async def close(self):
+        if self._flusher:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+    def _append(self, row: int, email: Optional[str], state: str, attempts: int,
+                next_attempt_at: Optional[float] = None, code: Optional[int] = None, error: Optional[str] = None):
+        self._buffer.append((self.campaign_id, row, email, state, attempts, next_attempt_at, code, error, time.time()))
+        if len(self._buffer) >= self.batch_size:
+            asyncio.ensure_future(self.flush())
+
+    def reject(self, row: int, email: Optional[str], reason: str):
+        self._append(row, email, REJECTED, 0, error=f'rejected by validation: {reason}')
+
+    def record(self, row: int, email: str, ok: bool, temporary: bool = False,
+               code: Optional[int] = None, error: Optional[str] = None) -> str:
+        """Log a delivery attempt and return the row's new state."""
+        attempts = self.retries.pop(row, (0, 0.0))[0] + 1
+        if ok:
+            state = SENT
+            self._append(row, email, state, attempts)
+        elif temporary and attempts < self.max_attempts:
+            state = TEMP_FAIL
+            delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+            next_attempt_at = time.time() + delay
+            self.retries[row] = (attempts, next_attempt_at)
+            self._append(row, email, state, attempts, next_attempt_at, code, error)
+        else:
+            state = PERM_FAIL
+            self._append(row, email, state, attempts, None, code, error)
+        return state
+
+    def due_retries(self, now: Optional[float] = None) -> List[int]:
+        now = now or time.time()
+        return sorted(row for row, (_, next_at) in self.retries.items() if next_at <= now)
+
+    def next_retry_at(self) -> Optional[float]:
+        return min((next_at for _, next_at in self.retries.values()), default=None)
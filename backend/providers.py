@@ -0,0 +1,153 @@
+"""SMTP provider registry.
+
+A provider is a relay (host, port, TLS mode) plus the limits to respect
+when sending through it. Built-in providers can be extended or
+overridden by a JSON file named in SMTP_PROVIDERS_FILE:
+
+    {
+        "default": "hostinger",
+        "providers": {
+            "hostinger": {"host": "smtp.hostinger.com", "port": 465, "security": "ssl"},
+            "relay": {"host": "10.0.0.5", "port": 25, "security": "none",
+                      "pool_size": 16, "rate": 200, "sender_domains": ["example.com"]}
+        }
+    }
+
+Setting any of the ENV_SETTINGS variables (SMTP_HOST, SMTP_PORT, ...)
+defines an "env" provider, on top of the Hostinger defaults, that
+becomes the default. SMTP_PROVIDER picks the default by name.
+
+A campaign uses the provider it names, else the first provider whose
+`sender_domains` contains the sender's domain, else the default.
+"""
+import json
+import os
+from dataclasses import asdict, dataclass, field, fields
+from typing import TYPE_CHECKING, Dict, List, Mapping, Optional
+
+if TYPE_CHECKING:
+    from backend.smtp_pool import PoolConfig
+
+
+class ProviderError(Exception):
+    pass
+
+
+SECURITY_MODES = ('ssl', 'starttls', 'none')
+
+
+@dataclass
+class Provider:
+    name: str
+    host: str
+    port: int = 465
+    # "ssl" (implicit TLS), "starttls" or "none"
+    security: str = "ssl"
+    pool_size: int = 4
+    max_messages_per_connection: int = 100
+    # Most RCPT TO per transaction the relay accepts
+    max_recipients: int = 50
+    # Relay-wide messages/sec, None for unlimited
+    rate: Optional[float] = None
+    timeout: float = 30.0
+    sender_domains: List[str] = field(default_factory=list)
+
+    def __post_init__(self):
+        # Anything unrecognised would otherwise mean plain SMTP, credentials included
+        security = self.security.strip().lower() if isinstance(self.security, str) else self.security
+        if security not in SECURITY_MODES:
+            raise ProviderError(
+                f"Invalid security for SMTP provider {self.name}: {self.security!r} "
+                f"(expected {', '.join(SECURITY_MODES)})"
+            )
+        self.security = security
+
+    def pool_config(self, size: Optional[int] = None) -> "PoolConfig":
+        # Imported here so reading the provider settings (the desktop app
+        # does at startup) doesn't load asyncio, smtplib and ssl
+        from backend.smtp_pool import PoolConfig
+        return PoolConfig(
+            host=self.host,
+            port=self.port,
+            security=self.security,
+            size=size or self.pool_size,
+            max_messages_per_connection=self.max_messages_per_connection,
+            timeout=self.timeout
+        )
+
+    def summary(self) -> Dict:
+        return asdict(self)
+
+
+BUILTIN_PROVIDERS = {
+    'hostinger': Provider('hostinger', 'smtp.hostinger.com', 465, 'ssl'),
+    'gmail': Provider('gmail', 'smtp.gmail.com', 587, 'starttls', pool_size=2, max_recipients=100),
+    'office365': Provider('office365', 'smtp.office365.com', 587, 'starttls', pool_size=2, rate=0.5),
+}
+
+
+ENV_SETTINGS = (
+    'SMTP_HOST', 'SMTP_PORT', 'SMTP_SECURITY', 'SMTP_POOL_SIZE',
+    'SMTP_MAX_MESSAGES_PER_CONNECTION', 'PROVIDER_RATE'
+)
+
+
+class ProviderRegistry:
+    def __init__(self, providers: Mapping[str, Provider], default: str):
+        self.providers = dict(providers)
+        if default not in self.providers:
+            raise ProviderError(f"Unknown default SMTP provider: {default}")
+        self.default = default
+
+    def get(self, name: str) -> Provider:
+        try:
+            return self.providers[name]
+        except KeyError:
+            raise ProviderError(f"Unknown SMTP provider: {name}") from None
+
+    def resolve(self, name: Optional[str], sender_email: str = '') -> Provider:
+        if name:
+            return self.get(name)
+        domain = sender_email.rpartition('@')[2].lower()
+        for provider in self.providers.values():
+            if domain and domain in provider.sender_domains:
+                return provider
+        return self.providers[self.default]
+
+    def all(self) -> List[Provider]:
+        return list(self.providers.values())
+
+
+def _provider_from_dict(name: str, data: Mapping) -> Provider:
+    known = {f.name for f in fields(Provider)}
+    unknown = set(data) - known
+    if unknown:
+        raise ProviderError(f"Unknown settings for SMTP provider {name}: {', '.join(sorted(unknown))}")
+    return Provider(**{**data, 'name': name})
+
+
+def load_providers(environ: Mapping[str, str] = os.environ) -> ProviderRegistry:
+    providers = dict(BUILTIN_PROVIDERS)
+    default = 'hostinger'
+
+    path = environ.get('SMTP_PROVIDERS_FILE')
+    if path:
+        with open(path) as f:
+            config = json.load(f)
+        for name, data in config.get('providers', {}).items():
+            providers[name] = _provider_from_dict(name, data)
+        default = config.get('default', default)
+
+    if any(environ.get(name) for name in ENV_SETTINGS):
+        providers['env'] = Provider(
+            'env',
+            environ.get('SMTP_HOST', 'smtp.hostinger.com'),
+            int(environ.get('SMTP_PORT', '465')),
+            environ.get('SMTP_SECURITY') or 'ssl',
+            pool_size=int(environ.get('SMTP_POOL_SIZE', '4')),
+            max_messages_per_connection=int(environ.get('SMTP_MAX_MESSAGES_PER_CONNECTION', '100')),
+            rate=float(environ['PROVIDER_RATE']) if environ.get('PROVIDER_RATE') else None
+        )
+        default = 'env'
+
+    return ProviderRegistry(providers, environ.get('SMTP_PROVIDER', default))
@@ -0,0 +1,29 @@
+"""Response classes for large API payloads.
+
+FastAPI runs every returned dict through jsonable_encoder before
+encoding it, a second full pass in Python, so endpoints that can return
+thousands of rows build a JSONResponse (orjson, see backend.serialization)
+themselves and skip it.
+
+Lists too big for one response are streamed as NDJSON, one line per
+contact or failure. Lines are produced in batches in the threadpool, so
+SQLite paging and encoding stay off the event loop, and the compression
+middleware (backend.compression) flushes after every batch.
+"""
+from typing import Any, Iterable, Optional
+
+from starlette.responses import JSONResponse as _JSONResponse, StreamingResponse
+
+from backend.serialization import dumps, ndjson_lines
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+
+
+class JSONResponse(_JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def ndjson_response(lines: Iterable[bytes], filename: Optional[str] = None) -> StreamingResponse:
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"'} if filename else None
+    return StreamingResponse(ndjson_lines(lines), media_type=NDJSON_MEDIA_TYPE, headers=headers)
@@ -0,0 +1,42 @@
+"""JSON encoding for API payloads and stored contacts.
+
+orjson is several times faster than the json module in both directions,
+which matters for contact pages, inline contact lists and failure
+reports with tens of thousands of entries, and for the JSON row every
+stored contact is kept as.
+"""
+from typing import Any, Iterable, Iterator
+
+import orjson
+
+# Subclass of json.JSONDecodeError, so existing handlers catch it
+JSONDecodeError = orjson.JSONDecodeError
+
+# Lines per chunk of streamed NDJSON
+NDJSON_BATCH_SIZE = 1000
+
+
+def dumps(value: Any) -> bytes:
+    # Types orjson doesn't know go out as their string form, as they
+    # did with json.dumps(default=str)
+    return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+
+def dumps_str(value: Any) -> str:
+    return dumps(value).decode('utf-8')
+
+
+def loads(data) -> Any:
+    return orjson.loads(data)
+
+
+def ndjson_lines(lines: Iterable[bytes]) -> Iterator[bytes]:
+    """Join encoded lines into NDJSON chunks of NDJSON_BATCH_SIZE lines."""
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= NDJSON_BATCH_SIZE:
+            yield b'\n'.join(batch) + b'\n'
+            batch = []
+    if batch:
+        yield b'\n'.join(batch) + b'\n'
@@ -0,0 +1,293 @@
+"""Multi-process campaign delivery.
+
+MIME serialization, base64 and TLS all cost CPU, so a single process
+tops out at one core. In sharded mode a campaign's rows are split
+between worker processes, each with its own SMTP pool and scheduler.
+Workers stream results (and their metrics, see backend.metrics) back
+over a queue in batches and the coordinator merges them into the
+campaign, relaying pause and cancel the other way.
+
+Rows are assigned by recipient domain when per-domain rates are set, so
+every domain is paced by exactly one process; otherwise they are striped
+by row for an even split. A provider-wide rate is divided between the
+shards. When the relay's rate is shared with other campaigns
+(backend.fairshare), the coordinator draws from the shared capacity and
+hands the grants to the workers as credits on a semaphore, keeping at
+most a fraction of a second's worth outstanding. Spooled campaigns
+(backend.spool) shard the same way, every worker writing its own files
+into the shared spool directory.
+"""
+import asyncio
+import math
+import multiprocessing
+import queue
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from backend.attachments import EncodedAttachment
+from backend.contact_store import ContactList, ContactListStore
+from backend.messages import MessageBuilder, message_scheduler
+from backend.metrics import REGISTRY
+from backend.smtp_pool import DeliveryResult, PoolConfig, SMTPConnectionPool
+from backend.spool import SpoolBackend, SpoolConfig
+from backend.templating import compile_template
+from backend.throttle import domain_of
+
+# Results are sent to the coordinator in batches of this many...
+RESULT_BATCH_SIZE = 100
+# ...or at least this often (seconds)
+RESULT_FLUSH_INTERVAL = 0.2
+# How often workers and the coordinator check for pause/cancel
+CONTROL_POLL_INTERVAL = 0.2
+# Grace period for workers to exit before they are terminated
+JOIN_TIMEOUT = 5.0
+# Seconds of the shared rate granted to workers ahead of their results
+CREDIT_AHEAD = 2 * RESULT_FLUSH_INTERVAL
+
+
+class ShardError(Exception):
+    pass
+
+
+@dataclass
+class ShardSpec:
+    """Everything a worker process needs to send its shard."""
+    index: int
+    contact_db: str
+    list_id: str
+    # Per row: the owning shard's index + 1, or 0 for rows not sent in this pass
+    assignment: bytes
+    pool_config: PoolConfig
+    username: str
+    password: str
+    sender_email: str
+    subject_template: str
+    body_template: str
+    attachments: List[EncodedAttachment]
+    schedule_options: Dict
+    # Write to this spool instead of sending over SMTP
+    spool: Optional[SpoolConfig] = None
+
+
+def plan_shards(contact_list: ContactList, count: int, skip: Callable[[int], bool], by_domain: bool) -> bytearray:
+    """Assign every row to a shard (see ShardSpec.assignment)."""
+    assignment = bytearray(contact_list.total)
+    if by_domain:
+        for row, contact in enumerate(contact_list):
+            if not skip(row):
+                assignment[row] = zlib.crc32(domain_of(contact['email']).encode()) % count + 1
+    else:
+        for row in range(contact_list.total):
+            if not skip(row):
+                assignment[row] = row % count + 1
+    return assignment
+
+
+class ShardCredits:
+    """A worker's side of the shared capacity: one credit per recipient.
+
+    A grouped message needs several credits. They are collected under a
+    lock shared by all workers, so two connections never each hold part
+    of what they need while waiting for the rest.
+    """
+
+    def __init__(self, credits, lock):
+        self.credits = credits
+        self.lock = lock
+
+    def _take(self, count: int, stop: Optional[Callable[[], bool]]) -> bool:
+        while not self.lock.acquire(True, CONTROL_POLL_INTERVAL):
+            if stop is not None and stop():
+                return False
+        try:
+            taken = 0
+            while taken < count:
+                if self.credits.acquire(True, CONTROL_POLL_INTERVAL):
+                    taken += 1
+                elif stop is not None and stop():
+                    # Hand back what was collected for the other workers
+                    for _ in range(taken):
+                        self.credits.release()
+                    return False
+            return True
+        finally:
+            self.lock.release()
+
+    async def acquire(self, count: int = 1, stop: Optional[Callable[[], bool]] = None) -> bool:
+        return await asyncio.get_running_loop().run_in_executor(None, self._take, count, stop)
+
+
+async def _send_shard(spec: ShardSpec, results, running, cancelled, credits=None):
+    contact_list = ContactListStore(spec.contact_db).get(spec.list_id)
+    if contact_list is None:
+        raise ShardError("Contact list not found")
+    if spec.spool:
+        pool = SpoolBackend(spec.spool)
+    else:
+        pool = SMTPConnectionPool(spec.pool_config, spec.username, spec.password)
+    await pool.start()
+    results.put(('ready', spec.index, None, {}))
+
+    builder = MessageBuilder(
+        spec.sender_email,
+        compile_template(spec.subject_template, contact_list.columns),
+        compile_template(spec.body_template, contact_list.columns),
+        spec.attachments
+    )
+    shard, assignment = spec.index + 1, spec.assignment
+    items = contact_list.iter_rows(lambda row: row < len(assignment) and assignment[row] == shard)
+    scheduler = message_scheduler(
+        items, builder, stop=cancelled.is_set,
+        capacity=ShardCredits(*credits) if credits is not None else None,
+        blocking=True,
+        **spec.schedule_options
+    )
+
+    batch = []
+    flushed_at = time.monotonic()
+
+    def flush():
+        nonlocal batch, flushed_at
+        if batch:
+            results.put(('results', spec.index, batch, REGISTRY.drain()))
+            batch = []
+        flushed_at = time.monotonic()
+
+    def on_result(result: DeliveryResult):
+        batch.append((result.tag, result.email, result.ok, result.error, result.code, result.temporary))
+        if len(batch) >= RESULT_BATCH_SIZE or time.monotonic() - flushed_at >= RESULT_FLUSH_INTERVAL:
+            flush()
+
+    async def flush_idle():
+        # Results must reach the coordinator even while sending stalls,
+        # since its credits are only topped up as results come back
+        while True:
+            await asyncio.sleep(RESULT_FLUSH_INTERVAL)
+            if time.monotonic() - flushed_at >= RESULT_FLUSH_INTERVAL:
+                flush()
+
+    async def checkpoint():
+        while not running.is_set() and not cancelled.is_set():
+            await asyncio.sleep(CONTROL_POLL_INTERVAL)
+        return not cancelled.is_set()
+
+    flusher = asyncio.create_task(flush_idle())
+    try:
+        await pool.send_all(scheduler, on_result=on_result, checkpoint=checkpoint)
+    finally:
+        flusher.cancel()
+        flush()
+        await pool.close()
+
+
+def run_shard(spec: ShardSpec, results, running, cancelled, credits=None):
+    """Worker process entry point; sends ('ready', index) once connected and
+    always ends with a ('done', index, error) message."""
+    error = None
+    try:
+        asyncio.run(_send_shard(spec, results, running, cancelled, credits))
+    except Exception as e:
+        error = str(e) or e.__class__.__name__
+    results.put(('done', spec.index, error, REGISTRY.drain()))
+
+
+def _join(processes):
+    for process in processes:
+        process.join(JOIN_TIMEOUT)
+        if process.is_alive():
+            process.terminate()
+
+
+async def send_sharded(
+    specs: List[ShardSpec],
+    on_result: Callable[[DeliveryResult], None],
+    is_paused: Callable[[], bool],
+    is_cancelled: Callable[[], bool],
+    capacity=None
+):
+    """Run one worker process per spec and feed their results to `on_result`.
+
+    `capacity` is the campaign's backend.fairshare.Share of a rate-limited
+    relay, if any.
+    """
+    # spawn, not fork: the parent runs an event loop and thread pools
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    running = context.Event()
+    running.set()
+    cancelled = context.Event()
+    # (credits, lock) shared with the workers, see ShardCredits
+    credits = (context.Semaphore(0), context.Lock()) if capacity is not None else None
+    processes = [
+        context.Process(target=run_shard, args=(spec, results, running, cancelled, credits), daemon=True)
+        for spec in specs
+    ]
+    for process in processes:
+        process.start()
+
+    loop = asyncio.get_running_loop()
+    finished = set()
+    errors: List[str] = []
+    granted = reported = 0
+
+    async def grant_credits():
+        nonlocal granted
+        # Enough for a worker to complete its largest group of recipients
+        group = max(spec.schedule_options.get('max_group', 1) for spec in specs)
+        ahead = max(len(specs), group, math.ceil(capacity.capacity.rate * CREDIT_AHEAD))
+        while True:
+            if granted - reported >= ahead or is_paused():
+                await asyncio.sleep(CONTROL_POLL_INTERVAL / 4)
+                continue
+            if not await capacity.acquire(1, is_cancelled):
+                return
+            credits[0].release()
+            granted += 1
+
+    # Started once a worker is connected, so credits don't pile up
+    # during process startup and then go out in one burst
+    granter = None
+    try:
+        while len(finished) < len(processes):
+            # Relay the job's pause/cancel state to the workers
+            if is_cancelled():
+                cancelled.set()
+            if is_paused():
+                running.clear()
+            else:
+                running.set()
+
+            try:
+                kind, index, payload, metrics = await loop.run_in_executor(None, results.get, True, CONTROL_POLL_INTERVAL)
+            except queue.Empty:
+                # A worker that died without reporting has nothing left in the queue
+                for index, process in enumerate(processes):
+                    if index not in finished and not process.is_alive():
+                        finished.add(index)
+                        errors.append(f"shard {index} exited with code {process.exitcode}")
+                continue
+
+            REGISTRY.merge(metrics)
+            if kind == 'ready':
+                if capacity is not None and granter is None:
+                    granter = loop.create_task(grant_credits())
+            elif kind == 'results':
+                reported += len(payload)
+                for tag, email, ok, error, code, temporary in payload:
+                    on_result(DeliveryResult(email=email, ok=ok, error=error, code=code, temporary=temporary, tag=tag))
+            else:
+                finished.add(index)
+                if payload:
+                    errors.append(f"shard {index}: {payload}")
+    finally:
+        if granter is not None:
+            granter.cancel()
+        if len(finished) < len(processes):
+            cancelled.set()
+        await loop.run_in_executor(None, _join, processes)
+        results.close()
+
+    if errors:
+        raise ShardError("; ".join(errors))
@@ -0,0 +1,559 @@
+"""Bounded pool of authenticated SMTP connections for bulk delivery.
+
+smtplib is blocking, so every connection is driven from its own worker
+thread and the event loop only awaits the results. This keeps the API
+responsive while a campaign is being sent.
+
+A message may have several recipients; it is sent once per transaction
+with one RCPT TO each and yields one result per recipient. When the
+server advertises PIPELINING (RFC 2920) MAIL FROM, every RCPT TO and DATA
+go out in a single write, so a transaction costs two round trips instead
+of one per command.
+
+A SessionCache keeps authenticated sessions warm between pools, keyed by
+relay and credentials, so back-to-back campaigns and one-off sends skip
+the TCP/TLS handshake and AUTH.
+
+The pool is one DeliveryBackend; backend.spool writes messages to disk
+through the same interface instead.
+"""
+import asyncio
+import hashlib
+import re
+import smtplib
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from backend.metrics import (
+    DELIVERIES, SMTP_POOL_CONNECTIONS, SMTP_POOL_IN_USE, SMTP_POOL_WAIT_SECONDS, SMTP_SECONDS, SMTP_SESSIONS
+)
+
+# SMTP reply codes that mean "this session is gone, open a new one"
+RECONNECT_CODES = {421}
+
+_LEADING_DOT_RE = re.compile(rb'(?m)^\.')
+
+_CONNECT_SECONDS = SMTP_SECONDS.labels('connect')
+_LOGIN_SECONDS = SMTP_SECONDS.labels('login')
+_SEND_SECONDS = SMTP_SECONDS.labels('send')
+_SESSIONS_REUSED = SMTP_SESSIONS.labels('reused')
+_SESSIONS_OPENED = SMTP_SESSIONS.labels('opened')
+
+
+@dataclass
+class PoolConfig:
+    host: str = "smtp.hostinger.com"
+    port: int = 465
+    # "ssl" (implicit TLS), "starttls" or "none" (local test servers)
+    security: str = "ssl"
+    size: int = 4
+    max_messages_per_connection: int = 100
+    timeout: float = 30.0
+    max_retries: int = 2
+
+
+@dataclass
+class OutgoingMessage:
+    sender: str
+    recipients: Sequence[str]
+    payload: bytes
+    # Caller's reference (e.g. contact row), copied onto the result
+    tag: Any = None
+    # Per-recipient references for multi-recipient messages, aligned with `recipients`
+    tags: Optional[Sequence[Any]] = None
+
+    def tag_for(self, index: int) -> Any:
+        return self.tags[index] if self.tags is not None else self.tag
+
+
+@dataclass
+class DeliveryResult:
+    email: str
+    ok: bool
+    error: Optional[str] = None
+    code: Optional[int] = None
+    # True for 4xx replies and dropped connections; worth retrying later
+    temporary: bool = False
+    tag: Any = None
+
+
+class DeliveryError(Exception):
+    pass
+
+
+class SMTPPoolError(DeliveryError):
+    pass
+
+
+class MessageSource:
+    """Feeds messages to the pool workers and receives their results."""
+
+    async def get(self) -> Optional[OutgoingMessage]:
+        raise NotImplementedError
+
+    def report(self, message: OutgoingMessage, result: DeliveryResult):
+        pass
+
+
+class IterableSource(MessageSource):
+    def __init__(self, messages: Iterable[OutgoingMessage]):
+        self._iterator = iter(messages)
+
+    async def get(self) -> Optional[OutgoingMessage]:
+        return next(self._iterator, None)
+
+
+class PooledConnection:
+    """A single SMTP session with a message counter for recycling."""
+
+    def __init__(self, config: PoolConfig, username: Optional[str], password: Optional[str]):
+        self.config = config
+        self.username = username
+        self.password = password
+        self.server: Optional[smtplib.SMTP] = None
+        self.sent = 0
+
+    def open(self):
+        config = self.config
+        started = time.perf_counter()
+        if config.security == "ssl":
+            server = smtplib.SMTP_SSL(
+                config.host, config.port,
+                timeout=config.timeout,
+                context=ssl.create_default_context()
+            )
+        elif config.security in ("starttls", "none"):
+            server = smtplib.SMTP(config.host, config.port, timeout=config.timeout)
+            if config.security == "starttls":
+                server.starttls(context=ssl.create_default_context())
+        else:
+            raise ValueError(f"Unknown SMTP security mode: {config.security!r}")
+        _CONNECT_SECONDS.observe(time.perf_counter() - started)
+        try:
+            if self.username and self.password:
+                started = time.perf_counter()
+                server.login(self.username, self.password)
+                _LOGIN_SECONDS.observe(time.perf_counter() - started)
+        except Exception:
+            server.close()
+            raise
+        self.server = server
+        self.sent = 0
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            self.server.close()
+        self.server = None
+
+    def reconnect(self):
+        self.close()
+        self.open()
+
+    def alive(self) -> bool:
+        """Check with a NOOP that the server hasn't dropped the session."""
+        if self.server is None:
+            return False
+        try:
+            return self.server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def send(self, message: OutgoingMessage) -> Dict[str, Tuple[int, bytes]]:
+        """Send one transaction; return the refused recipients like sendmail()."""
+        if self.server is None or self.sent >= self.config.max_messages_per_connection:
+            self.reconnect()
+        server = self.server
+        started = time.perf_counter()
+        try:
+            server.ehlo_or_helo_if_needed()
+            recipients = list(message.recipients)
+            if server.has_extn('pipelining') and message.sender.isascii() and all(r.isascii() for r in recipients):
+                refused = self._send_pipelined(message.sender, recipients, message.payload)
+            else:
+                refused = server.sendmail(message.sender, recipients, message.payload)
+        finally:
+            _SEND_SECONDS.observe(time.perf_counter() - started)
+        self.sent += 1
+        return refused
+
+    def _reset(self):
+        try:
+            self.server.rset()
+        except smtplib.SMTPServerDisconnected:
+            pass
+
+    def _send_pipelined(self, sender: str, recipients: List[str], payload: bytes) -> Dict[str, Tuple[int, bytes]]:
+        server = self.server
+        size = f" SIZE={len(payload)}" if server.has_extn('size') else ''
+        commands = [f"MAIL FROM:{smtplib.quoteaddr(sender)}{size}"]
+        commands += [f"RCPT TO:{smtplib.quoteaddr(recipient)}" for recipient in recipients]
+        commands.append("DATA")
+        server.send(''.join(command + '\r\n' for command in commands))
+        replies = [server.getreply() for _ in commands]
+
+        mail_reply, data_reply = replies[0], replies[-1]
+        refused = {
+            recipient: reply
+            for recipient, reply in zip(recipients, replies[1:-1])
+            if reply[0] not in (250, 251)
+        }
+        deliverable = mail_reply[0] == 250 and len(refused) < len(recipients)
+        if data_reply[0] == 354:
+            if deliverable:
+                data = _LEADING_DOT_RE.sub(b'..', payload)
+                if not data.endswith(b'\r\n'):
+                    data += b'\r\n'
+                server.send(data + b'.\r\n')
+            else:
+                # DATA was accepted without a valid recipient; end it empty
+                server.send(b'.\r\n')
+            code, response = server.getreply()
+            if deliverable and code != 250:
+                self._reset()
+                raise smtplib.SMTPDataError(code, response)
+
+        if mail_reply[0] != 250:
+            self._reset()
+            raise smtplib.SMTPSenderRefused(*mail_reply, sender)
+        if not deliverable:
+            self._reset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+        if data_reply[0] != 354:
+            self._reset()
+            raise smtplib.SMTPDataError(*data_reply)
+        return refused
+
+
+def _needs_reconnect(error: Exception) -> bool:
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code in RECONNECT_CODES
+    # Socket timeouts and resets
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+def _is_temporary(error: Exception, code: Optional[int]) -> bool:
+    if code is not None:
+        return 400 <= code < 500
+    return _needs_reconnect(error)
+
+
+def _results(message: OutgoingMessage, refused: Dict[str, Tuple[int, bytes]]) -> List[DeliveryResult]:
+    results = []
+    for index, recipient in enumerate(message.recipients):
+        reply = refused.get(recipient)
+        if reply is None:
+            results.append(DeliveryResult(email=recipient, ok=True, tag=message.tag_for(index)))
+        else:
+            code, response = reply
+            results.append(DeliveryResult(
+                email=recipient, ok=False,
+                error=f"{code} {response.decode('utf-8', 'replace')}", code=code,
+                temporary=400 <= code < 500, tag=message.tag_for(index)
+            ))
+    return results
+
+
+def _error_code(error: Exception) -> Optional[int]:
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+        return codes[0] if codes else None
+    return None
+
+
+def _session_key(config: PoolConfig, username: Optional[str], password: Optional[str]) -> Tuple:
+    # Only a digest of the password is kept, and a session is handed out
+    # only to callers presenting the same credentials
+    secret = hashlib.sha256((password or '').encode('utf-8')).hexdigest()
+    return (config.host, config.port, config.security, username or '', secret)
+
+
+class SessionCache:
+    """Idle authenticated sessions kept for reuse across pools and requests.
+
+    Blocking; call from worker threads. Sessions idle for longer than
+    `idle_timeout` seconds are closed by a background sweeper, and ones
+    idle for more than `check_after` seconds are probed with NOOP before
+    being handed out, since servers drop quiet sessions on their own.
+    """
+
+    def __init__(self, idle_timeout: float = 60.0, max_idle_per_key: int = 8, check_after: float = 5.0):
+        self.idle_timeout = idle_timeout
+        self.max_idle_per_key = max_idle_per_key
+        self.check_after = check_after
+        self._lock = threading.Lock()
+        # key -> [(released_at, connection)], most recently used last
+        self._idle: Dict[Tuple, List[Tuple[float, PooledConnection]]] = {}
+        self._sweeper: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def idle_count(self) -> int:
+        with self._lock:
+            return sum(len(sessions) for sessions in self._idle.values())
+
+    def acquire(self, config: PoolConfig, username: Optional[str], password: Optional[str]) -> PooledConnection:
+        """Return a warm session for these credentials, or open a new one."""
+        key = _session_key(config, username, password)
+        while True:
+            with self._lock:
+                sessions = self._idle.get(key)
+                if not sessions:
+                    break
+                released_at, conn = sessions.pop()
+            idle = time.monotonic() - released_at
+            if idle < self.idle_timeout and (idle < self.check_after or conn.alive()):
+                conn.config = config
+                _SESSIONS_REUSED.inc()
+                return conn
+            conn.close()
+        conn = PooledConnection(config, username, password)
+        conn.open()
+        _SESSIONS_OPENED.inc()
+        return conn
+
+    def release(self, conn: PooledConnection):
+        """Keep an open session for reuse; close it if the cache is full."""
+        if conn.server is None:
+            return
+        if self.idle_timeout <= 0 or conn.sent >= conn.config.max_messages_per_connection:
+            conn.close()
+            return
+        key = _session_key(conn.config, conn.username, conn.password)
+        with self._lock:
+            sessions = self._idle.setdefault(key, [])
+            sessions.append((time.monotonic(), conn))
+            evicted = sessions[:-self.max_idle_per_key]
+            del sessions[:-self.max_idle_per_key]
+            self._start_sweeper()
+        for _, old in evicted:
+            old.close()
+
+    def sweep(self):
+        """Close sessions that have been idle for longer than idle_timeout."""
+        cutoff = time.monotonic() - self.idle_timeout
+        expired = []
+        with self._lock:
+            for key in list(self._idle):
+                sessions = self._idle[key]
+                expired += [conn for released_at, conn in sessions if released_at <= cutoff]
+                sessions[:] = [(released_at, conn) for released_at, conn in sessions if released_at > cutoff]
+                if not sessions:
+                    del self._idle[key]
+        for conn in expired:
+            conn.close()
+
+    def close_all(self):
+        self._stopped.set()
+        with self._lock:
+            sessions = [conn for idle in self._idle.values() for _, conn in idle]
+            self._idle.clear()
+        for conn in sessions:
+            conn.close()
+
+    def _start_sweeper(self):
+        if self._sweeper is not None or self._stopped.is_set():
+            return
+
+        def run():
+            while not self._stopped.wait(max(self.idle_timeout / 2, 1.0)):
+                self.sweep()
+
+        self._sweeper = threading.Thread(target=run, name="smtp-session-sweeper", daemon=True)
+        self._sweeper.start()
+
+
+class DeliveryBackend:
+    """Where a campaign's messages go.
+
+    Subclasses open and release their resources in start()/close() and
+    deliver one message per send(); send_all() drives `concurrency` of
+    those at a time from a message source.
+    """
+
+    concurrency = 1
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def send(self, message: OutgoingMessage) -> List[DeliveryResult]:
+        """Deliver one message; return one result per recipient."""
+        raise NotImplementedError
+
+    async def send_all(
+        self,
+        messages: Union[Iterable[OutgoingMessage], MessageSource],
+        on_result: Optional[Callable[[DeliveryResult], None]] = None,
+        checkpoint: Optional[Callable[[], Awaitable[bool]]] = None
+    ) -> List[DeliveryResult]:
+        """Send messages concurrently, `concurrency` at a time.
+
+        Messages are pulled lazily from the iterable (or MessageSource, e.g.
+        a rate-limiting scheduler) so callers can build them on demand
+        instead of materialising the whole campaign.
+        When `on_result` is given results are handed to it as they arrive
+        and not collected. `checkpoint` is awaited before each message;
+        returning False stops the run (used for pause/cancel).
+        """
+        source = messages if isinstance(messages, MessageSource) else IterableSource(messages)
+        results: List[DeliveryResult] = []
+
+        async def worker():
+            while True:
+                if checkpoint and not await checkpoint():
+                    return
+                message = await source.get()
+                if message is None:
+                    return
+                for result in await self.send(message):
+                    DELIVERIES.labels('sent' if result.ok else 'failed', result.code or '').inc()
+                    source.report(message, result)
+                    if on_result:
+                        on_result(result)
+                    else:
+                        results.append(result)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        return results
+
+
+class SMTPConnectionPool(DeliveryBackend):
+    """Pre-authenticated SMTP sessions shared by concurrent senders.
+
+    Usage:
+        pool = SMTPConnectionPool(PoolConfig(), sender_email, sender_password)
+        await pool.start()
+        results = await pool.send_all(messages)
+        await pool.close()
+
+    With a SessionCache, connections are taken from it on start (when
+    warm ones exist) and handed back to it on close instead of quit.
+    """
+
+    def __init__(
+        self,
+        config: PoolConfig,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        sessions: Optional[SessionCache] = None
+    ):
+        self.config = config
+        self.username = username
+        self.password = password
+        self.sessions = sessions
+        self._executor = ThreadPoolExecutor(max_workers=config.size, thread_name_prefix="smtp-pool")
+        self._idle: Optional[asyncio.Queue] = None
+        self._connections: List[PooledConnection] = []
+        # Connections added to the SMTP_POOL_CONNECTIONS gauge
+        self._counted = 0
+        self.in_use = 0
+
+    @property
+    def concurrency(self) -> int:
+        # One sender per pooled connection
+        return self.config.size
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def start(self):
+        """Open and authenticate every connection up front.
+
+        Login errors are raised here so bad credentials fail the request
+        before any message is attempted.
+        """
+        self._idle = asyncio.Queue()
+        if self.sessions is not None:
+            results = await asyncio.gather(
+                *(self._run(self.sessions.acquire, self.config, self.username, self.password)
+                  for _ in range(self.config.size)),
+                return_exceptions=True
+            )
+            self._connections = [conn for conn in results if isinstance(conn, PooledConnection)]
+            errors = [error for error in results if isinstance(error, BaseException)]
+            if errors:
+                await self.close()
+                raise SMTPPoolError(str(errors[0])) from errors[0]
+        else:
+            self._connections = [
+                PooledConnection(self.config, self.username, self.password)
+                for _ in range(self.config.size)
+            ]
+            try:
+                await asyncio.gather(*(self._run(conn.open) for conn in self._connections))
+            except Exception as e:
+                await self.close()
+                raise SMTPPoolError(str(e)) from e
+        for conn in self._connections:
+            self._idle.put_nowait(conn)
+        self._counted = len(self._connections)
+        SMTP_POOL_CONNECTIONS.inc(self._counted)
+
+    async def close(self):
+        SMTP_POOL_CONNECTIONS.dec(self._counted)
+        self._counted = 0
+        done = self.sessions.release if self.sessions is not None else PooledConnection.close
+        await asyncio.gather(
+            *(self._run(done, conn) for conn in self._connections),
+            return_exceptions=True
+        )
+        self._connections = []
+        self._executor.shutdown(wait=False)
+
+    async def send(self, message: OutgoingMessage) -> List[DeliveryResult]:
+        """Send one message, reconnecting on dropped sessions and 421s.
+
+        Returns one result per recipient.
+        """
+        started = time.perf_counter()
+        conn = await self._idle.get()
+        SMTP_POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+        self.in_use += 1
+        SMTP_POOL_IN_USE.inc()
+        try:
+            attempt = 0
+            while True:
+                try:
+                    refused = await self._run(conn.send, message)
+                    return _results(message, refused)
+                except smtplib.SMTPRecipientsRefused as e:
+                    return _results(message, e.recipients)
+                except Exception as e:
+                    if _needs_reconnect(e) and attempt < self.config.max_retries:
+                        attempt += 1
+                        await self._run(conn.close)
+                        continue
+                    code = _error_code(e)
+                    temporary = _is_temporary(e, code)
+                    return [
+                        DeliveryResult(
+                            email=recipient, ok=False, error=str(e), code=code,
+                            temporary=temporary, tag=message.tag_for(index)
+                        )
+                        for index, recipient in enumerate(message.recipients)
+                    ]
+        finally:
+            self.in_use -= 1
+            SMTP_POOL_IN_USE.dec()
+            self._idle.put_nowait(conn)
@@ -0,0 +1,260 @@
+"""Delivery to files instead of SMTP.
+
+SpoolBackend is a DeliveryBackend that writes each fully rendered
+message to disk: a dry run of the whole pipeline without the network, a
+way to measure template and MIME throughput on their own, and a spool
+that can be handed to a faster MTA.
+
+Formats:
+- "maildir": one file per message, written to tmp/ and renamed into
+  new/ once durable (the Maildir delivery protocol).
+- "eml": one file per message in the spool directory, optionally
+  gzip-compressed (.eml.gz).
+
+Durability is batched: files are written as messages arrive, and every
+`fsync_batch` messages all of them are fsynced together, then renamed
+into place and the directories fsynced, so the cost is one group commit
+per batch rather than per message. send() returns only once the commit
+covering its message is done, so the outbox never records as sent a
+message that a crash could still lose. Two batches' worth of messages
+are in flight, one filling while the other commits; a partial batch is
+committed as soon as every sender is waiting on it (at the end of a
+list, or under rate limits). With fsync off nothing is flushed
+explicitly, for throughput tests.
+
+The SMTP envelope (sender, recipients and the caller's tags) isn't part
+of the message, so it is appended to manifest.<pid>.ndjson, one JSON
+line per file, for whatever picks up the spool.
+"""
+import asyncio
+import gzip
+import json
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from backend.metrics import SPOOL_FSYNC_SECONDS
+from backend.smtp_pool import DeliveryBackend, DeliveryError, DeliveryResult, OutgoingMessage
+
+SPOOL_FORMATS = ('maildir', 'eml')
+
+
+class SpoolError(DeliveryError):
+    pass
+
+
+@dataclass
+class SpoolConfig:
+    path: str
+    # "maildir" or "eml"
+    format: str = 'maildir'
+    # gzip each message (eml only; Maildir readers expect plain files)
+    compress: bool = False
+    fsync: bool = True
+    # Messages per group commit
+    fsync_batch: int = 256
+
+    def __post_init__(self):
+        if self.format not in SPOOL_FORMATS:
+            raise SpoolError(f"Unknown spool format: {self.format}")
+        if self.compress and self.format == 'maildir':
+            raise SpoolError("Compression is only supported for the eml spool format")
+
+
+def _fsync_dir(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class SpoolBackend(DeliveryBackend):
+    """Writes messages to a Maildir or .eml directory; see the module docstring."""
+
+    def __init__(self, config: SpoolConfig):
+        self.config = config
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="spool")
+        self._hostname = socket.gethostname().replace('/', '\\057').replace(':', '\\072')
+        self._sequence = 0
+        # (open fd or None, temporary path, final path) waiting for the next group commit
+        self._pending: List[Tuple[Optional[int], str, str]] = []
+        self._manifest = None
+        self._manifest_lines: List[str] = []
+        # Group commits done so far (on the writer thread); a message
+        # written now is covered by commit number _commits + 1
+        self._commits = 0
+        self._failure: Optional[BaseException] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # On the event loop: senders inside send(), those of them waiting
+        # for a commit, and a future per commit number being waited for
+        self._active = 0
+        self._waiting = 0
+        self._waiters: Dict[int, asyncio.Future] = {}
+
+    @property
+    def concurrency(self) -> int:
+        # One batch is rendered and written while the previous one commits
+        return 2 * self.config.fsync_batch
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _open(self):
+        config = self.config
+        if config.format == 'maildir':
+            self._write_dir = os.path.join(config.path, 'tmp')
+            self._final_dir = os.path.join(config.path, 'new')
+            for name in ('tmp', 'new', 'cur'):
+                os.makedirs(os.path.join(config.path, name), exist_ok=True)
+        else:
+            self._write_dir = self._final_dir = config.path
+            os.makedirs(config.path, exist_ok=True)
+        self._manifest = open(os.path.join(config.path, f'manifest.{os.getpid()}.ndjson'), 'a', encoding='utf-8')
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        try:
+            await self._run(self._open)
+        except OSError as e:
+            raise SpoolError(str(e)) from e
+
+    def _unique_name(self) -> str:
+        # Maildir unique name: time, pid and sequence, host
+        self._sequence += 1
+        now = time.time()
+        name = f'{int(now)}.M{int(now % 1 * 1e6)}P{os.getpid()}Q{self._sequence}.{self._hostname}'
+        if self.config.format == 'eml':
+            name += '.eml.gz' if self.config.compress else '.eml'
+        return name
+
+    def _write(self, message: OutgoingMessage) -> int:
+        """Write the message; return the number of the commit covering it."""
+        config = self.config
+        name = self._unique_name()
+        final = os.path.join(self._final_dir, name)
+        # Maildir files only appear in new/ once complete; eml files are
+        # written under a dot name that readers skip, then renamed
+        temporary = os.path.join(self._write_dir, name if config.format == 'maildir' else f'.{name}.tmp')
+        data = gzip.compress(message.payload, compresslevel=5) if config.compress else message.payload
+        fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        except BaseException:
+            os.close(fd)
+            raise
+        if not config.fsync:
+            os.close(fd)
+            fd = None
+        self._pending.append((fd, temporary, final))
+        self._manifest_lines.append(json.dumps({
+            'file': os.path.relpath(final, config.path),
+            'sender': message.sender,
+            'recipients': list(message.recipients),
+            'tags': [message.tag_for(index) for index in range(len(message.recipients))]
+        }, default=str) + '\n')
+        commit = self._commits + 1
+        if len(self._pending) >= config.fsync_batch:
+            self._commit()
+        return commit
+
+    def _commit(self):
+        """Make the pending files durable and move them into place."""
+        try:
+            self._commit_pending()
+        except BaseException as e:
+            self._failure = e
+            raise
+        finally:
+            self._commits += 1
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        for commit in [commit for commit in self._waiters if commit <= self._commits]:
+            future = self._waiters.pop(commit)
+            if future.done():
+                continue
+            if self._failure is not None:
+                future.set_exception(self._failure)
+            else:
+                future.set_result(None)
+
+    def _commit_pending(self):
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        started = time.perf_counter()
+        try:
+            for fd, _, _ in pending:
+                if fd is not None:
+                    os.fsync(fd)
+        finally:
+            for fd, _, _ in pending:
+                if fd is not None:
+                    os.close(fd)
+        for _, temporary, final in pending:
+            os.rename(temporary, final)
+        self._manifest.writelines(self._manifest_lines)
+        self._manifest_lines = []
+        self._manifest.flush()
+        if self.config.fsync:
+            os.fsync(self._manifest.fileno())
+            _fsync_dir(self._final_dir)
+            SPOOL_FSYNC_SECONDS.observe(time.perf_counter() - started)
+
+    def _close(self):
+        try:
+            self._commit()
+        finally:
+            if self._manifest is not None:
+                self._manifest.close()
+                self._manifest = None
+
+    async def close(self):
+        try:
+            await self._run(self._close)
+        finally:
+            self._executor.shutdown(wait=False)
+
+    def _commit_if_idle(self):
+        # Every sender is waiting on a commit, so no batch fills up without one
+        if self._waiters and self._waiting == self._active:
+            asyncio.ensure_future(self._run(self._commit)).add_done_callback(
+                lambda task: task.cancelled() or task.exception()
+            )
+
+    async def send(self, message: OutgoingMessage) -> List[DeliveryResult]:
+        self._active += 1
+        try:
+            commit = await self._run(self._write, message)
+            if commit > self._commits:
+                future = self._waiters.get(commit)
+                if future is None:
+                    future = self._waiters[commit] = self._loop.create_future()
+                self._waiting += 1
+                try:
+                    self._commit_if_idle()
+                    await future
+                finally:
+                    self._waiting -= 1
+            elif self._failure is not None:
+                raise self._failure
+        except OSError as e:
+            # Out of space and the like: nothing after this will fare better
+            raise SpoolError(str(e)) from e
+        finally:
+            self._active -= 1
+            # A sender leaving (done, or after an error) may leave only
+            # waiting ones behind
+            self._commit_if_idle()
+        return [
+            DeliveryResult(email=recipient, ok=True, tag=message.tag_for(index))
+            for index, recipient in enumerate(message.recipients)
+        ]
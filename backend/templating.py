@@ -0,0 +1,123 @@
+"""Subject/body personalization templates.
+
+Placeholders look like `{name}` or `{name|there}` where the text after
+the pipe is used when the contact has no value for the field. Any contact
+column can be used as a field. `{{` and `}}` produce literal braces, and a
+brace that does not form a valid placeholder is kept as-is instead of
+raising like `str.format` does.
+
+Templates compiled for a contact list (`columns` given) only treat the
+list's columns and the canonical fields as placeholders; other brace
+text such as CSS (`p {color: red}`) or JSON is sent literally. A
+placeholder with a default (`{field|...}`) is always a placeholder.
+
+Templates are parsed once into literal segments and field slots and
+compiled into a single-pass render function, so rendering in the send
+loop costs one call per message.
+"""
+import re
+from typing import Collection, Dict, FrozenSet, List, Mapping, Optional, Tuple, Union
+
+from backend.columns import CANONICAL_FIELDS
+
+_TOKEN_RE = re.compile(r"\{\{|\}\}|\{([^{}|]+)(?:\|([^{}]*))?\}")
+
+
+def _text(value, default: str) -> str:
+    # Missing, empty and NaN (pandas blank cells) all fall back to the default
+    if value is None or value == '' or value != value:
+        return default
+    return value if value.__class__ is str else str(value)
+
+
+class Template:
+    """A parsed template.
+
+    `segments` alternates literal text and (field, default) slots.
+    """
+
+    def __init__(self, source: str, columns: Optional[Collection[str]] = None):
+        self.source = source
+        known = None if columns is None else frozenset(columns).union(CANONICAL_FIELDS)
+        self.segments: List[Union[str, Tuple[str, str]]] = self._parse(source, known)
+        self._slots = [seg for seg in self.segments if isinstance(seg, tuple)]
+        self.fields = sorted({field for field, _ in self._slots})
+        self._render = self._compile()
+
+    @staticmethod
+    def _parse(source: str, known: Optional[FrozenSet[str]]) -> List[Union[str, Tuple[str, str]]]:
+        segments: List[Union[str, Tuple[str, str]]] = []
+        literal = []
+        pos = 0
+        for match in _TOKEN_RE.finditer(source):
+            literal.append(source[pos:match.start()])
+            pos = match.end()
+            token = match.group(0)
+            if token in ('{{', '}}'):
+                literal.append(token[0])
+                continue
+            field = match.group(1).strip()
+            if not field or (known is not None and field not in known and match.group(2) is None):
+                literal.append(token)
+                continue
+            if literal:
+                segments.append(''.join(literal))
+                literal = []
+            segments.append((field, match.group(2) or ''))
+        literal.append(source[pos:])
+        tail = ''.join(literal)
+        if tail:
+            segments.append(tail)
+        return [seg for seg in segments if seg != '']
+
+    def _compile(self):
+        # Generate a function returning `lit0 + _text(g(field), default) + ...`.
+        # Literals and names go through repr() so the source is always safe.
+        parts = []
+        for seg in self.segments:
+            if isinstance(seg, tuple):
+                field, default = seg
+                parts.append(f"_text(g({field!r}), {default!r})")
+            else:
+                parts.append(repr(seg))
+        source = (
+            "def render(contact, _text=_text):\n"
+            "    g = contact.get\n"
+            f"    return {' + '.join(parts) or repr('')}\n"
+        )
+        namespace = {'_text': _text}
+        exec(source, namespace)
+        return namespace['render']
+
+    def render(self, contact: Mapping) -> str:
+        return self._render(contact)
+
+    def content_key(self, contact: Mapping) -> Tuple[str, ...]:
+        """The text each slot renders to; contacts with equal keys render identically."""
+        g = contact.get
+        return tuple(_text(g(field), default) for field, default in self._slots)
+
+    def __repr__(self):
+        return f"Template({self.source!r})"
+
+
+_cache: Dict[Tuple[str, Optional[FrozenSet[str]]], Template] = {}
+
+
+def compile_template(source: str, columns: Optional[Collection[str]] = None) -> Template:
+    """Return a compiled Template, reusing one compiled earlier for the same
+    text and columns."""
+    key = (source, None if columns is None else frozenset(columns))
+    template = _cache.get(key)
+    if template is None:
+        if len(_cache) >= 256:
+            _cache.clear()
+        template = _cache[key] = Template(source, columns)
+    return template
+
+
+def render(source: str, contact: Mapping, extra: Optional[Mapping] = None) -> str:
+    """Render a template string once (previews and one-off sends)."""
+    if extra:
+        contact = {**contact, **extra}
+    return compile_template(source, contact.keys()).render(contact)
@@ -0,0 +1,319 @@
+"""Per-domain rate limiting for campaign delivery.
+
+DomainScheduler reads ahead a window of recipients, groups them by
+domain and hands them out round-robin across domains, so a list sorted
+by domain doesn't hit one provider in a burst. Every domain has a token
+bucket, and an optional provider-wide bucket caps the total rate through
+the relay.
+
+With `capacity` (a backend.fairshare.Share), every message also waits
+for its turn at the relay quota shared with other campaigns.
+
+With `group_key`, queued recipients anywhere in the read-ahead window
+that share a key (i.e. would receive identical content) are handed out
+together as one multi-recipient message, across domains. Every recipient
+still takes a token from its own domain and the provider bucket, so a
+recipient whose domain is out of tokens waits for a later message.
+
+With `blocking`, `items` is read in the default executor a page at a
+time (e.g. rows paged out of the contact store), so the event loop never
+waits on a query.
+
+Throttling adapts to the receiving side. A 4xx reply halves that
+domain's rate and pauses it with an exponential backoff. Successful
+sends raise the rate again in small steps up to the configured maximum.
+"""
+import asyncio
+import time
+from collections import deque
+from itertools import islice
+from typing import Any, Callable, Deque, Dict, Hashable, Iterable, List, Mapping, Optional
+
+from backend.smtp_pool import DeliveryResult, MessageSource, OutgoingMessage
+
+# Recipients read ahead of sending so domains can be interleaved
+DEFAULT_LOOKAHEAD = 1000
+# Longest single sleep, so cancellation is noticed promptly
+MAX_SLEEP = 1.0
+
+
+class TokenBucket:
+    """`rate` tokens per second, at most `burst` saved up. rate=None is unlimited."""
+
+    def __init__(self, rate: Optional[float], burst: float = 1.0):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        if self.rate:
+            self._refill(now)
+            self.tokens -= 1
+
+
+class DomainThrottle:
+    def __init__(self, max_rate: Optional[float], burst: float, min_rate: float = 0.1,
+                 base_backoff: float = 1.0, max_backoff: float = 300.0):
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.bucket = TokenBucket(max_rate, burst)
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.backoff = 0.0
+        self.blocked_until = 0.0
+
+    def delay(self, now: float) -> float:
+        return max(self.blocked_until - now, self.bucket.delay(now))
+
+    def take(self, now: float):
+        self.bucket.take(now)
+
+    def on_success(self):
+        self.backoff = 0.0
+        if self.max_rate and self.bucket.rate < self.max_rate:
+            # Additive increase back towards the configured rate
+            self.bucket.rate = min(self.max_rate, self.bucket.rate + self.max_rate / 20)
+
+    def on_throttled(self, now: float):
+        # Multiplicative decrease and an exponential pause
+        if self.max_rate:
+            self.bucket.rate = max(self.min_rate, self.bucket.rate / 2)
+        self.backoff = min(self.max_backoff, self.backoff * 2 if self.backoff else self.base_backoff)
+        self.blocked_until = now + self.backoff
+
+    def stats(self) -> Dict:
+        return {
+            'rate': self.bucket.rate,
+            'backoff': self.backoff,
+            'blocked_for': round(max(self.blocked_until - time.monotonic(), 0.0), 1)
+        }
+
+
+def domain_of(email: str) -> str:
+    return email.rpartition('@')[2].strip().lower()
+
+
+_END = object()
+
+
+class _Entry:
+    """A buffered item in grouping mode. It sits in its domain's queue and
+    in its content key's queue; `taken` marks it sent from either side."""
+
+    __slots__ = ('item', 'domain', 'key', 'taken')
+
+    def __init__(self, item: Any, domain: str, key: Hashable):
+        self.item = item
+        self.domain = domain
+        self.key = key
+        self.taken = False
+
+
+class DomainScheduler(MessageSource):
+    """Hands out messages domain-interleaved and rate limited.
+
+    `key` extracts the recipient domain from an item and `build` turns a
+    scheduled item into an OutgoingMessage, so only items that are about
+    to be sent are ever built. With `group_key` set, `build` receives a
+    list of up to `max_group` items instead. `stop` is polled while
+    waiting so a cancelled campaign doesn't sit out a long backoff.
+    """
+
+    def __init__(
+        self,
+        items: Iterable[Any],
+        key: Callable[[Any], str],
+        build: Callable[[Any], Any],
+        domain_rate: Optional[float] = None,
+        domain_burst: float = 1.0,
+        domain_rates: Optional[Mapping[str, float]] = None,
+        provider_rate: Optional[float] = None,
+        provider_burst: float = 1.0,
+        lookahead: int = DEFAULT_LOOKAHEAD,
+        stop: Optional[Callable[[], bool]] = None,
+        group_key: Optional[Callable[[Any], Hashable]] = None,
+        max_group: int = 1,
+        capacity=None,
+        blocking: bool = False
+    ):
+        self._items = iter(items)
+        self._key = key
+        self._build = build
+        self.domain_rate = domain_rate
+        self.domain_burst = domain_burst
+        self.domain_rates = {domain.lower(): rate for domain, rate in (domain_rates or {}).items()}
+        self.provider = TokenBucket(provider_rate, provider_burst)
+        self.lookahead = lookahead
+        self._stop = stop
+        self._group_key = group_key
+        self.max_group = max_group
+        self.capacity = capacity
+        self.domains: Dict[str, DomainThrottle] = {}
+        self._queues: Dict[str, Deque] = {}
+        self._ring: Deque[str] = deque()
+        # Grouping mode: content key -> its buffered entries, oldest first
+        self._groups: Dict[Hashable, Deque[_Entry]] = {}
+        self._buffered = 0
+        self._exhausted = False
+        self._blocking = blocking
+        # Workers call get() concurrently; only one of them reads `items`
+        self._fill_lock = asyncio.Lock() if blocking else None
+
+    def throttle_for(self, domain: str) -> DomainThrottle:
+        throttle = self.domains.get(domain)
+        if throttle is None:
+            rate = self.domain_rates.get(domain, self.domain_rate)
+            throttle = self.domains[domain] = DomainThrottle(rate, self.domain_burst)
+        return throttle
+
+    def _fill(self):
+        while not self._exhausted and self._buffered < self.lookahead:
+            item = next(self._items, _END)
+            if item is _END:
+                self._exhausted = True
+                return
+            self._queue(item)
+
+    async def _fill_blocking(self):
+        # Refill once half the lookahead is used up rather than on every
+        # message, so there is one executor round trip per page
+        if self._exhausted or self._buffered > self.lookahead // 2:
+            return
+        async with self._fill_lock:
+            if self._exhausted or self._buffered > self.lookahead // 2:
+                return
+            count = self.lookahead - self._buffered
+            loop = asyncio.get_running_loop()
+            items = await loop.run_in_executor(None, list, islice(self._items, count))
+            if len(items) < count:
+                self._exhausted = True
+            for item in items:
+                self._queue(item)
+
+    def _queue(self, item: Any):
+        domain = self._key(item)
+        queue = self._queues.get(domain)
+        if queue is None:
+            queue = self._queues[domain] = deque()
+            self._ring.append(domain)
+            self.throttle_for(domain)
+        if self._group_key is not None:
+            entry = _Entry(item, domain, self._group_key(item))
+            group = self._groups.get(entry.key)
+            if group is None:
+                group = self._groups[entry.key] = deque()
+            group.append(entry)
+            item = entry
+        queue.append(item)
+        self._buffered += 1
+
+    def _pending(self, domain: str) -> bool:
+        """Drop entries already sent with another domain's message from the
+        head of the domain's queue; False (and the queue gone) if none are left."""
+        queue = self._queues[domain]
+        while queue and queue[0].taken:
+            queue.popleft()
+        if not queue:
+            del self._queues[domain]
+        return bool(queue)
+
+    def _pop(self, domain: str, now: float) -> List[Any]:
+        queue = self._queues[domain]
+        items = [queue.popleft()]
+        if self._group_key is not None:
+            items = self._gather(items[0], now)
+        self._buffered -= len(items)
+        if queue:
+            self._ring.append(domain)
+        else:
+            del self._queues[domain]
+        return items
+
+    def _gather(self, first: _Entry, now: float) -> List[Any]:
+        # Fill the message with the oldest entries of the same content from
+        # any domain that has a token now; the first took its tokens in get()
+        first.taken = True
+        items = [first.item]
+        group = self._groups[first.key]
+        skipped = []
+        while group and len(items) < self.max_group and self.provider.delay(now) <= 0:
+            entry = group.popleft()
+            if entry.taken:
+                continue
+            throttle = self.domains[entry.domain]
+            if throttle.delay(now) > 0:
+                skipped.append(entry)
+                continue
+            throttle.take(now)
+            self.provider.take(now)
+            entry.taken = True
+            items.append(entry.item)
+        group.extendleft(reversed(skipped))
+        while group and group[0].taken:
+            group.popleft()
+        if not group:
+            del self._groups[first.key]
+        return items
+
+    async def get(self) -> Optional[OutgoingMessage]:
+        """Return the next built message, waiting for rate limits; None when done."""
+        while True:
+            if self._blocking:
+                await self._fill_blocking()
+            else:
+                self._fill()
+            if not self._ring or (self._stop and self._stop()):
+                return None
+
+            now = time.monotonic()
+            wait = self.provider.delay(now)
+            if wait <= 0:
+                for _ in range(len(self._ring)):
+                    domain = self._ring.popleft()
+                    if self._group_key is not None and not self._pending(domain):
+                        continue
+                    throttle = self.domains[domain]
+                    delay = throttle.delay(now)
+                    if delay <= 0:
+                        throttle.take(now)
+                        self.provider.take(now)
+                        items = self._pop(domain, now)
+                        if self.capacity is not None and not await self.capacity.acquire(len(items), self._stop):
+                            return None
+                        return self._build(items if self._group_key is not None else items[0])
+                    self._ring.append(domain)
+                    wait = delay if wait <= 0 else min(wait, delay)
+            await asyncio.sleep(min(wait, MAX_SLEEP))
+
+    def report(self, message: OutgoingMessage, result: DeliveryResult):
+        """Feed a delivery result back into the domain's throttle."""
+        throttle = self.domains.get(domain_of(result.email))
+        if throttle is None:
+            return
+        if result.ok:
+            throttle.on_success()
+        elif result.code is not None and 400 <= result.code < 500:
+            throttle.on_throttled(time.monotonic())
+
+    def stats(self) -> Dict:
+        return {
+            'queued': self._buffered,
+            'throttled': {
+                domain: throttle.stats()
+                for domain, throttle in self.domains.items()
+                if throttle.backoff
+            }
+        }
@@ -0,0 +1,172 @@
+"""Pre-send recipient validation.
+
+Contacts are checked before any SMTP connection is opened so known-bad
+recipients never take up pool capacity:
+- syntax, with one precompiled pattern
+- duplicates, case-insensitive, in a set that spills to an on-disk
+  SQLite index for very large lists
+- optionally, that the domain accepts mail (MX lookup, cached with a TTL)
+"""
+import os
+import re
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+EMAIL_RE = re.compile(
+    r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(?:\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*"
+    r"@(?:[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)+[A-Za-z]{2,63}"
+)
+MAX_EMAIL_LENGTH = 254
+
+MISSING = 'missing'
+SYNTAX = 'syntax'
+DUPLICATE = 'duplicate'
+NO_MX = 'no_mx'
+
+# Reject details kept for the report; rejected rows are always tracked in full
+MAX_REJECT_DETAILS = 1000
+
+
+def is_valid_email(email: str) -> bool:
+    return len(email) <= MAX_EMAIL_LENGTH and EMAIL_RE.fullmatch(email) is not None
+
+
+class Deduplicator:
+    """Remembers keys seen so far, in memory up to `memory_limit` keys."""
+
+    def __init__(self, memory_limit: int = 1_000_000):
+        self.memory_limit = memory_limit
+        self._seen: Set[str] = set()
+        self._db: Optional[sqlite3.Connection] = None
+        self._path: Optional[str] = None
+
+    def _spill(self):
+        fd, self._path = tempfile.mkstemp(prefix="dedup-", suffix=".db")
+        os.close(fd)
+        self._db = sqlite3.connect(self._path)
+        self._db.execute("PRAGMA journal_mode=OFF")
+        self._db.execute("PRAGMA synchronous=OFF")
+        self._db.execute("CREATE TABLE seen (key TEXT PRIMARY KEY) WITHOUT ROWID")
+        self._db.executemany("INSERT INTO seen VALUES (?)", ((key,) for key in self._seen))
+        self._seen = set()
+
+    def add(self, key: str) -> bool:
+        """Record `key`; return False if it had already been seen."""
+        if self._db is not None:
+            return self._db.execute("INSERT OR IGNORE INTO seen VALUES (?)", (key,)).rowcount == 1
+        if key in self._seen:
+            return False
+        self._seen.add(key)
+        if len(self._seen) > self.memory_limit:
+            self._spill()
+        return True
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            os.remove(self._path)
+            self._db = None
+
+
+def default_mx_resolver(domain: str) -> bool:
+    """True if the domain has MX records (dnspython) or, failing that, an address."""
+    try:
+        import dns.resolver
+        import dns.exception
+    except ImportError:
+        # No DNS library: fall back to the implicit MX rule (RFC 5321 5.1)
+        try:
+            return bool(socket.getaddrinfo(domain, 25))
+        except socket.gaierror:
+            return False
+    try:
+        return len(dns.resolver.resolve(domain, 'MX')) > 0
+    except dns.exception.DNSException:
+        return False
+
+
+class MXChecker:
+    """Caches per-domain MX results for `ttl` seconds.
+
+    `resolver` is any callable taking a domain and returning a bool, so a
+    local caching resolver or a stub can be plugged in.
+    """
+
+    def __init__(self, resolver: Callable[[str], bool] = default_mx_resolver, ttl: float = 3600):
+        self.resolver = resolver
+        self.ttl = ttl
+        self._cache: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def accepts_mail(self, domain: str) -> bool:
+        now = time.monotonic()
+        cached = self._cache.get(domain)
+        if cached and cached[1] > now:
+            return cached[0]
+        ok = self.resolver(domain)
+        with self._lock:
+            self._cache[domain] = (ok, now + self.ttl)
+        return ok
+
+
+class ValidationReport:
+    def __init__(self):
+        self.checked = 0
+        self.valid = 0
+        # row -> (address as given, reason), for every rejected row
+        self.rejected_rows: Dict[int, Tuple[Optional[str], str]] = {}
+        self.rejects: List[Dict] = []
+        self.counts = {MISSING: 0, SYNTAX: 0, DUPLICATE: 0, NO_MX: 0}
+
+    def reject(self, row: int, email, reason: str):
+        self.rejected_rows[row] = (None if email in (None, '') else str(email), reason)
+        self.counts[reason] += 1
+        if len(self.rejects) < MAX_REJECT_DETAILS:
+            self.rejects.append({'row': row, 'email': email, 'reason': reason})
+
+    def summary(self) -> Dict:
+        return {
+            'checked': self.checked,
+            'valid': self.valid,
+            'rejected': len(self.rejected_rows),
+            'reasons': self.counts,
+            'rejects': self.rejects
+        }
+
+
+class ContactValidator:
+    def __init__(self, mx_checker: Optional[MXChecker] = None, dedup_memory_limit: int = 1_000_000):
+        self.mx_checker = mx_checker
+        self.dedup_memory_limit = dedup_memory_limit
+
+    def scan(self, contacts: Iterable[Dict]) -> ValidationReport:
+        """Check every contact and return the rows to skip."""
+        report = ValidationReport()
+        seen = Deduplicator(self.dedup_memory_limit)
+        mx_checker = self.mx_checker
+        try:
+            for row, contact in enumerate(contacts):
+                report.checked += 1
+                email = contact.get('email')
+                if not email or not isinstance(email, str):
+                    report.reject(row, email, MISSING)
+                    continue
+                email = email.strip()
+                if not is_valid_email(email):
+                    report.reject(row, email, SYNTAX)
+                    continue
+                key = email.lower()
+                if not seen.add(key):
+                    report.reject(row, email, DUPLICATE)
+                    continue
+                if mx_checker and not mx_checker.accepts_mail(key.rpartition('@')[2]):
+                    report.reject(row, email, NO_MX)
+                    continue
+                report.valid += 1
+        finally:
+            seen.close()
+        return report
@@ -0,0 +1,173 @@
+"""End-to-end upload and send benchmark against a fake SMTP sink.
+
+Generates synthetic contact lists, uploads them through
+/api/upload-contacts and sends a campaign to every contact through
+/api/send-emails, with the SMTP relay replaced by an in-process sink
+(see benchmarks.fake_smtp). Reports upload rate, send throughput, SMTP
+transaction latency (p50/p99, measured at the sink) and peak RSS.
+
+Run from the repository root:
+    python -m benchmarks.bench_campaign
+    python -m benchmarks.bench_campaign --rows 1000 100000 1000000 --formats csv json
+    python -m benchmarks.bench_campaign --latency 0.02 --fail-rate 0.01 --temp-fail-rate 0.01
+    python -m benchmarks.bench_campaign --processes 4 --json results.json
+    python -m benchmarks.bench_campaign --delivery maildir --no-fsync
+
+With --delivery maildir or eml the campaign is written to a spool
+directory instead (see backend.spool), which measures the pipeline up to
+the wire without any SMTP; the sink columns are then empty.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from benchmarks.datasets import FORMATS, write_contacts
+from benchmarks.fake_smtp import FakeSMTPServer
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'json': 'application/json'
+}
+
+CAMPAIGN = {
+    'sender_email': 'bench@example.com',
+    'sender_password': '',
+    'subject_template': 'Hello {name}',
+    'body_template': 'Dear {name},\n\nYour role as {designation} caught our eye.\n\nBest regards'
+}
+
+FINISHED = ('completed', 'failed', 'cancelled')
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux; worker processes are reported separately
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(self_rss, children) / 1024, 1)
+
+
+def run_case(client, sink, directory, fmt, rows, args):
+    path = os.path.join(directory, f'contacts-{rows}.{fmt}')
+    if not os.path.exists(path):
+        write_contacts(path, fmt, rows, seed=args.seed)
+
+    start = time.perf_counter()
+    with open(path, 'rb') as f:
+        response = client.post('/api/upload-contacts', files={'file': (os.path.basename(path), f, CONTENT_TYPES[fmt])})
+    response.raise_for_status()
+    upload_seconds = time.perf_counter() - start
+    list_id = response.json()['list_id']
+
+    config = {**CAMPAIGN, 'pool_size': args.pool_size, 'processes': args.processes,
+              'max_recipients_per_message': args.max_recipients, 'delivery': args.delivery,
+              'spool_compress': args.compress, 'spool_fsync': not args.no_fsync}
+    sink.reset_stats()
+    start = time.perf_counter()
+    response = client.post('/api/send-emails', data={'config': json.dumps(config), 'list_id': list_id})
+    response.raise_for_status()
+    job_id = response.json()['job_id']
+    while True:
+        progress = client.get(f'/api/jobs/{job_id}').json()
+        if progress['status'] in FINISHED:
+            break
+        time.sleep(0.05)
+    send_seconds = time.perf_counter() - start
+    client.delete(f'/api/contact-lists/{list_id}')
+
+    sink_stats = sink.stats.summary()
+    attempted = progress['sent'] + progress['failed']
+    return {
+        'format': fmt,
+        'rows': rows,
+        'status': progress['status'],
+        'upload_seconds': round(upload_seconds, 3),
+        'upload_rows_per_sec': round(rows / upload_seconds),
+        'send_seconds': round(send_seconds, 3),
+        'sent': progress['sent'],
+        'failed': progress['failed'],
+        'messages_per_sec': round(attempted / send_seconds, 1),
+        'smtp_transactions': sink_stats['transactions'],
+        'latency_p50_ms': round(sink_stats['latency_p50'] * 1000, 2) if sink_stats['latency_p50'] is not None else None,
+        'latency_p99_ms': round(sink_stats['latency_p99'] * 1000, 2) if sink_stats['latency_p99'] is not None else None,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+
+def print_result(result):
+    print(
+        f"{result['format']:<5} {result['rows']:>9,} rows  "
+        f"upload {result['upload_rows_per_sec']:>9,} rows/s  "
+        f"send {result['messages_per_sec']:>9,.1f} msg/s  "
+        f"p50 {result['latency_p50_ms']} ms  p99 {result['latency_p99_ms']} ms  "
+        f"sent {result['sent']:,} failed {result['failed']:,}  "
+        f"peak RSS {result['peak_rss_mb']} MB  [{result['status']}]"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=list(FORMATS))
+    parser.add_argument('--latency', type=float, default=0.0, help='sink delay per message, seconds')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='share of recipients refused with 550')
+    parser.add_argument('--temp-fail-rate', type=float, default=0.0, help='share of recipients refused with 451 (these also trigger per-domain backoff)')
+    parser.add_argument('--no-pipelining', action='store_true', help="don't advertise PIPELINING")
+    parser.add_argument('--pool-size', type=int, default=4)
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--max-recipients', type=int, default=1)
+    parser.add_argument('--delivery', choices=('smtp', 'maildir', 'eml'), default='smtp')
+    parser.add_argument('--compress', action='store_true', help='gzip spooled messages (eml only)')
+    parser.add_argument('--no-fsync', action='store_true', help="don't fsync spooled messages")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', metavar='PATH', help='also write the results as JSON')
+    args = parser.parse_args(argv)
+
+    sink = FakeSMTPServer(
+        latency=args.latency,
+        fail_rate=args.fail_rate,
+        temp_fail_rate=args.temp_fail_rate,
+        pipelining=not args.no_pipelining,
+        seed=args.seed
+    )
+    sink.start()
+
+    with tempfile.TemporaryDirectory(prefix='mail-bench-') as directory:
+        # Point the app at the sink and at throwaway databases before importing it
+        os.environ.update({
+            'SMTP_HOST': '127.0.0.1',
+            'SMTP_PORT': str(sink.port),
+            'SMTP_SECURITY': 'none',
+            'CONTACT_DB': os.path.join(directory, 'contacts.db'),
+            'OUTBOX_DB': os.path.join(directory, 'outbox.db'),
+            'SPOOL_DIR': os.path.join(directory, 'spool'),
+            'RETRY_BASE_DELAY': '0.05',
+            # Allow --processes beyond this machine's CPU count
+            'MAX_SEND_PROCESSES': str(max(args.processes, 1))
+        })
+        from fastapi.testclient import TestClient
+        from backend.main import app
+
+        results = []
+        try:
+            with TestClient(app) as client:
+                for rows in args.rows:
+                    for fmt in args.formats:
+                        result = run_case(client, sink, directory, fmt, rows, args)
+                        print_result(result)
+                        results.append(result)
+        finally:
+            sink.stop()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
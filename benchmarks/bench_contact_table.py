@@ -0,0 +1,69 @@
+"""Memory per contact and sender-loop speed: dicts vs ContactTable.
+
+Contacts are decoded from their stored JSON the way ContactList returns
+them, then held either as a list of dicts or as a ContactTable. Reports
+the bytes per contact each holds (tracemalloc) and the time to render a
+subject and body for every contact through each.
+
+Run from the repository root:
+    python -m benchmarks.bench_contact_table
+    python -m benchmarks.bench_contact_table --rows 2000000
+"""
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+
+from backend.contact_table import ContactTable
+from backend.serialization import dumps, loads
+from backend.templating import compile_template
+from benchmarks.datasets import generate_contacts
+
+SUBJECT = compile_template('Hello {Name}')
+BODY = compile_template('Dear {Name},\n\nYour role as {Designation} caught our eye.\n\nBest regards')
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    value = build()
+    seconds = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, size, seconds
+
+
+def render_all(contacts) -> float:
+    start = time.perf_counter()
+    for contact in contacts:
+        SUBJECT.render(contact)
+        BODY.render(contact)
+        contact['Email'].strip()
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=500_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    stored = [dumps(contact) for contact in generate_contacts(args.rows, args.seed)]
+    print(f"{args.rows:,} contacts\n")
+    print(f"{'layout':<14} {'bytes/contact':>14} {'build s':>8} {'render s':>9}")
+
+    dicts, size, seconds = measure(lambda: [loads(data) for data in stored])
+    print(f"{'list of dicts':<14} {size / args.rows:>14.0f} {seconds:>8.2f} {render_all(dicts):>9.2f}")
+    dict_size = size
+    del dicts
+
+    table, size, seconds = measure(lambda: ContactTable.from_contacts(loads(data) for data in stored))
+    print(f"{'ContactTable':<14} {size / args.rows:>14.0f} {seconds:>8.2f} {render_all(table):>9.2f}")
+    print(f"\n{dict_size / size:.1f}x smaller")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""Payload size and latency of the contact and result encodings.
+
+Encoder: the stdlib json module and FastAPI's default path
+(jsonable_encoder, then json.dumps) against orjson, for a whole contact
+list as it arrives in send-emails' `contacts` field or a job result
+with its failures.
+
+Sizes: a JSON array, NDJSON objects and the "columns" NDJSON layout,
+each raw, gzipped and (with the brotli package installed) brotli.
+
+HTTP: the list is uploaded through /api/upload-contacts, then fetched
+through /api/contact-lists/{id}/export in both formats and as 1000-row
+pages, with each Accept-Encoding, reporting time and bytes on the wire.
+
+Run from the repository root:
+    python -m benchmarks.bench_serialization
+    python -m benchmarks.bench_serialization --rows 1000000 --no-http
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.datasets import generate_contacts, write_csv
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def best_of(func, repeat=3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_encoders(contacts):
+    from fastapi.encoders import jsonable_encoder
+    from backend.serialization import dumps, loads
+
+    text = json.dumps(contacts)
+    result = {'failed_details': [{'email': c['Email'], 'error': '550 no such user'} for c in contacts]}
+    cases = [
+        ('contacts encode  json', lambda: json.dumps(contacts)),
+        ('contacts encode  orjson', lambda: dumps(contacts)),
+        ('contacts decode  json', lambda: json.loads(text)),
+        ('contacts decode  orjson', lambda: loads(text)),
+        ('result   encode  fastapi default', lambda: json.dumps(jsonable_encoder(result)).encode()),
+        ('result   encode  orjson', lambda: dumps(result)),
+    ]
+    print(f"{'encoder':<36} {'ms':>9}")
+    for name, func in cases:
+        print(f"{name:<36} {best_of(func) * 1000:>9.1f}")
+
+
+def bench_sizes(contacts):
+    from backend.serialization import dumps
+
+    columns = list(contacts[0])
+    layouts = {
+        'json array': dumps(contacts),
+        'ndjson': b''.join(dumps({'row': row, 'contact': c}) + b'\n' for row, c in enumerate(contacts)),
+        'columns': b''.join(
+            [dumps(['row', *columns]) + b'\n']
+            + [dumps([row, *(c[k] for k in columns)]) + b'\n' for row, c in enumerate(contacts)]
+        )
+    }
+    print(f"\n{'layout':<12} {'raw MB':>8} {'gzip MB':>8} {'gzip ms':>8} {'br MB':>8} {'br ms':>8}")
+    for name, data in layouts.items():
+        start = time.perf_counter()
+        gzipped = gzip.compress(data, 6)
+        gzip_ms = (time.perf_counter() - start) * 1000
+        br = br_ms = None
+        if brotli is not None:
+            start = time.perf_counter()
+            br = len(brotli.compress(data, quality=4)) / 1e6
+            br_ms = (time.perf_counter() - start) * 1000
+        print(
+            f"{name:<12} {len(data) / 1e6:>8.2f} {len(gzipped) / 1e6:>8.2f} {gzip_ms:>8.0f} "
+            f"{br if br is not None else '-':>8} {br_ms if br_ms is not None else '-':>8}"
+        )
+
+
+def fetch(client, url, encoding):
+    start = time.perf_counter()
+    with client.stream('GET', url, headers={'Accept-Encoding': encoding}) as response:
+        response.raise_for_status()
+        for _ in response.iter_bytes():
+            pass
+        wire = response.num_bytes_downloaded
+    return time.perf_counter() - start, wire
+
+
+def bench_http(rows, seed):
+    encodings = ['identity', 'gzip'] + (['br'] if brotli is not None else [])
+    with tempfile.TemporaryDirectory(prefix='mail-bench-') as directory:
+        os.environ.update({
+            'CONTACT_DB': os.path.join(directory, 'contacts.db'),
+            'OUTBOX_DB': os.path.join(directory, 'outbox.db')
+        })
+        from fastapi.testclient import TestClient
+        from backend.main import app
+
+        path = os.path.join(directory, 'contacts.csv')
+        write_csv(path, rows, seed)
+        with TestClient(app) as client:
+            with open(path, 'rb') as f:
+                response = client.post('/api/upload-contacts', files={'file': ('contacts.csv', f, 'text/csv')})
+            response.raise_for_status()
+            list_id = response.json()['list_id']
+
+            def pages(encoding):
+                seconds = wire = 0
+                for offset in range(0, rows, 1000):
+                    s, w = fetch(client, f'/api/contact-lists/{list_id}/contacts?offset={offset}&limit=1000', encoding)
+                    seconds += s
+                    wire += w
+                return seconds, wire
+
+            print(f"\n{'endpoint':<22} {'encoding':<9} {'seconds':>8} {'wire MB':>8}")
+            for name, get in (
+                ('export ndjson', lambda e: fetch(client, f'/api/contact-lists/{list_id}/export', e)),
+                ('export columns', lambda e: fetch(client, f'/api/contact-lists/{list_id}/export?format=columns', e)),
+                ('pages of 1000', pages),
+            ):
+                for encoding in encodings:
+                    seconds, wire = get(encoding)
+                    print(f"{name:<22} {encoding:<9} {seconds:>8.3f} {wire / 1e6:>8.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-http', action='store_true', help='skip the end-to-end HTTP runs')
+    args = parser.parse_args(argv)
+
+    contacts = list(generate_contacts(args.rows, args.seed))
+    print(f"{args.rows:,} contacts\n")
+    bench_encoders(contacts)
+    bench_sizes(contacts)
+    if not args.no_http:
+        bench_http(args.rows, args.seed)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""Cold start of an API worker and import checks for the desktop app.
+
+Every run is a fresh interpreter, the way a new uvicorn worker starts: it
+imports backend.main and serves its first GET / and POST
+/api/preview-email, calling the ASGI app directly so no server or HTTP
+client is loaded. Reports the best and median of several runs and, with
+--importtime, the modules backend.main imports directly, by cumulative
+`python -X importtime` cost.
+
+Heavy dependencies are meant to load on first use (DEFERRED_MODULES):
+pandas and openpyxl with the first spreadsheet upload, jinja2 with the
+first page, multiprocessing with the first sharded campaign, and so on.
+The desktop app's startup imports (those at the top of ui.py) must not
+load the sending stack either.
+
+Exits with status 1 when the first responses take longer than --budget
+seconds or a deferred module is loaded at startup, so it can guard
+against startup regressions.
+
+Run from the repository root:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --repeat 10 --budget 0.5 --importtime
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Loaded on first use, never by importing backend.main
+DEFERRED_MODULES = (
+    'pandas', 'openpyxl', 'dns', 'jinja2', 'multiprocessing', 'cProfile', 'pstats',
+    'email.mime', 'backend.shards'
+)
+# Also kept out of the desktop app until its first send
+DESKTOP_DEFERRED_MODULES = DEFERRED_MODULES + (
+    'asyncio', 'smtplib', 'ssl', 'backend.smtp_pool', 'backend.background'
+)
+
+# Runs in the fresh interpreter; prints one JSON line of timings
+WORKER = '''
+import time
+started = time.perf_counter()
+import sys
+import backend.main
+imported = time.perf_counter()
+loaded = sorted(sys.modules)
+
+import asyncio
+
+async def call(method, path, body=b'', content_type=None):
+    headers = [(b'host', b'localhost')]
+    if content_type:
+        headers.append((b'content-type', content_type.encode()))
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': method, 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': b'', 'root_path': '', 'headers': headers,
+        'client': ('127.0.0.1', 50000), 'server': ('localhost', 80)
+    }
+    request = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    status = []
+
+    async def receive():
+        return request.pop() if request else {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await backend.main.app(scope, receive, send)
+    return status[0]
+
+async def serve():
+    index = await call('GET', '/')
+    index_done = time.perf_counter()
+    preview = await call(
+        'POST', '/api/preview-email',
+        b'subject_template=Hello+%7Bname%7D&body_template=Dear+%7Bname%7D&name=Ann',
+        'application/x-www-form-urlencoded'
+    )
+    return index, index_done, preview
+
+index, index_done, preview = asyncio.run(serve())
+done = time.perf_counter()
+
+import json
+print(json.dumps({
+    'import': imported - started, 'index': index_done - imported, 'preview': done - index_done,
+    'status': [index, preview], 'modules': loaded
+}), flush=True)
+'''
+
+DESKTOP = '''
+import time
+started = time.perf_counter()
+import sys
+for module in sys.argv[1:]:
+    __import__(module)
+imported = time.perf_counter()
+
+import json
+print(json.dumps({'import': imported - started, 'modules': sorted(sys.modules)}))
+'''
+
+
+def deferred_loaded(modules, deferred):
+    """The entries of `deferred` found among the loaded `modules`."""
+    return [
+        module for module in deferred
+        if any(name == module or name.startswith(module + '.') for name in modules)
+    ]
+
+
+def desktop_imports():
+    """backend modules ui.py imports at startup."""
+    with open(os.path.join(ROOT, 'ui.py')) as f:
+        tree = ast.parse(f.read())
+    return [
+        node.module for node in tree.body
+        if isinstance(node, ast.ImportFrom) and node.module and node.module.startswith('backend.')
+    ]
+
+
+def start_worker(env):
+    """Run WORKER in a fresh interpreter; its timings plus the wall time to its answer."""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-c', WORKER],
+        cwd=ROOT, env=env, stdout=subprocess.PIPE, text=True
+    )
+    line = process.stdout.readline()
+    wall = time.perf_counter() - start
+    process.communicate()
+    if process.returncode or not line:
+        raise RuntimeError(f"worker exited with status {process.returncode}")
+    result = json.loads(line)
+    result['wall'] = wall
+    return result
+
+
+def importtime_report(env, limit):
+    """backend.main's direct imports, by cumulative import time."""
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import backend.main'],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stderr
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((depth, int(own), int(cumulative), name.strip()))
+    total = next(cumulative for depth, _, cumulative, name in rows if name == 'backend.main')
+    # Children are printed before their parent, so collect the direct
+    # imports listed just above backend.main
+    children = []
+    for depth, own, cumulative, name in reversed(rows[:[row[3] for row in rows].index('backend.main')]):
+        if depth == 0:
+            break
+        if depth == 1:
+            children.append((cumulative, own, name))
+    print(f"\nimport backend.main: {total / 1000:.1f} ms\n")
+    print(f"{'module':<32} {'cumulative ms':>14} {'self ms':>8}")
+    for cumulative, own, name in sorted(children, reverse=True)[:limit]:
+        print(f"{name:<32} {cumulative / 1000:>14.1f} {own / 1000:>8.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=1.0,
+                        help='seconds from interpreter start to both first responses (best run)')
+    parser.add_argument('--importtime', action='store_true', help='report import times of backend.main')
+    parser.add_argument('--limit', type=int, default=15, help='modules in the import time report')
+    args = parser.parse_args(argv)
+
+    failures = []
+    with tempfile.TemporaryDirectory(prefix='mail-bench-') as directory:
+        env = {
+            **os.environ,
+            'PYTHONPATH': ROOT,
+            'CONTACT_DB': os.path.join(directory, 'contacts.db'),
+            'OUTBOX_DB': os.path.join(directory, 'outbox.db')
+        }
+        # Warm the bytecode cache so every measured run starts alike
+        start_worker(env)
+        runs = [start_worker(env) for _ in range(args.repeat)]
+
+        print(f"{args.repeat} fresh workers\n")
+        print(f"{'phase':<26} {'best ms':>8} {'median ms':>10}")
+        for name, key in (
+            ('import backend.main', 'import'),
+            ('first GET /', 'index'),
+            ('first preview-email', 'preview'),
+            ('start to both responses', 'wall'),
+        ):
+            values = [run[key] for run in runs]
+            print(f"{name:<26} {min(values) * 1000:>8.1f} {statistics.median(values) * 1000:>10.1f}")
+
+        if any(status != 200 for run in runs for status in run['status']):
+            failures.append(f"unexpected response status {runs[0]['status']}")
+        best = min(run['wall'] for run in runs)
+        if best > args.budget:
+            failures.append(f"first responses took {best:.3f}s, over the {args.budget:.3f}s budget")
+        loaded = deferred_loaded(runs[0]['modules'], DEFERRED_MODULES)
+        if loaded:
+            failures.append(f"importing backend.main loaded {', '.join(loaded)}")
+
+        modules = desktop_imports()
+        desktop = json.loads(subprocess.run(
+            [sys.executable, '-c', DESKTOP, *modules],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True
+        ).stdout)
+        print(f"{'desktop app imports':<26} {desktop['import'] * 1000:>8.1f}")
+        loaded = deferred_loaded(desktop['modules'], DESKTOP_DEFERRED_MODULES)
+        if loaded:
+            failures.append(f"the desktop app's startup imports loaded {', '.join(loaded)}")
+
+        if args.importtime:
+            importtime_report(env, args.limit)
+
+    for failure in failures:
+        print(f"\nFAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
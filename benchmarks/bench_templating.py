@@ -0,0 +1,84 @@
+"""Template rendering throughput.
+
+Before timing, checks that templates compiled for a list's columns keep
+brace text that isn't a placeholder (CSS, JSON, unknown names) literal,
+and exits with status 1 if one renders differently.
+
+Run from the repository root:
+    python -m benchmarks.bench_templating
+"""
+import sys
+import time
+
+from backend.templating import Template, compile_template
+
+SUBJECT = "Hello {name} - Regarding Your Role as {designation}"
+BODY = """Dear {name},
+
+I hope this email finds you well. I noticed your profile and your impressive work as {designation}. I would love to connect with you regarding some exciting opportunities.
+
+You can also find me on LinkedIn: {linkedin|my profile}
+
+Best regards,
+[Your name]"""
+
+CONTACT = {
+    'name': 'David Kolesnikow',
+    'email': 'david@example.com',
+    'designation': 'Founder & CEO',
+    'linkedin': 'https://www.linkedin.com/in/davidkolesnikow'
+}
+
+
+# (template, list columns, contact, expected rendering)
+LITERAL_CHECKS = [
+    ('<style>p {color: red}</style>Hi {name}', ['name'], {'name': 'Ann'},
+     '<style>p {color: red}</style>Hi Ann'),
+    ('Payload: {"id": 1, "tags": []}', ['name'], {'name': 'Ann'}, 'Payload: {"id": 1, "tags": []}'),
+    ('Hi {name}, see {unknown}', ['name'], {'name': 'Ann'}, 'Hi Ann, see {unknown}'),
+    ('Hi {Company} {designation}', ['Company'], {'Company': 'Acme'}, 'Hi Acme '),
+    ('Hi {first|there} {{name}}', ['name'], {'name': 'Ann'}, 'Hi there {name}'),
+]
+
+
+def check() -> int:
+    failures = 0
+    for source, columns, contact, expected in LITERAL_CHECKS:
+        rendered = compile_template(source, columns).render(contact)
+        if rendered != expected:
+            print(f"FAIL: {source!r} rendered {rendered!r}, expected {expected!r}")
+            failures += 1
+    return failures
+
+
+def naive_replace(subject, body, contact):
+    # The str.replace loop the send path used before compiled templates
+    for key in ('name', 'email', 'designation', 'linkedin'):
+        value = str(contact.get(key, ''))
+        subject = subject.replace('{' + key + '}', value)
+        body = body.replace('{' + key + '}', value)
+    return subject, body
+
+
+def bench(label, func, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {n / elapsed:>14,.0f} renders/sec")
+
+
+def main(n=1_000_000):
+    if check():
+        return 1
+    subject = Template(SUBJECT)
+    body = Template(BODY)
+    bench("compiled subject", lambda: subject.render(CONTACT), n)
+    bench("compiled body", lambda: body.render(CONTACT), n)
+    bench("compiled subject + body", lambda: (subject.render(CONTACT), body.render(CONTACT)), n)
+    bench("str.replace subject + body", lambda: naive_replace(SUBJECT, BODY, CONTACT), n // 4)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
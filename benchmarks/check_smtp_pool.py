@@ -0,0 +1,106 @@
+"""Fault-injection check for the pooled SMTP engine.
+
+Sends a campaign through SMTPConnectionPool to the fake SMTP server
+while it answers one transaction with a 421 and drops the connection in
+the middle of another, and checks that:
+
+- every message is delivered exactly once and reported as sent,
+- no connection carries more than max_messages_per_connection
+  transactions, so sessions are recycled on schedule.
+
+Runs once with PIPELINING advertised and once without, since the pool
+sends through different code paths. Exits with status 1 on failure.
+
+Run from the repository root:
+    python -m benchmarks.check_smtp_pool
+    python -m benchmarks.check_smtp_pool --messages 2000 --pool-size 8
+"""
+import argparse
+import asyncio
+import sys
+
+from backend.smtp_pool import OutgoingMessage, PoolConfig, SMTPConnectionPool
+from benchmarks.fake_smtp import FAULT_421, FAULT_DROP, FakeSMTPServer
+
+
+def recipient(index: int) -> str:
+    return f"user{index}@example.com"
+
+
+async def send_campaign(port: int, args) -> list:
+    config = PoolConfig(
+        host='127.0.0.1', port=port, security='none', size=args.pool_size,
+        max_messages_per_connection=args.max_per_connection, timeout=10.0
+    )
+    pool = SMTPConnectionPool(config)
+    await pool.start()
+    try:
+        messages = (
+            OutgoingMessage(
+                sender='sender@example.com',
+                recipients=[recipient(index)],
+                payload=f"Subject: Check {index}\r\n\r\nMessage {index}\r\n".encode(),
+                tag=index
+            )
+            for index in range(args.messages)
+        )
+        return await pool.send_all(messages)
+    finally:
+        await pool.close()
+
+
+def run_case(pipelining: bool, args) -> list:
+    """Failures found sending one campaign."""
+    faults = {args.messages // 3: FAULT_421, 2 * args.messages // 3: FAULT_DROP}
+    sink = FakeSMTPServer(pipelining=pipelining, faults=faults, track_recipients=True)
+    sink.start()
+    try:
+        results = asyncio.run(send_campaign(sink.port, args))
+    finally:
+        sink.stop()
+    stats = sink.stats
+
+    label = 'pipelined' if pipelining else 'sendmail'
+    print(f"{label:<10} {len(results)} results, {stats.connections} connections, "
+          f"{stats.faults} faults injected, at most {stats.max_per_connection} messages per connection")
+
+    failures = []
+    failed = [result for result in results if not result.ok]
+    if failed:
+        failures.append(f"{len(failed)} messages failed, first: {failed[0].email}: {failed[0].error}")
+    if sorted(result.tag for result in results) != list(range(args.messages)):
+        failures.append("results don't cover every message exactly once")
+    expected = {recipient(index) for index in range(args.messages)}
+    duplicated = [address for address, count in stats.delivered.items() if count > 1]
+    if duplicated:
+        failures.append(f"{len(duplicated)} recipients got the message more than once, e.g. {duplicated[0]}")
+    missing = expected - set(stats.delivered)
+    if missing:
+        failures.append(f"{len(missing)} recipients never got the message, e.g. {min(missing)}")
+    if stats.faults != len(faults):
+        failures.append(f"{stats.faults} of {len(faults)} faults were injected")
+    if stats.max_per_connection > args.max_per_connection:
+        failures.append(
+            f"a connection carried {stats.max_per_connection} messages, "
+            f"over max_messages_per_connection={args.max_per_connection}"
+        )
+    return [f"{label}: {failure}" for failure in failures]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--messages', type=int, default=600)
+    parser.add_argument('--pool-size', type=int, default=4)
+    parser.add_argument('--max-per-connection', type=int, default=25)
+    args = parser.parse_args(argv)
+
+    failures = []
+    for pipelining in (True, False):
+        failures += run_case(pipelining, args)
+    for failure in failures:
+        print(f"\nFAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""Synthetic contact lists for benchmarks.
+
+Files use the header names real uploads tend to have ("Name", "Email",
+"Designation", "LinkedIn ID") so the column mapping is exercised, and
+recipients are spread over a skewed set of domains like real lists.
+"""
+import csv
+import json
+import random
+from typing import Dict, Iterator
+
+HEADER = ['Name', 'Email', 'Designation', 'LinkedIn ID']
+
+# (domain, weight): a few big providers and a long tail
+DOMAINS = [('gmail.com', 40), ('outlook.com', 15), ('yahoo.com', 10), ('icloud.com', 5)] + [
+    (f'company{i}.example', 1) for i in range(30)
+]
+TITLES = ['Founder', 'CEO', 'CTO', 'Engineering Manager', 'Recruiter', 'Product Manager', 'Designer']
+
+FORMATS = ('csv', 'xlsx', 'json')
+
+
+def generate_contacts(rows: int, seed: int = 0) -> Iterator[Dict[str, str]]:
+    rng = random.Random(seed)
+    domains = [domain for domain, _ in DOMAINS]
+    weights = [weight for _, weight in DOMAINS]
+    for i in range(rows):
+        yield {
+            'Name': f'Contact {i}',
+            'Email': f'user{i}@{rng.choices(domains, weights)[0]}',
+            'Designation': rng.choice(TITLES),
+            'LinkedIn ID': f'https://www.linkedin.com/in/contact-{i}'
+        }
+
+
+def write_csv(path: str, rows: int, seed: int = 0):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=HEADER)
+        writer.writeheader()
+        writer.writerows(generate_contacts(rows, seed))
+
+
+def write_xlsx(path: str, rows: int, seed: int = 0):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(HEADER)
+    for contact in generate_contacts(rows, seed):
+        sheet.append([contact[column] for column in HEADER])
+    workbook.save(path)
+
+
+def write_json(path: str, rows: int, seed: int = 0):
+    # Streamed out so a 1M-row file is never held in memory
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for i, contact in enumerate(generate_contacts(rows, seed)):
+            f.write(',\n' if i else '\n')
+            f.write(json.dumps(contact))
+        f.write('\n]\n')
+
+
+WRITERS = {'csv': write_csv, 'xlsx': write_xlsx, 'json': write_json}
+
+
+def write_contacts(path: str, fmt: str, rows: int, seed: int = 0):
+    WRITERS[fmt](path, rows, seed)
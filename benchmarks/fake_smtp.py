@@ -0,0 +1,242 @@
+"""In-process fake SMTP server for benchmarks.
+
+Accepts everything it is sent (AUTH included) and throws it away, with
+optional per-message latency and random recipient failures. It runs its
+own event loop in a background thread so the code under test can use
+the caller's loop freely.
+
+    sink = FakeSMTPServer(latency=0.005, fail_rate=0.01)
+    sink.start()
+    ... send to 127.0.0.1:sink.port ...
+    sink.stop()
+    print(sink.stats.summary())
+
+`faults` injects session failures by transaction (MAIL FROM count,
+starting at 1): FAULT_421 answers that MAIL FROM with a 421 and closes
+the connection, FAULT_DROP reads the message and closes the connection
+without acknowledging it. Neither counts as delivered. With
+`track_recipients`, stats.delivered counts acknowledged deliveries per
+address.
+"""
+import asyncio
+import random
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+FAULT_421 = '421'
+FAULT_DROP = 'drop'
+
+_ADDRESS_RE = re.compile(rb'<([^>]*)>')
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class SinkStats:
+    def __init__(self):
+        self.connections = 0
+        self.transactions = 0
+        self.recipients = 0
+        self.refused_permanent = 0
+        self.refused_temporary = 0
+        self.bytes = 0
+        self.faults = 0
+        # Most transactions acknowledged on one connection
+        self.max_per_connection = 0
+        # Acknowledged deliveries per address, with track_recipients
+        self.delivered: Counter = Counter()
+        # Seconds from MAIL FROM to the final reply after DATA
+        self.latencies: List[float] = []
+
+    def summary(self) -> Dict:
+        return {
+            'connections': self.connections,
+            'transactions': self.transactions,
+            'recipients': self.recipients,
+            'refused_permanent': self.refused_permanent,
+            'refused_temporary': self.refused_temporary,
+            'bytes': self.bytes,
+            'faults': self.faults,
+            'max_per_connection': self.max_per_connection,
+            'latency_p50': percentile(self.latencies, 0.50),
+            'latency_p99': percentile(self.latencies, 0.99)
+        }
+
+
+class FakeSMTPServer:
+    def __init__(
+        self,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        latency: float = 0.0,
+        fail_rate: float = 0.0,
+        temp_fail_rate: float = 0.0,
+        pipelining: bool = True,
+        seed: Optional[int] = None,
+        faults: Optional[Dict[int, str]] = None,
+        track_recipients: bool = False
+    ):
+        self.host = host
+        self.port = port
+        # Delay before acknowledging each message, modelling server-side processing
+        self.latency = latency
+        # Share of RCPT TO answered 550 / 451
+        self.fail_rate = fail_rate
+        self.temp_fail_rate = temp_fail_rate
+        self.pipelining = pipelining
+        self.faults = dict(faults or {})
+        self.track_recipients = track_recipients
+        self.stats = SinkStats()
+        self._mails = 0
+        self._random = random.Random(seed)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port)
+            )
+            self.port = self._server.sockets[0].getsockname()[1]
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name='fake-smtp', daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def stop(self):
+        if self._loop is None:
+            return
+
+        async def shutdown():
+            self._server.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
+
+    def reset_stats(self):
+        self.stats = SinkStats()
+
+    def _ehlo_lines(self) -> List[str]:
+        lines = ['250-fake-smtp', '250-SIZE 104857600', '250-8BITMIME', '250-AUTH PLAIN LOGIN']
+        if self.pipelining:
+            lines.append('250-PIPELINING')
+        lines.append('250 HELP')
+        return lines
+
+    def _rcpt_reply(self) -> bytes:
+        roll = self._random.random()
+        if roll < self.fail_rate:
+            self.stats.refused_permanent += 1
+            return b'550 5.1.1 No such user\r\n'
+        if roll < self.fail_rate + self.temp_fail_rate:
+            self.stats.refused_temporary += 1
+            return b'451 4.7.1 Try again later\r\n'
+        return b''
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        stats = self.stats
+        stats.connections += 1
+        writer.write(b'220 fake-smtp ESMTP\r\n')
+        started = None
+        accepted = 0
+        recipients: List[bytes] = []
+        transactions = 0
+        fault = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                verb = line[:4].upper()
+                if verb == b'EHLO':
+                    writer.write(''.join(f'{reply}\r\n' for reply in self._ehlo_lines()).encode())
+                elif verb == b'HELO':
+                    writer.write(b'250 fake-smtp\r\n')
+                elif verb == b'AUTH':
+                    if line.split()[1:2] == [b'LOGIN']:
+                        # Username and password prompts
+                        for _ in range(2 - len(line.split()[2:])):
+                            writer.write(b'334 \r\n')
+                            await reader.readline()
+                    writer.write(b'235 2.7.0 Authentication successful\r\n')
+                elif verb == b'MAIL':
+                    started = time.perf_counter()
+                    accepted = 0
+                    recipients = []
+                    self._mails += 1
+                    fault = self.faults.pop(self._mails, None)
+                    if fault == FAULT_421:
+                        self.stats.faults += 1
+                        writer.write(b'421 4.3.2 Service shutting down, closing connection\r\n')
+                        await writer.drain()
+                        break
+                    writer.write(b'250 2.1.0 OK\r\n')
+                elif verb == b'RCPT':
+                    refusal = self._rcpt_reply()
+                    if refusal:
+                        writer.write(refusal)
+                    else:
+                        accepted += 1
+                        if self.track_recipients:
+                            address = _ADDRESS_RE.search(line)
+                            recipients.append(address.group(1) if address else line[8:].strip())
+                        writer.write(b'250 2.1.5 OK\r\n')
+                elif verb == b'DATA':
+                    if not accepted:
+                        writer.write(b'554 5.5.1 No valid recipients\r\n')
+                        continue
+                    writer.write(b'354 End data with <CR><LF>.<CR><LF>\r\n')
+                    await writer.drain()
+                    size = 0
+                    while True:
+                        data = await reader.readline()
+                        if not data or data == b'.\r\n':
+                            break
+                        size += len(data)
+                    if fault == FAULT_DROP:
+                        self.stats.faults += 1
+                        break
+                    if self.latency:
+                        await asyncio.sleep(self.latency)
+                    stats = self.stats
+                    stats.transactions += 1
+                    stats.recipients += accepted
+                    stats.bytes += size
+                    stats.latencies.append(time.perf_counter() - started)
+                    transactions += 1
+                    stats.max_per_connection = max(stats.max_per_connection, transactions)
+                    stats.delivered.update(address.decode() for address in recipients)
+                    accepted = 0
+                    recipients = []
+                    writer.write(b'250 2.0.0 Queued\r\n')
+                elif verb in (b'RSET', b'NOOP'):
+                    accepted = 0
+                    recipients = []
+                    writer.write(b'250 2.0.0 OK\r\n')
+                elif verb == b'QUIT':
+                    writer.write(b'221 2.0.0 Bye\r\n')
+                    await writer.drain()
+                    break
+                else:
+                    writer.write(b'502 5.5.2 Command not recognized\r\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
@@ -1,4 +1,6 @@
 // Global variables
+// Uploaded contact list handle ({list_id, total, columns}) and its preview rows
+let contactList = null;
 let contacts = [];
 let emailConfig = {
     sender_email: '',
@@ -11,15 +13,38 @@ let emailConfig = {
 const API = {
     UPLOAD_CONTACTS: '/api/upload-contacts',
     PREVIEW_EMAIL: '/api/preview-email',
-    SEND_EMAILS: '/api/send-emails'
+    SEND_EMAILS: '/api/send-emails',
+    JOBS: '/api/jobs',
+    CONTACT_LISTS: '/api/contact-lists'
 };
 
+// Rows fetched per request for the contacts table; only the rows in view
+// are rendered and pages are loaded as they scroll into view
+const PREVIEW_PAGE_SIZE = 100;
+// Browsers cap element heights, so very long lists scroll proportionally
+const MAX_SCROLL_HEIGHT = 1000000;
+const SEARCH_DEBOUNCE = 250;
+let contactView = null;
+let contactRowHeight = 30;
+let renderScheduled = false;
+let searchTimer = null;
+
+// How often to poll a running campaign (ms)
+const JOB_POLL_INTERVAL = 1000;
+
+// Campaign job currently being tracked
+let currentJobId = null;
+
 // DOM Elements
 const elements = {
     configForm: document.getElementById('configForm'),
     contactsForm: document.getElementById('contactsForm'),
     contactsFile: document.getElementById('contactsFile'),
     contactsPreview: document.getElementById('contactsPreview'),
+    contactsViewport: document.getElementById('contactsViewport'),
+    contactsSpacer: document.getElementById('contactsSpacer'),
+    contactsHead: document.getElementById('contactsHead'),
+    contactsSearch: document.getElementById('contactsSearch'),
     previewTable: document.getElementById('previewTable'),
     previewBtn: document.getElementById('previewBtn'),
     sendBtn: document.getElementById('sendBtn'),
@@ -40,6 +65,9 @@ document.addEventListener('DOMContentLoaded', () => {
     elements.contactsFile.addEventListener('change', handleFileSelect);
     elements.previewBtn.addEventListener('click', handlePreview);
     elements.sendBtn.addEventListener('click', handleSendEmails);
+    elements.contactsViewport.addEventListener('scroll', scheduleContactsRender);
+    elements.contactsSearch.addEventListener('input', handleContactsSearch);
+    window.addEventListener('resize', scheduleContactsRender);
 
     // Form validation
     const forms = document.querySelectorAll('.needs-validation');
@@ -90,17 +118,18 @@ async function handleFileSelect(input) {
             throw new Error(error.detail || 'Upload failed');
         }
 
-        contacts = await response.json();
-        console.log('Contacts received:', contacts); // Debug log
+        const result = await response.json();
         
         // Validate contacts data
-        if (!Array.isArray(contacts) || contacts.length === 0) {
+        if (!result.list_id || result.total === 0) {
             throw new Error('No valid contacts found in the file');
         }
 
-        displayContactsPreview(contacts);
+        contactList = result;
+        contacts = result.preview;
+        openContactView(result);
         hideLoading();
-        showSuccess(`Successfully loaded ${contacts.length} contacts`);
+        showSuccess(`Successfully loaded ${result.total} contacts`);
     } catch (error) {
         hideLoading();
         showError('Failed to upload contacts file: ' + error.message);
@@ -110,27 +139,171 @@ async function handleFileSelect(input) {
 
 // Handle attachment file select
 function handleAttachmentSelect(input) {
-    const file = input.files[0];
-    if (file) {
-        elements.selectedAttachmentName.textContent = file.name;
+    if (input.files.length > 0) {
+        elements.selectedAttachmentName.textContent = Array.from(input.files).map(file => file.name).join(', ');
     }
 }
 
-// Display contacts preview
-function displayContactsPreview(contacts) {
-    const previewTable = elements.contactsPreview;
-    previewTable.innerHTML = ''; // Clear existing content
+// Show an uploaded list in the virtualized contacts table
+function openContactView(list) {
+    contactView = {
+        listId: list.list_id,
+        columns: list.columns.length ? list.columns : ['name', 'designation', 'linkedin', 'email'],
+        query: '',
+        filters: {},
+        total: list.total,
+        matched: list.total,
+        pages: new Map(),
+        pending: new Set(),
+        generation: 0
+    };
+    // The upload response already carries the first rows
+    contactView.pages.set(0, list.preview.slice(0, PREVIEW_PAGE_SIZE));
+    elements.contactsSearch.value = '';
+    elements.contactsSearch.disabled = false;
+    renderContactsHead();
+    elements.contactsViewport.scrollTop = 0;
+    renderContacts();
+}
+
+// Column headings plus a filter box per column
+function renderContactsHead() {
+    const head = elements.contactsHead;
+    head.innerHTML = '';
+    const titles = document.createElement('tr');
+    const filters = document.createElement('tr');
+    contactView.columns.forEach(column => {
+        const th = document.createElement('th');
+        th.textContent = column;
+        titles.appendChild(th);
+
+        const cell = document.createElement('th');
+        const input = document.createElement('input');
+        input.type = 'search';
+        input.className = 'form-control form-control-sm';
+        input.placeholder = 'Filter';
+        input.addEventListener('input', () => {
+            contactView.filters[column] = input.value.trim();
+            handleContactsSearch();
+        });
+        cell.appendChild(input);
+        filters.appendChild(cell);
+    });
+    head.appendChild(titles);
+    head.appendChild(filters);
+}
+
+// Re-query the list shortly after the search or a filter stops changing
+function handleContactsSearch() {
+    if (!contactView) return;
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(() => {
+        contactView.query = elements.contactsSearch.value.trim();
+        contactView.pages = new Map();
+        contactView.pending = new Set();
+        contactView.generation += 1;
+        elements.contactsViewport.scrollTop = 0;
+        fetchContactsPage(0);
+    }, SEARCH_DEBOUNCE);
+}
+
+function scheduleContactsRender() {
+    if (renderScheduled || !contactView) return;
+    renderScheduled = true;
+    requestAnimationFrame(() => {
+        renderScheduled = false;
+        renderContacts();
+    });
+}
 
-    contacts.forEach(contact => {
+// Render the rows in view, fetching any page that isn't loaded yet
+function renderContacts() {
+    const view = contactView;
+    const viewport = elements.contactsViewport;
+    const table = elements.contactsPreview.parentElement;
+    const headHeight = elements.contactsHead.getBoundingClientRect().height;
+    const visible = Math.max(1, Math.ceil((viewport.clientHeight - headHeight) / contactRowHeight));
+
+    elements.contactsSpacer.style.height =
+        `${Math.min(view.matched * contactRowHeight + headHeight, MAX_SCROLL_HEIGHT)}px`;
+    const scrollable = viewport.scrollHeight - viewport.clientHeight;
+    const lastFirst = Math.max(0, view.matched - visible);
+    const first = scrollable > 0 ? Math.round(viewport.scrollTop / scrollable * lastFirst) : 0;
+    const end = Math.min(first + visible, view.matched);
+    // The table stays in view and its rows are swapped as the list scrolls
+    table.style.top = `${viewport.scrollTop}px`;
+
+    const body = elements.contactsPreview;
+    body.innerHTML = '';
+    for (let index = first; index < end; index++) {
+        const page = Math.floor(index / PREVIEW_PAGE_SIZE);
+        const rows = view.pages.get(page);
+        if (!rows) {
+            fetchContactsPage(page);
+        }
+        const contact = rows ? rows[index - page * PREVIEW_PAGE_SIZE] : null;
         const row = document.createElement('tr');
-        row.innerHTML = `
-            <td>${contact.name || '-'}</td>
-            <td>${contact.designation || '-'}</td>
-            <td>${contact.linkedin || '-'}</td>
-            <td>${contact.email || '-'}</td>
-        `;
-        previewTable.appendChild(row);
+        view.columns.forEach(column => {
+            const cell = document.createElement('td');
+            const value = contact ? contact[column] : null;
+            if (!contact) {
+                cell.textContent = '…';
+            } else {
+                cell.textContent = value === undefined || value === null || value === '' ? '-' : value;
+            }
+            cell.title = cell.textContent;
+            row.appendChild(cell);
+        });
+        body.appendChild(row);
+    }
+    if (body.rows.length) {
+        contactRowHeight = body.rows[0].getBoundingClientRect().height || contactRowHeight;
+    }
+
+    const filtered = view.matched !== view.total ? ` (filtered from ${view.total})` : '';
+    document.getElementById('previewPageInfo').textContent = view.matched
+        ? `Rows ${first + 1}-${end} of ${view.matched}${filtered}`
+        : `No matching contacts${filtered}`;
+}
+
+// Load one page of matches into the cache and re-render
+async function fetchContactsPage(page) {
+    const view = contactView;
+    if (view.pending.has(page)) return;
+    view.pending.add(page);
+    const generation = view.generation;
+
+    const params = new URLSearchParams({
+        offset: page * PREVIEW_PAGE_SIZE,
+        limit: PREVIEW_PAGE_SIZE
     });
+    if (view.query) {
+        params.set('q', view.query);
+    }
+    const filters = Object.fromEntries(Object.entries(view.filters).filter(([, value]) => value));
+    if (Object.keys(filters).length) {
+        params.set('filters', JSON.stringify(filters));
+    }
+
+    try {
+        const response = await fetch(`${API.CONTACT_LISTS}/${view.listId}/contacts?${params}`);
+        const result = await response.json();
+        if (!response.ok) {
+            throw new Error(result.detail || 'Failed to load contacts');
+        }
+        // Drop answers to a search that has since changed
+        if (contactView !== view || view.generation !== generation) return;
+        view.matched = result.matched;
+        view.pages.set(page, result.contacts);
+        renderContacts();
+    } catch (error) {
+        showError('Failed to load contacts: ' + error.message);
+        console.error('Error:', error);
+    } finally {
+        if (view.generation === generation) {
+            view.pending.delete(page);
+        }
+    }
 }
 
 // Update email configuration
@@ -152,54 +325,178 @@ async function handleSendEmails() {
         return;
     }
 
-    if (!contacts || contacts.length === 0) {
+    if (!contactList) {
         showError('Please upload contacts file first');
         return;
     }
 
     const formData = new FormData();
     formData.append('config', JSON.stringify(emailConfig));
-    formData.append('contacts', JSON.stringify(contacts));
+    formData.append('list_id', contactList.list_id);
 
-    // Add attachment if present
-    const attachment = document.getElementById('attachment').files[0];
-    if (attachment) {
-        formData.append('attachment', attachment);
-    }
+    // Add attachments if present
+    Array.from(document.getElementById('attachment').files).forEach(file => {
+        formData.append('attachments', file);
+    });
 
     // Show progress modal
+    document.getElementById('latestFailures').innerHTML = '';
     const progressModal = new bootstrap.Modal(document.getElementById('progressModal'));
     progressModal.show();
     updateProgress(0, 'Preparing to send emails...');
 
     try {
-        const response = await fetch('/api/send-emails', {
+        const response = await fetch(API.SEND_EMAILS, {
             method: 'POST',
             body: formData
         });
 
-        const result = await response.json();
+        const job = await response.json();
 
         if (!response.ok) {
-            throw new Error(result.detail || 'Failed to send emails');
+            throw new Error(job.detail || 'Failed to send emails');
+        }
+
+        currentJobId = job.job_id;
+        updateProgress(0, 'Campaign queued...');
+        const result = await followJob(job.job_id);
+        currentJobId = null;
+
+        if (result.status === 'failed') {
+            throw new Error(result.error || 'Campaign failed');
         }
 
         updateProgress(100, `Sent ${result.success} out of ${result.total} emails successfully!`);
         
         setTimeout(() => {
             progressModal.hide();
-            showSuccess(`Email campaign completed! Successfully sent: ${result.success}/${result.total} emails`);
+            const verb = result.status === 'cancelled' ? 'cancelled' : 'completed';
+            showSuccess(`Email campaign ${verb}! Successfully sent: ${result.success}/${result.total} emails`);
             if (result.failed > 0) {
                 showFailedEmails(result.failed_details);
             }
         }, 1000);
     } catch (error) {
+        currentJobId = null;
         progressModal.hide();
         showError('Failed to send emails: ' + error.message);
         console.error('Error:', error);
     }
 }
 
+// Follow a campaign job over Server-Sent Events, falling back to polling
+async function followJob(jobId) {
+    if (!window.EventSource) {
+        return waitForJob(jobId);
+    }
+
+    const streamed = await new Promise(resolve => {
+        const source = new EventSource(`${API.JOBS}/${jobId}/events`);
+        const onProgress = event => showJobProgress(JSON.parse(event.data));
+
+        source.addEventListener('progress', onProgress);
+        source.addEventListener('status', onProgress);
+        source.addEventListener('validation', onProgress);
+        source.addEventListener('batch', event => {
+            const batch = JSON.parse(event.data);
+            showJobProgress(batch);
+            showLatestFailures(batch.failures);
+        });
+        source.addEventListener('done', () => {
+            source.close();
+            resolve(true);
+        });
+        source.onerror = () => {
+            source.close();
+            resolve(false);
+        };
+    });
+
+    if (!streamed) {
+        return waitForJob(jobId);
+    }
+    const response = await fetch(`${API.JOBS}/${jobId}/result`);
+    return await response.json();
+}
+
+// Poll a campaign job until it finishes, then fetch its full result
+async function waitForJob(jobId) {
+    const finished = ['completed', 'cancelled', 'failed'];
+    while (true) {
+        const response = await fetch(`${API.JOBS}/${jobId}`);
+        const progress = await response.json();
+        if (!response.ok) {
+            throw new Error(progress.detail || 'Failed to get campaign status');
+        }
+
+        showJobProgress(progress);
+        if (finished.includes(progress.status)) {
+            break;
+        }
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL));
+    }
+
+    const response = await fetch(`${API.JOBS}/${jobId}/result`);
+    return await response.json();
+}
+
+// Render job progress counters in the progress modal
+function showJobProgress(progress) {
+    const done = progress.sent + progress.failed + (progress.rejected || 0);
+    const percent = progress.total ? Math.round(done / progress.total * 100) : 100;
+    let message = `${progress.status}: ${progress.sent} sent, ${progress.failed} failed, ${progress.pending} pending`;
+    if (progress.rejected) {
+        message += `, ${progress.rejected} rejected before sending`;
+    }
+    if (progress.deferred) {
+        message += `, ${progress.deferred} waiting to retry`;
+    }
+    if (progress.throughput) {
+        message += ` (${progress.throughput} msg/s`;
+        if (progress.eta_seconds !== null) {
+            message += `, ~${Math.ceil(progress.eta_seconds)}s left`;
+        }
+        message += ')';
+    }
+    if (progress.failed > 0) {
+        const attempted = progress.sent + progress.failed;
+        message += ` - failure rate ${(progress.failed / attempted * 100).toFixed(1)}%`;
+    }
+    updateProgress(percent, message);
+    document.getElementById('pauseJobBtn').textContent = progress.status === 'paused' ? 'Resume' : 'Pause';
+}
+
+// Show the most recent delivery failures while a campaign runs
+function showLatestFailures(failures) {
+    if (!failures || failures.length === 0) return;
+    const list = document.getElementById('latestFailures');
+    failures.slice(-5).forEach(detail => {
+        const item = document.createElement('li');
+        item.textContent = `${detail.email}: ${detail.error}`;
+        list.prepend(item);
+    });
+    while (list.children.length > 5) {
+        list.removeChild(list.lastChild);
+    }
+}
+
+// Pause/resume or cancel the running campaign
+async function controlJob(action) {
+    if (!currentJobId) return;
+    if (action === 'toggle') {
+        const paused = document.getElementById('pauseJobBtn').textContent === 'Resume';
+        action = paused ? 'resume' : 'pause';
+    }
+
+    const response = await fetch(`${API.JOBS}/${currentJobId}/${action}`, { method: 'POST' });
+    const progress = await response.json();
+    if (!response.ok) {
+        showError(progress.detail || `Failed to ${action} campaign`);
+        return;
+    }
+    showJobProgress(progress);
+}
+
 // Validate email configuration
 function validateEmailConfig() {
     if (!emailConfig.sender_email) {
@@ -251,9 +548,15 @@ async function handlePreview() {
         const formData = new FormData();
         formData.append('subject_template', emailConfig.subject_template);
         formData.append('body_template', emailConfig.body_template);
-        formData.append('name', 'John Doe');
-        formData.append('designation', 'Software Engineer');
-        formData.append('linkedin', 'linkedin.com/johndoe');
+        // Preview with the first uploaded contact when there is one,
+        // otherwise with sample values
+        if (contacts.length > 0) {
+            formData.append('contact', JSON.stringify(contacts[0]));
+        } else {
+            formData.append('name', 'John Doe');
+            formData.append('designation', 'Software Engineer');
+            formData.append('linkedin', 'linkedin.com/johndoe');
+        }
 
         const response = await fetch(API.PREVIEW_EMAIL, {
             method: 'POST',
@@ -1,14 +1,116 @@
-import pandas as pd
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from email.mime.base import MIMEBase
-from email import encoders
 import os
-import json
-from ttkthemes import ThemedTk
+import queue
+import shutil
+import tempfile
+import threading
+
+from backend.attachments import EncodedAttachment
+from backend.contact_store import ContactListStore
+from backend.ingest import parse_upload
+from backend.providers import load_providers
+from backend.templating import compile_template
+
+# SMTP relay from SMTP_PROVIDER / SMTP_HOST etc. (Hostinger by default)
+providers = load_providers()
+
+# How often the Tk thread drains delivery results (ms), and at most how many per pass
+SEND_POLL_INTERVAL = 100
+SEND_POLL_BATCH = 500
+
+class VirtualTreeview(ttk.Frame):
+    """A Treeview holding only the rows in view.
+
+    Rows are read on demand through `fetch(offset, limit)` and the
+    scrollbar is driven by hand, so showing and scrolling a million-row
+    list costs the same as a ten-row one.
+    """
+
+    PAGE_SIZE = 200
+    MAX_CACHED_PAGES = 50
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.tree = ttk.Treeview(self, show="headings", height=5)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.on_scrollbar)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.total = 0
+        self.offset = 0
+        self.fetch = None
+        self.pages = {}
+
+        self.tree.bind("<Configure>", lambda event: self.refresh())
+        # The tree never scrolls itself; wheel events move the window instead
+        self.tree.bind("<MouseWheel>", lambda event: self.scroll_by(-1 if event.delta > 0 else 1, "units"))
+        self.tree.bind("<Button-4>", lambda event: self.scroll_by(-1, "units"))
+        self.tree.bind("<Button-5>", lambda event: self.scroll_by(1, "units"))
+        self.tree.bind("<Prior>", lambda event: self.scroll_by(-1, "pages"))
+        self.tree.bind("<Next>", lambda event: self.scroll_by(1, "pages"))
+
+    def set_source(self, columns, total, fetch):
+        """Show `total` rows of `columns`, read with fetch(offset, limit) -> [values]."""
+        self.tree["columns"] = columns
+        for col in columns:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=100)
+        self.total = total
+        self.fetch = fetch
+        self.pages = {}
+        self.offset = 0
+        self.refresh()
+
+    def visible_rows(self):
+        rowheight = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        # Leave room for the heading row
+        return max(1, (self.tree.winfo_height() - rowheight - 4) // rowheight)
+
+    def on_scrollbar(self, action, *args):
+        if action == "moveto":
+            self.scroll_to(round(float(args[0]) * self.total))
+        elif action == "scroll":
+            self.scroll_by(int(args[0]), args[1])
+
+    def scroll_by(self, amount, what):
+        step = self.visible_rows() if what == "pages" else 3
+        self.scroll_to(self.offset + amount * step)
+        return "break"
+
+    def scroll_to(self, offset):
+        offset = max(0, min(offset, self.total - self.visible_rows()))
+        if offset != self.offset:
+            self.offset = offset
+            self.refresh()
+
+    def rows(self, offset, count):
+        rows = []
+        while count > 0 and offset < self.total:
+            page, start = divmod(offset, self.PAGE_SIZE)
+            if page not in self.pages:
+                if len(self.pages) >= self.MAX_CACHED_PAGES:
+                    self.pages.clear()
+                self.pages[page] = self.fetch(page * self.PAGE_SIZE, self.PAGE_SIZE)
+            chunk = self.pages[page][start:start + count]
+            if not chunk:
+                break
+            rows.extend(chunk)
+            offset += len(chunk)
+            count -= len(chunk)
+        return rows
+
+    def refresh(self):
+        self.tree.delete(*self.tree.get_children())
+        if self.fetch is None:
+            return
+        count = self.visible_rows()
+        for values in self.rows(self.offset, count):
+            self.tree.insert("", "end", values=values)
+        if self.total:
+            self.scrollbar.set(self.offset / self.total, min(1.0, (self.offset + count) / self.total))
+        else:
+            self.scrollbar.set(0, 1)
 
 class EmailSenderApp:
     def __init__(self, root):
@@ -21,6 +123,19 @@ class EmailSenderApp:
         self.attachment_path = None
         self.preview_window = None
         
+        # Contact files are parsed into a scratch SQLite store, so the table
+        # and the sender read pages instead of holding the whole file
+        self.store_dir = tempfile.mkdtemp(prefix="email-sender-")
+        self.contact_store = ContactListStore(os.path.join(self.store_dir, "contacts.db"))
+        self.contact_list = None
+        self.search_after = None
+        
+        # Background delivery of the current list, if any
+        self.sender = None
+        # A few authenticated sessions are shared by the whole list and kept
+        # warm between runs; created with the first send
+        self.smtp_sessions = None
+        
         self.setup_styles()
         self.create_ui()
         
@@ -125,16 +240,33 @@ Best regards,
         preview_frame = ttk.LabelFrame(bottom_frame, text="Contact Data Preview", padding="10")
         preview_frame.pack(fill=tk.BOTH, expand=True)
         
-        # Create Treeview with scrollbar
-        tree_frame = ttk.Frame(preview_frame)
-        tree_frame.pack(fill=tk.BOTH, expand=True)
+        # Search over every column or just one
+        search_frame = ttk.Frame(preview_frame)
+        search_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(search_frame, text="Search:").pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add("write", lambda *args: self.schedule_search())
+        ttk.Entry(search_frame, textvariable=self.search_var).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.search_column = ttk.Combobox(search_frame, values=["All columns"], state="readonly", width=20)
+        self.search_column.current(0)
+        self.search_column.bind("<<ComboboxSelected>>", lambda event: self.apply_search())
+        self.search_column.pack(side=tk.LEFT)
+        self.table_info = ttk.Label(search_frame, text="")
+        self.table_info.pack(side=tk.LEFT, padx=(10, 0))
         
-        self.data_table = ttk.Treeview(tree_frame, show="headings", height=5)
-        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.data_table.yview)
-        self.data_table.configure(yscrollcommand=scrollbar.set)
+        # Virtualized table: only the visible rows are ever inserted
+        self.data_table = VirtualTreeview(preview_frame)
+        self.data_table.pack(fill=tk.BOTH, expand=True)
         
-        self.data_table.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        # Delivery progress
+        progress_frame = ttk.Frame(bottom_frame)
+        progress_frame.pack(fill=tk.X, pady=(20, 0))
+        self.progress_bar = ttk.Progressbar(progress_frame, mode="determinate")
+        self.progress_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.cancel_button = ttk.Button(progress_frame, text="Cancel", command=self.cancel_sending, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=(10, 0))
+        self.progress_label = ttk.Label(bottom_frame, text="")
+        self.progress_label.pack(fill=tk.X, pady=(5, 0))
         
         # Send button
         self.send_button = ttk.Button(bottom_frame, text="Send Emails", command=self.send_emails, style="Accent.TButton")
@@ -165,50 +297,79 @@ Best regards,
             self.attachment_label.config(text=f"Attachment: {os.path.basename(self.attachment_path)}")
             
     def show_file_content(self):
-        try:
-            data = self.load_data()
-            self.show_data_table(data)
-        except Exception as e:
-            messagebox.showerror("Error", f"Error displaying file content: {e}")
-            
-    def load_data(self):
-        """Load email data from file."""
-        if not self.file_path:
+        # Parse the file off the Tk thread and show it when it is stored
+        self.table_info.config(text="Loading...")
+        result = {}
+        
+        def load():
+            try:
+                result["list"] = self.load_contacts(self.file_path)
+            except Exception as e:
+                result["error"] = e
+        
+        thread = threading.Thread(target=load, daemon=True)
+        thread.start()
+        self.wait_for_contacts(thread, result)
+        
+    def wait_for_contacts(self, thread, result):
+        if thread.is_alive():
+            self.root.after(100, self.wait_for_contacts, thread, result)
+            return
+        if "error" in result:
+            self.table_info.config(text="")
+            messagebox.showerror("Error", f"Error displaying file content: {result['error']}")
+            return
+        if self.contact_list is not None:
+            self.contact_store.delete(self.contact_list.id)
+        self.contact_list = result["list"]
+        self.search_column.config(values=["All columns"] + self.contact_list.columns)
+        self.search_column.current(0)
+        self.search_var.set("")
+        self.apply_search()
+        
+    def load_contacts(self, path):
+        """Stream a contact file into the scratch store (same parsing as uploads)."""
+        if not path:
             raise ValueError("Please select a file first")
+        with open(path, "rb") as f:
+            return self.contact_store.create(os.path.basename(path), parse_upload(path, f))
             
-        if self.file_path.endswith(".json"):
-            with open(self.file_path, 'r') as f:
-                return pd.DataFrame(json.load(f))
-        elif self.file_path.endswith(".csv"):
-            return pd.read_csv(self.file_path)
-        elif self.file_path.endswith((".xlsx", ".xls")):
-            return pd.read_excel(self.file_path)
-        else:
-            raise ValueError("Unsupported file format")
-            
-    def show_data_table(self, data):
-        # Clear existing items
-        for item in self.data_table.get_children():
-            self.data_table.delete(item)
-            
-        # Configure columns
-        self.data_table["columns"] = list(data.columns)
-        for col in data.columns:
-            self.data_table.heading(col, text=col)
-            self.data_table.column(col, width=100)
-            
-        # Add data
-        for idx, row in data.iterrows():
-            self.data_table.insert("", "end", values=list(row))
+    def schedule_search(self):
+        if self.search_after is not None:
+            self.root.after_cancel(self.search_after)
+        self.search_after = self.root.after(300, self.apply_search)
+        
+    def apply_search(self):
+        self.search_after = None
+        contact_list = self.contact_list
+        if contact_list is None:
+            return
+        text = self.search_var.get().strip()
+        column = self.search_column.get()
+        query, filters = (text, None) if column == "All columns" else (None, {column: text})
+        columns = contact_list.columns
+        
+        def fetch(offset, limit):
+            return [
+                [contact.get(col, "") for col in columns]
+                for _, contact in contact_list.search(offset, limit, query, filters)
+            ]
+        
+        matched = contact_list.count(query, filters)
+        self.data_table.set_source(columns, matched, fetch)
+        info = f"{matched:,} contacts"
+        if matched != contact_list.total:
+            info += f" of {contact_list.total:,}"
+        self.table_info.config(text=info)
             
     def show_preview(self):
-        if not self.file_path:
+        if self.contact_list is None:
             messagebox.showwarning("Warning", "Please select a data file first")
             return
             
         try:
-            data = self.load_data()
-            if len(data) == 0:
+            first = self.contact_list.head(1)
+            if not first:
                 messagebox.showwarning("Warning", "No data available for preview")
                 return
                 
@@ -222,18 +383,12 @@ Best regards,
                 preview_frame.pack(fill=tk.BOTH, expand=True)
                 
                 # Preview for first recipient
-                row = data.iloc[0]
-                subject = self.subject_text.get("1.0", tk.END).strip().format(
-                    name=row["Name"],
-                    designation=row["Desicnation"]
-                )
-                body = self.body_text.get("1.0", tk.END).strip().format(
-                    name=row["Name"],
-                    designation=row["Desicnation"]
-                )
+                contact = first[0]
+                subject = compile_template(self.subject_text.get("1.0", tk.END).strip(), self.contact_list.columns).render(contact)
+                body = compile_template(self.body_text.get("1.0", tk.END).strip(), self.contact_list.columns).render(contact)
                 
                 ttk.Label(preview_frame, text="Preview for first recipient:", style="Header.TLabel").pack(anchor=tk.W)
-                ttk.Label(preview_frame, text=f"To: {row['Email']}", style="Preview.TLabel").pack(anchor=tk.W, pady=(10, 5))
+                ttk.Label(preview_frame, text=f"To: {contact.get('email', '')}", style="Preview.TLabel").pack(anchor=tk.W, pady=(10, 5))
                 ttk.Label(preview_frame, text=f"Subject: {subject}", style="Preview.TLabel").pack(anchor=tk.W, pady=5)
                 ttk.Label(preview_frame, text="Body:", style="Preview.TLabel").pack(anchor=tk.W, pady=5)
                 
@@ -254,68 +409,110 @@ Best regards,
                 messagebox.showwarning("Warning", "Please enter email credentials")
                 return
                 
-            data = self.load_data()
-            total = len(data)
-            success = 0
+            if self.contact_list is None:
+                messagebox.showwarning("Warning", "Please select a data file first")
+                return
+            
+            # Parse templates and encode the attachment once for the whole list
+            subject_template = compile_template(self.subject_text.get("1.0", tk.END).strip(), self.contact_list.columns)
+            body_template = compile_template(self.body_text.get("1.0", tk.END).strip(), self.contact_list.columns)
+            attachments = [EncodedAttachment.from_path(self.attachment_path)] if self.attachment_path else []
             
-            for idx, row in data.iterrows():
-                try:
-                    subject = self.subject_text.get("1.0", tk.END).strip().format(
-                        name=row["Name"],
-                        designation=row["Desicnation"]
-                    )
-                    body = self.body_text.get("1.0", tk.END).strip().format(
-                        name=row["Name"],
-                        designation=row["Desicnation"]
-                    )
-                    
-                    self.send_single_email(
-                        sender_email,
-                        sender_password,
-                        row["Email"],
-                        subject,
-                        body
-                    )
-                    success += 1
-                    
-                except Exception as e:
-                    print(f"Error sending to {row['Email']}: {e}")
-                    
-            messagebox.showinfo("Complete", f"Sent {success} out of {total} emails successfully!")
+            # The sending stack (asyncio, smtplib, MIME) loads on first use
+            # rather than delaying the window
+            from backend.background import BackgroundSender
+            from backend.smtp_pool import SessionCache
+            if self.smtp_sessions is None:
+                self.smtp_sessions = SessionCache()
+
+            # Delivery runs on a worker thread; results come back through a queue
+            self.sender = BackgroundSender(
+                self.contact_list,
+                providers.resolve(None, sender_email),
+                sender_email,
+                sender_password,
+                subject_template,
+                body_template,
+                attachments,
+                sessions=self.smtp_sessions
+            )
+            self.sent = 0
+            self.failures = []
+            self.progress_bar.config(maximum=max(self.contact_list.total, 1), value=0)
+            self.progress_label.config(text="Connecting...")
+            self.send_button.config(state=tk.DISABLED)
+            self.cancel_button.config(state=tk.NORMAL)
+            self.sender.start()
+            self.root.after(SEND_POLL_INTERVAL, self.poll_sender)
             
         except Exception as e:
             messagebox.showerror("Error", f"Error sending emails: {e}")
             
-    def send_single_email(self, sender_email, sender_password, recipient_email, subject, body):
-        try:
-            server = smtplib.SMTP("smtp.hostinger.com", 587)
-            server.starttls()
-            server.login(sender_email, sender_password)
+    def cancel_sending(self):
+        if self.sender is not None:
+            self.sender.cancel()
+            self.cancel_button.config(state=tk.DISABLED)
+            self.progress_label.config(text="Cancelling...")
             
-            message = MIMEMultipart()
-            message["From"] = sender_email
-            message["To"] = recipient_email
-            message["Subject"] = subject
-            message.attach(MIMEText(body, "plain"))
-            
-            if self.attachment_path:
-                with open(self.attachment_path, "rb") as attachment:
-                    part = MIMEBase("application", "octet-stream")
-                    part.set_payload(attachment.read())
-                    encoders.encode_base64(part)
-                    part.add_header(
-                        "Content-Disposition",
-                        f"attachment; filename={os.path.basename(self.attachment_path)}",
-                    )
-                    message.attach(part)
-                    
-            server.sendmail(sender_email, recipient_email, message.as_string())
-            server.quit()
+    def poll_sender(self):
+        from backend.background import DONE, RESULT
+
+        sender = self.sender
+        total = self.contact_list.total
+        error = done = None
+        for _ in range(SEND_POLL_BATCH):
+            try:
+                kind, value = sender.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == RESULT:
+                if value.ok:
+                    self.sent += 1
+                else:
+                    self.failures.append(value)
+                    print(f"Error sending to {value.email}: {value.error}")
+            elif kind == DONE:
+                done, error = True, value
+        
+        attempted = self.sent + len(self.failures)
+        self.progress_bar.config(value=attempted)
+        if not sender.cancelled:
+            self.progress_label.config(text=f"{attempted:,} of {total:,} processed: {self.sent:,} sent, {len(self.failures):,} failed")
+        if not done:
+            self.root.after(SEND_POLL_INTERVAL, self.poll_sender)
+            return
+        
+        self.sender = None
+        self.send_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
+        summary = f"Sent {self.sent} out of {total} emails successfully!"
+        self.progress_label.config(text=summary)
+        if error:
+            messagebox.showerror("Error", f"Error sending emails: {error}")
+        elif sender.cancelled:
+            messagebox.showinfo("Cancelled", f"Sending cancelled. {summary}")
+        else:
+            messagebox.showinfo("Complete", summary)
             
-        except Exception as e:
-            raise Exception(f"Failed to send email: {str(e)}")
+    def close(self):
+        if self.sender is not None:
+            self.sender.cancel()
+            self.sender.join(timeout=5)
+        if self.smtp_sessions is not None:
+            self.smtp_sessions.close_all()
+        shutil.rmtree(self.store_dir, ignore_errors=True)
+
+def apply_theme(root):
+    # ttkthemes loads its Tcl theme packages on import and on set_theme,
+    # so it is applied once the window is already on screen
+    from ttkthemes import ThemedStyle
+    ThemedStyle(root).set_theme("arc")  # Using a modern theme
 
 if __name__ == "__main__":
-    root = ThemedTk(theme="arc")  # Using a modern theme
+    root = tk.Tk()
     app = EmailSenderApp(root)
-    root.mainloop()
+    root.after_idle(apply_theme, root)
+    try:
+        root.mainloop()
+    finally:
+        app.close()